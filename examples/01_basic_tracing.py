@@ -6,11 +6,15 @@ This example demonstrates:
 - Using the @observe() decorator for automatic tracing
 - Nested observations (spans within spans)
 - Manual trace updates
+- Low-overhead updates: cached client, deferred and lazily built payloads
+- Config-driven head sampling (langfuse.sampling in configs/*.yaml)
 """
 
 import os
 from dotenv import load_dotenv
-from langfuse import observe, get_client
+from langfuse import observe
+
+from tracing_utils import init_client, langfuse_client, lazy, traced, update_span, update_trace
 
 # Load environment variables
 load_dotenv()
@@ -24,8 +28,9 @@ def retrieve_context(query: str) -> str:
     # Simulate database lookup
     context = f"Context for '{query}': This is relevant information from our knowledge base."
 
-    # Update current span with metadata (v3 API)
-    langfuse = get_client()
+    # Update current span with metadata (v3 API); the client handle is
+    # looked up once per process instead of on every call
+    langfuse = langfuse_client()
     langfuse.update_current_span(
         metadata={"retrieval_method": "vector_search", "results_count": 3}
     )
@@ -33,7 +38,7 @@ def retrieve_context(query: str) -> str:
     return context
 
 
-@observe()
+@traced()
 def generate_response(query: str, context: str) -> str:
     """Simulate generating a response using an LLM."""
     print(f"Generating response for: {query}")
@@ -41,10 +46,10 @@ def generate_response(query: str, context: str) -> str:
     # Simulate LLM call
     response = f"Based on the context, here's the answer: {query} relates to our knowledge base."
 
-    # Update with generation metadata (v3 API)
-    langfuse = get_client()
-    langfuse.update_current_span(
-        input={"query": query, "context": context},
+    # Deferred update: applied once when the function returns, and the lazy
+    # payload is only built if this span is actually recorded
+    update_span(
+        input=lazy(lambda: {"query": query, "context": context}),
         output=response,
         metadata={
             "model": "gpt-4",
@@ -56,7 +61,7 @@ def generate_response(query: str, context: str) -> str:
     return response
 
 
-@observe()
+@traced()
 def rag_pipeline(user_query: str) -> dict:
     """
     Complete RAG pipeline with automatic nested tracing.
@@ -64,9 +69,8 @@ def rag_pipeline(user_query: str) -> dict:
     """
     print(f"\nProcessing query: {user_query}")
 
-    # Update current trace metadata (v3 pattern)
-    langfuse = get_client()
-    langfuse.update_current_trace(
+    # Update current trace metadata (deferred like update_span)
+    update_trace(
         user_id="user-123",
         session_id="session-456",
         tags=["rag", "production"],
@@ -97,6 +101,10 @@ def main():
     print("Langfuse Example 1: Basic Tracing")
     print("="*60)
 
+    # Create the shared client from configs/ (SDK settings, sampling,
+    # capture policy, PII masking) before anything else traces
+    init_client()
+
     # Example queries
     queries = [
         "What is Langfuse?",
@@ -115,7 +123,7 @@ def main():
     print("="*60 + "\n")
 
     # Important: Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
-    langfuse = get_client()
+    langfuse = langfuse_client()
     langfuse.shutdown()
 
 
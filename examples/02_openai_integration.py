@@ -19,6 +19,8 @@ load_dotenv()
 # This is the only change needed - everything else stays the same
 from langfuse.openai import openai
 
+from tracing_utils import init_client, langfuse_client
+
 def example_basic_completion():
     """Basic chat completion with automatic tracing."""
     print("\n" + "="*60)
@@ -170,6 +172,9 @@ def main():
     print("\nThis demonstrates the drop-in replacement for OpenAI SDK")
     print("All you need to change: from langfuse.openai import openai\n")
 
+    # Shared client configured from configs/ (see tracing_utils.init_client)
+    init_client()
+
     try:
         # Run examples
         example_basic_completion()
@@ -194,8 +199,7 @@ def main():
         print("Make sure OPENAI_API_KEY is set in your .env file\n")
 
     # Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
-    from langfuse import get_client
-    get_client().shutdown()
+    langfuse_client().shutdown()
 
 
 if __name__ == "__main__":
@@ -3,15 +3,24 @@ Example 3: Prompt Management with Langfuse
 
 This example demonstrates:
 - Creating and managing prompts
-- Fetching prompts by label
-- Dynamic template compilation
+- Fetching prompts by label (cached, see prompt_cache.py)
+- Dynamic template compilation (precompiled, see prompt_templates.py)
 - Linking prompts to traces
+- A/B testing prompt variants per user (prompts.ab_testing, see ab_router.py),
+  compared by latency, tokens and an LLM-judged quality score
 - Version control
 """
 
 import os
+import time
 from dotenv import load_dotenv
-from langfuse import Langfuse, observe
+from langfuse import observe
+
+import tail_sampling
+from ab_router import install_variant_router, variant_router
+from prompt_cache import get_prompt, get_prompt_cache
+from prompt_templates import compile_prompt
+from tracing_utils import init_client, langfuse_client, update_trace
 
 load_dotenv()
 
@@ -21,7 +30,7 @@ def create_prompts():
     print("Creating Prompts in Langfuse")
     print("="*60 + "\n")
     
-    langfuse = Langfuse()
+    langfuse = langfuse_client()
     
     # Create a text prompt
     try:
@@ -43,6 +52,27 @@ Provide a {{tone}} response that addresses their question.""",
         print("Created: customer-support-prompt")
     except Exception as e:
         print(f"Prompt may already exist: {e}")
+
+    # A second version of the same prompt for the A/B test's variant_b
+    try:
+        langfuse.create_prompt(
+            name="customer-support-prompt",
+            prompt="""You are a concise customer support agent for TechStore.
+
+Customer tier: {{tier}}
+Customer question: {{question}}
+
+Answer in at most three {{tone}} sentences.""",
+            labels=["variant-b"],
+            config={
+                "model": "gpt-4o-mini",
+                "temperature": 0.3,
+                "max_tokens": 150
+            }
+        )
+        print("Created: customer-support-prompt (variant-b)")
+    except Exception as e:
+        print(f"Prompt may already exist: {e}")
     
     # Create a chat prompt
     try:
@@ -73,18 +103,52 @@ Provide a {{tone}} response that addresses their question.""",
 
 
 @observe()
-def use_prompt_in_application(question: str, tier: str = "standard"):
+def evaluate_response(question: str, answer: str) -> float:
+    """LLM judge: does the answer address the question (1.0, 0.5 or 0.0)."""
+    from langfuse.openai import openai
+
+    response = openai.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": "Evaluate if the answer is relevant to the customer's question. Respond with RELEVANT, PARTIALLY_RELEVANT, or NOT_RELEVANT and a brief explanation."
+            },
+            {
+                "role": "user",
+                "content": f"Question: {question}\n\nAnswer: {answer}\n\nEvaluation:"
+            }
+        ],
+        temperature=0.1,
+        max_tokens=100
+    )
+    evaluation = response.choices[0].message.content
+    if "NOT_RELEVANT" in evaluation:
+        return 0.0
+    if "PARTIALLY_RELEVANT" in evaluation:
+        return 0.5
+    return 1.0 if "RELEVANT" in evaluation else 0.0
+
+
+@observe()
+def use_prompt_in_application(question: str, tier: str = "standard", user_id: str = None):
     """Demonstrate using prompts in application code."""
-    langfuse = Langfuse()
-    
-    # Fetch prompt by name and label
-    prompt = langfuse.get_prompt("customer-support-prompt", label="production")
+    # Fetch prompt by name and label; after the first call this is a dict
+    # read, stale versions are refreshed in the background. With A/B testing
+    # enabled the label comes from the user's variant.
+    router = variant_router()
+    if router is not None:
+        variant, prompt = router.get_prompt("customer-support-prompt", user_id)
+        update_trace(user_id=user_id, tags=[f"ab:{variant}"])
+    else:
+        variant, prompt = None, get_prompt("customer-support-prompt", label="production")
     
-    print(f"Fetched prompt version: {prompt.version}")
+    print(f"Fetched prompt version: {prompt.version} (variant: {variant})")
     print(f"Prompt config: {prompt.config}")
     
-    # Compile prompt with variables
-    compiled = prompt.compile(
+    # Fill in variables; the template is parsed once per prompt version.
+    # strict: a prompt version that expects other variables fails loudly
+    compiled = compile_prompt(prompt, strict=True).render(
         tier=tier,
         question=question,
         tone="friendly and professional"
@@ -95,6 +159,7 @@ def use_prompt_in_application(question: str, tier: str = "standard"):
     # Use with OpenAI (automatically linked to trace)
     from langfuse.openai import openai
     
+    start = time.perf_counter()
     response = openai.chat.completions.create(
         model=prompt.config.get("model", "gpt-4o-mini"),
         messages=[{"role": "user", "content": compiled}],
@@ -102,11 +167,31 @@ def use_prompt_in_application(question: str, tier: str = "standard"):
         max_tokens=prompt.config.get("max_tokens", 300),
         metadata={
             "langfuse_prompt_name": prompt.name,
-            "langfuse_prompt_version": prompt.version
+            "langfuse_prompt_version": prompt.version,
+            "ab_variant": variant
         }
     )
+
+    latency_ms = (time.perf_counter() - start) * 1000
+    answer = response.choices[0].message.content
+
+    # Quality score on the trace, compared per variant by the router
+    quality = evaluate_response(question, answer)
+    tail_sampling.create_score(
+        trace_id=langfuse_client().get_current_trace_id(),
+        name="response_quality",
+        value=quality
+    )
+
+    if router is not None:
+        router.record(
+            variant,
+            latency_ms=latency_ms,
+            tokens=response.usage.total_tokens if response.usage else 0
+        )
+        router.record_score(variant, quality)
     
-    return response.choices[0].message.content
+    return answer
 
 
 def main():
@@ -114,6 +199,10 @@ def main():
     print("\n" + "="*60)
     print("Langfuse Example 3: Prompt Management")
     print("="*60)
+
+    # Shared client configured from configs/ (see tracing_utils.init_client)
+    init_client()
+    install_variant_router()
     
     # Step 1: Create prompts
     create_prompts()
@@ -129,6 +218,18 @@ def main():
             tier="premium"
         )
         print(f"Response: {response}\n")
+
+        # Later requests are served from the prompt cache; each user keeps
+        # the same A/B variant on every request
+        for i, question in enumerate(["Where is my order?", "Can I change my shipping address?"] * 3):
+            use_prompt_in_application(question=question, user_id=f"user-{i % 4}")
+        print(f"Prompt cache: {get_prompt_cache().stats()}\n")
+        if variant_router() is not None:
+            for variant, stats in variant_router().stats().items():
+                quality = f"{stats['mean_score']:.2f}" if stats["mean_score"] is not None else "-"
+                print(f"  {variant}: {stats['requests']} requests, {stats['mean_latency_ms']:.0f} ms, "
+                      f"{stats['mean_tokens']:.0f} tokens/request, quality {quality}")
+            print()
         
         print("Benefits of prompt management:")
         print("  - Centralized version control")
@@ -142,8 +243,7 @@ def main():
         print("Note: Create the prompt in Langfuse UI first or run create_prompts()\n")
 
     # Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
-    from langfuse import get_client
-    get_client().shutdown()
+    langfuse_client().shutdown()
 
 
 if __name__ == "__main__":
@@ -4,14 +4,21 @@ Example 4: Dataset Creation and Evaluation
 This example demonstrates:
 - Creating evaluation datasets
 - Adding dataset items
-- Running experiments
+- Running experiments (in parallel, see experiment_runner.py)
+- Batch evaluators (exact match, token F1, ROUGE-L, embedding similarity)
 - LLM-as-a-Judge evaluations
 - Comparing results
 """
 
 import os
 from dotenv import load_dotenv
-from langfuse import Langfuse, observe
+from langfuse import observe
+
+from batch_evaluators import get_batch_evaluator
+from dataset_cache import get_dataset
+from experiment_runner import get_experiment_runner
+from experiment_store import install_experiment_store
+from tracing_utils import init_client, langfuse_client
 
 load_dotenv()
 
@@ -22,7 +29,7 @@ def create_dataset():
     print("Creating Evaluation Dataset")
     print("="*60 + "\n")
     
-    langfuse = Langfuse()
+    langfuse = langfuse_client()
     
     # Create dataset
     langfuse.create_dataset(
@@ -95,35 +102,50 @@ def run_experiment():
     print("Running Experiment")
     print("="*60 + "\n")
     
-    langfuse = Langfuse()
+    langfuse = langfuse_client()
     
-    # Get dataset
-    dataset = langfuse.get_dataset("qa-evaluation-dataset")
+    # Get dataset (local snapshot, only changes are downloaded; see dataset_cache.py)
+    dataset = get_dataset("qa-evaluation-dataset")
     
     experiment_name = "gpt-4o-mini-experiment-v1"
-    
-    # Run each test case using v3 API with item.run() context manager
-    for item in dataset.items:
-        question = item.input["question"]
-        print(f"Testing: {question}")
-        
-        # Use item.run() context manager for automatic trace linking
-        with item.run(
-            run_name=experiment_name,
-            run_description="QA evaluation experiment",
-            run_metadata={"model": "gpt-4o-mini", "temperature": 0.3}
-        ) as root_span:
-            # Run the QA system
-            result = qa_system(question)
-            
-            # Optionally score the result
-            root_span.score_trace(
-                name="experiment_run",
-                value=1.0,
-                comment="Completed successfully"
-            )
+
+    def run_item(item, root_span):
+        # Run the QA system
+        result = qa_system(item.input["question"])
         
-        print(f"Result: {result[:80]}...\n")
+        # Optionally score the result
+        root_span.score_trace(
+            name="experiment_run",
+            value=1.0,
+            comment="Completed successfully"
+        )
+        return result
+    
+    # Items run concurrently (evaluation.experiments), each inside its own
+    # item.run() context for automatic trace linking. Items whose stored
+    # result still applies (evaluation.experiments.store) are not run again.
+    runner = get_experiment_runner()
+    store = install_experiment_store()
+    results = runner.run(
+        dataset.items,
+        run_item,
+        run_name=experiment_name,
+        run_description="QA evaluation experiment",
+        run_metadata={"model": "gpt-4o-mini", "temperature": 0.3},
+        store=store
+    )
+
+    # Deterministic metrics against expected_output for all items in one
+    # vectorized pass, written to each item's trace
+    get_batch_evaluator().score_results(dataset.items, results, store=store)
+    
+    for item, result in zip(dataset.items, results):
+        print(f"Testing: {item.input['question']}")
+        if result["error"]:
+            print(f"Error: {result['error']}\n")
+        else:
+            reused = " (stored result)" if result["cached"] else ""
+            print(f"Result{reused}: {result['output'][:80]}...\n")
     
     # Flush to ensure all data is sent
     langfuse.flush()
@@ -134,7 +156,7 @@ def run_experiment():
 
 def create_evaluation_score(trace_id: str, value: float, comment: str = None):
     """Create evaluation score for a trace."""
-    langfuse = Langfuse()
+    langfuse = langfuse_client()
     
     langfuse.score(
         trace_id=trace_id,
@@ -149,6 +171,9 @@ def main():
     print("\n" + "="*60)
     print("Langfuse Example 4: Dataset & Evaluation")
     print("="*60)
+
+    # Shared client configured from configs/ (see tracing_utils.init_client)
+    init_client()
     
     try:
         # Step 1: Create dataset
@@ -163,15 +188,14 @@ def main():
         print("\nNext steps:")
         print("  1. View experiment results in Langfuse dashboard")
         print("  2. Set up LLM-as-a-Judge evaluations")
-        print("  3. Compare different model versions")
+        print("  3. Compare runs: python scripts/compare_experiments.py --list")
         print("  4. Annotate results in annotation queues\n")
         
     except Exception as e:
         print(f"Error: {e}\n")
 
     # Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
-    from langfuse import get_client
-    get_client().shutdown()
+    langfuse_client().shutdown()
 
 
 if __name__ == "__main__":
@@ -28,6 +28,8 @@ except ImportError:
     from langchain.schema import StrOutputParser
     from langfuse.langchain import CallbackHandler
 
+from tracing_utils import init_client, langfuse_client
+
 
 def example_simple_chain():
     """Simple LangChain chain with Langfuse tracing."""
@@ -158,6 +160,9 @@ def main():
     print("\n" + "="*70)
     print("Langfuse Example 5: LangChain Integration")
     print("="*70)
+
+    # Shared client configured from configs/ (see tracing_utils.init_client)
+    init_client()
     
     try:
         example_simple_chain()
@@ -182,8 +187,7 @@ def main():
         print("  pip install langchain langchain-openai\n")
 
     # Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
-    from langfuse import get_client
-    get_client().shutdown()
+    langfuse_client().shutdown()
 
 
 if __name__ == "__main__":
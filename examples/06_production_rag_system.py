@@ -8,26 +8,75 @@ Demonstrates:
 - Answer quality scoring
 - Production error handling
 - Performance monitoring
+- Off-critical-path evaluation (RAG_ASYNC_EVALUATION=true)
+- Coalescing of identical concurrent queries (RAG_COALESCE_QUERIES=true)
+- Low-overhead instrumentation (LANGFUSE_LOW_OVERHEAD=true, see tracing_utils)
+- Payload capture limits (observability.capture_* in configs/*.yaml)
+- Config-driven head sampling (langfuse.sampling in configs/*.yaml)
+- Tail sampling that keeps failed, slow and low-quality traces
+  (langfuse.tail_sampling in configs/*.yaml)
+- Judges for failed queries and negative user feedback that skipped them
+  (on_error / on_user_feedback_negative in evaluation.triggers)
 """
 
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
-from langfuse import observe, get_client
+from langfuse import observe
 from langfuse.openai import openai
 
+from config import load_config
+from context_packer import ContextPacker
+from eval_sampling import EvaluationSampler
+from eval_worker import EvaluationWorker
+from head_sampling import trace_sampled_out
+from pii_masking import pii_masker
+from relevance_prefilter import RelevancePrefilter, cosine_similarities
+from singleflight import SingleFlight
+import tail_sampling
+from capture_policy import get_capture_policy
+from tracing_utils import init_client, langfuse_client, lazy, traced, update_span, update_trace
+
 load_dotenv()
 
 
 class ProductionRAGSystem:
     """Production-ready RAG system with observability and quality checks."""
     
-    def __init__(self):
+    def __init__(self, async_evaluation: bool = False, eval_workers: int = 4,
+                 eval_queue_size: int = 100, sampler: Optional[EvaluationSampler] = None,
+                 coalesce: bool = False):
         self.embedding_model = "text-embedding-3-small"
         self.generation_model = "gpt-4o"
         self.eval_model = "gpt-4o-mini"
+
+        # Token-budgeted context assembly shared by generation and grounding check
+        self.context_packer = ContextPacker()
+
+        # Decides per trace whether the LLM judges run (evaluation.triggers)
+        evaluation_config = load_config().get("evaluation", {})
+        self.sampler = sampler or EvaluationSampler.from_config(evaluation_config)
+
+        # Embedding-similarity prefilter in front of the relevance judge
+        # (opt-in via evaluation.relevance_prefilter.enabled)
+        prefilter_config = evaluation_config.get("relevance_prefilter") or {}
+        self.prefilter = None
+        if prefilter_config.get("enabled", False):
+            self.prefilter = RelevancePrefilter.from_config(prefilter_config)
+
+        # Optional coalescing of identical in-flight queries
+        self.singleflight = SingleFlight() if coalesce else None
+
+        # Optional off-critical-path evaluation: hallucination check and
+        # scoring run on a background worker after the answer is returned
+        self.eval_worker = None
+        if async_evaluation:
+            self.eval_worker = EvaluationWorker(
+                num_workers=eval_workers,
+                max_queue_size=eval_queue_size
+            )
     
-    @observe(as_type="retriever")
+    @traced(as_type="retriever")
     def retrieve_contexts(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """Retrieve relevant contexts from vector database."""
         # Simulated vector database retrieval
@@ -58,8 +107,7 @@ class ProductionRAGSystem:
         results = knowledge_base[:top_k]
 
         # Update span with retrieval metadata (v3 API - retriever is a span type)
-        langfuse = get_client()
-        langfuse.update_current_span(
+        update_span(
             input=query,
             output=results,
             metadata={
@@ -76,23 +124,28 @@ class ProductionRAGSystem:
         """Evaluate if retrieved context is relevant to the query."""
         response = openai.chat.completions.create(
             model=self.eval_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Evaluate if the context is relevant to answer the question. Respond with RELEVANT, PARTIALLY_RELEVANT, or NOT_RELEVANT and a brief explanation."
-                },
-                {
-                    "role": "user",
-                    "content": f"Question: {query}\n\nContext: {context}\n\nEvaluation:"
-                }
-            ],
+            messages=self._relevance_messages(query, context),
             temperature=0.1,
             max_tokens=100
         )
         
-        evaluation = response.choices[0].message.content
-        
-        # Parse relevance
+        return self._parse_relevance(response.choices[0].message.content)
+
+    @staticmethod
+    def _relevance_messages(query: str, context: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": "Evaluate if the context is relevant to answer the question. Respond with RELEVANT, PARTIALLY_RELEVANT, or NOT_RELEVANT and a brief explanation."
+            },
+            {
+                "role": "user",
+                "content": f"Question: {query}\n\nContext: {context}\n\nEvaluation:"
+            }
+        ]
+
+    @staticmethod
+    def _parse_relevance(evaluation: str) -> Dict[str, Any]:
         if "RELEVANT" in evaluation and "NOT_RELEVANT" not in evaluation:
             relevance = "RELEVANT"
             score = 1.0
@@ -109,27 +162,88 @@ class ProductionRAGSystem:
             "explanation": evaluation
         }
     
-    @observe(as_type="generation")
-    def generate_answer(self, query: str, contexts: List[Dict]) -> str:
-        """Generate answer using retrieved contexts."""
-        # Combine contexts
-        combined_context = "\n\n".join([
-            f"[Source {i+1}]: {ctx['content']}"
-            for i, ctx in enumerate(contexts)
-        ])
+    @traced()
+    def grade_contexts(self, query: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Grade context relevance, sending only ambiguous contexts to the LLM judge.
+
+        Query and contexts are embedded in a single request; clear cases are
+        auto-labelled from cosine similarity by the prefilter.
+        """
+        if self.prefilter is None or not contexts:
+            return [self.evaluate_context_relevance(query, ctx['content']) for ctx in contexts]
+
+        response = openai.embeddings.create(
+            model=self.embedding_model,
+            input=[query] + [ctx['content'] for ctx in contexts]
+        )
+        vectors = [item.embedding for item in response.data]
+        similarities, auto_labels, to_judge = self._plan_grading(query, contexts, vectors)
+
+        judged = {
+            i: self.evaluate_context_relevance(query, contexts[i]['content'])
+            for i in to_judge
+        }
+        return self._merge_grading(contexts, similarities, auto_labels, judged)
+
+    def _plan_grading(self, query: str, contexts: List[Dict[str, Any]],
+                      vectors: List[List[float]]):
+        """Auto-label contexts by similarity; return the indexes the judge must see."""
+        similarities = cosine_similarities(vectors[0], vectors[1:])
+        auto_labels = self.prefilter.classify(similarities)
+        to_judge = [
+            i for i, (ctx, label) in enumerate(zip(contexts, auto_labels))
+            if label is None or self.prefilter.should_audit(f"{query}|{ctx['id']}")
+        ]
+        return similarities, auto_labels, to_judge
+
+    def _merge_grading(self, contexts: List[Dict[str, Any]], similarities, auto_labels,
+                       judged: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Combine auto labels with judge verdicts and log prefilter statistics."""
+        evaluations = []
+        audited = agreed = 0
+        for i, (similarity, auto_label) in enumerate(zip(similarities, auto_labels)):
+            if i in judged:
+                rel_eval = judged[i]
+                if auto_label is not None:
+                    audited += 1
+                    agreed += self.prefilter.record_audit(auto_label, rel_eval['score'])
+            else:
+                rel_eval = {
+                    "relevance": auto_label,
+                    "score": 1.0 if auto_label == "RELEVANT" else 0.0,
+                    "explanation": f"Auto-labelled from embedding similarity {similarity:.3f}"
+                }
+
+            rel_eval["similarity"] = float(similarity)
+            evaluations.append(rel_eval)
+
+        prefilter_stats = {
+            "num_contexts": len(contexts),
+            "judge_calls": len(judged),
+            "judge_calls_avoided_fraction": 1 - len(judged) / len(contexts),
+            "audited": audited,
+            "agreement": agreed / audited if audited else None,
+            "lifetime_agreement": self.prefilter.agreement_rate(),
+            "thresholds": [self.prefilter.irrelevant_threshold, self.prefilter.relevant_threshold]
+        }
+
+        update_span(
+            output=lazy(lambda: [e["relevance"] for e in evaluations]),
+            metadata={"similarities": lazy(lambda: [round(float(x), 4) for x in similarities])}
+        )
+        update_trace(metadata={"relevance_prefilter": prefilter_stats})
+
+        return evaluations
+
+    @traced(as_type="generation")
+    def generate_answer(self, query: str, packed: Dict[str, Any]) -> str:
+        """Generate answer using the packed contexts (see ContextPacker.pack)."""
+        combined_context = packed["text"]
         
         response = openai.chat.completions.create(
             model=self.generation_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant. Answer questions using ONLY the provided context. If the context doesn't contain the answer, say 'I don't have enough information to answer that question.'"
-                },
-                {
-                    "role": "user",
-                    "content": f"Context:\n{combined_context}\n\nQuestion: {query}\n\nAnswer:"
-                }
-            ],
+            messages=self._generation_messages(query, combined_context),
             temperature=0.4,
             max_tokens=300
         )
@@ -137,38 +251,62 @@ class ProductionRAGSystem:
         answer = response.choices[0].message.content
 
         # Update generation with context info (v3 API - this is a generation type)
-        langfuse = get_client()
-        langfuse.update_current_generation(
+        self._record_packing(packed)
+
+        return answer
+
+    @staticmethod
+    def _generation_messages(query: str, combined_context: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant. Answer questions using ONLY the provided context. If the context doesn't contain the answer, say 'I don't have enough information to answer that question.'"
+            },
+            {
+                "role": "user",
+                "content": f"Context:\n{combined_context}\n\nQuestion: {query}\n\nAnswer:"
+            }
+        ]
+
+    def _record_packing(self, packed: Dict[str, Any]):
+        update_span(
             metadata={
-                "num_contexts": len(contexts),
+                "num_contexts": len(packed["contexts"]),
                 "model": self.generation_model,
-                "context_length": len(combined_context)
+                "context_length": len(packed["text"]),
+                "packed_tokens": packed["tokens"],
+                "token_budget": packed["budget"],
+                "dropped_contexts": packed["dropped"]
             }
         )
-
-        return answer
     
     @observe(as_type="evaluator")
     def check_hallucination(self, query: str, context: str, answer: str) -> Dict[str, Any]:
         """Check if answer is grounded in the provided context."""
         response = openai.chat.completions.create(
             model=self.eval_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Determine if the answer is fully grounded in the context or contains hallucinated information. Respond with GROUNDED, PARTIALLY_GROUNDED, or HALLUCINATED with explanation."
-                },
-                {
-                    "role": "user",
-                    "content": f"Context: {context}\n\nAnswer: {answer}\n\nEvaluation:"
-                }
-            ],
+            messages=self._grounding_messages(context, answer),
             temperature=0.1,
             max_tokens=150
         )
         
-        evaluation = response.choices[0].message.content
-        
+        return self._parse_grounding(response.choices[0].message.content)
+
+    @staticmethod
+    def _grounding_messages(context: str, answer: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": "Determine if the answer is fully grounded in the context or contains hallucinated information. Respond with GROUNDED, PARTIALLY_GROUNDED, or HALLUCINATED with explanation."
+            },
+            {
+                "role": "user",
+                "content": f"Context: {context}\n\nAnswer: {answer}\n\nEvaluation:"
+            }
+        ]
+
+    @staticmethod
+    def _parse_grounding(evaluation: str) -> Dict[str, Any]:
         if "GROUNDED" in evaluation and "PARTIALLY" not in evaluation and "HALLUCINATED" not in evaluation:
             status = "GROUNDED"
             score = 1.0
@@ -185,33 +323,276 @@ class ProductionRAGSystem:
             "explanation": evaluation
         }
     
-    @observe()
-    def query(self, user_query: str) -> Dict[str, Any]:
-        """Main RAG query method with full observability."""
-        print(f"Processing query: {user_query}")
+    def score_result(self, trace_id: str, avg_relevance: float,
+                     hallucination_check: Dict[str, Any], num_contexts: int) -> float:
+        """Attach quality scores to a trace and return the overall quality score."""
+        self._score_relevance(trace_id, avg_relevance, num_contexts)
+
+        # Through the tail sampler, which sends them only if the trace is kept
+        tail_sampling.create_score(
+            trace_id=trace_id,
+            name="hallucination_check",
+            value=hallucination_check['score'],
+            comment=hallucination_check['explanation'][:200]  # Truncate for comment
+        )
+
+        # Overall quality score
+        quality_score = (avg_relevance + hallucination_check['score']) / 2
+        tail_sampling.create_score(
+            trace_id=trace_id,
+            name="overall_quality",
+            value=quality_score
+        )
+
+        return quality_score
+
+    def _score_relevance(self, trace_id: str, avg_relevance: float, num_contexts: int):
+        tail_sampling.create_score(
+            trace_id=trace_id,
+            name="context_relevance",
+            value=avg_relevance,
+            comment=f"Average relevance across {num_contexts} contexts"
+        )
+
+    def _evaluate_in_background(self, trace_id: str, parent_observation_id: str,
+                                user_query: str, context: str, answer: str,
+                                avg_relevance: float, num_contexts: int):
+        """Worker job: run the grounding check and score the original trace."""
+        try:
+            # langfuse_* kwargs attach the evaluator span to the original trace
+            hallucination_check = self.check_hallucination(
+                user_query, context, answer,
+                langfuse_trace_id=trace_id,
+                langfuse_parent_observation_id=parent_observation_id
+            )
+            self.score_result(trace_id, avg_relevance, hallucination_check, num_contexts)
+        finally:
+            tail_sampling.release(trace_id)
+
+    def _run_judges(self, trace_id: str, user_query: str, progress: Dict[str, Any],
+                    **observe_kwargs) -> None:
+        """
+        Judge whatever a pipeline run produced and score its trace.
+
+        Used for traces that only joined the evaluation set after their
+        judges were skipped (on_error, on_user_feedback_negative). Contexts
+        not graded by the judge yet are graded; an answer gets the grounding
+        check and the full set of scores.
+        """
+        relevance = progress.get("relevance")
+        if relevance is None:
+            grades = self.grade_contexts(user_query, progress["contexts"], **observe_kwargs)
+            relevance = sum(g["score"] for g in grades) / len(grades)
+
+        if progress.get("answer") is None:
+            self._score_relevance(trace_id, relevance, len(progress["contexts"]))
+            return
 
+        packed = progress["packed"]
+        hallucination_check = self.check_hallucination(user_query, packed["text"], progress["answer"],
+                                                       **observe_kwargs)
+        self.score_result(trace_id, relevance, hallucination_check, len(packed["contexts"]))
+
+    def _run_judges_in_background(self, trace_id: str, parent_observation_id: Optional[str],
+                                  user_query: str, progress: Dict[str, Any]):
+        """Worker job: _run_judges() attached to the original trace."""
+        try:
+            self._run_judges(trace_id, user_query, progress, langfuse_trace_id=trace_id,
+                             langfuse_parent_observation_id=parent_observation_id)
+        finally:
+            tail_sampling.release(trace_id)
+
+    def _queue_judges(self, trace_id: str, parent_observation_id: Optional[str],
+                      user_query: str, progress: Dict[str, Any]) -> str:
+        """Run the judges for a late-sampled trace on the worker (inline without one)."""
+        if not progress.get("contexts"):
+            return "nothing_to_evaluate"
+        if self.eval_worker is not None:
+            tail_sampling.hold(trace_id)
+            queued = self.eval_worker.submit(
+                trace_id, self._run_judges_in_background,
+                trace_id, parent_observation_id, user_query, progress
+            )
+            if not queued:
+                tail_sampling.release(trace_id)
+            return "queued" if queued else "dropped"
+        try:
+            self._run_judges(trace_id, user_query, progress)
+            return "evaluated"
+        except Exception as e:
+            print(f"Evaluation failed for trace {trace_id}: {e}")
+            return "failed"
+
+    def shutdown(self):
+        """Drain pending background evaluations."""
+        if self.eval_worker is not None:
+            self.eval_worker.shutdown()
+            print(f"Evaluation worker stats: {self.eval_worker.stats()}")
+        if self.singleflight is not None:
+            print(f"Query coalescing stats: {self.singleflight.stats()}")
+        print(f"Capture policy stats: {get_capture_policy().stats()}")
+        if pii_masker() is not None:
+            print(f"PII masking stats: {pii_masker().stats()}")
+        if tail_sampling.tail_sampler() is not None:
+            print(f"Tail sampling stats: {tail_sampling.tail_sampler().stats()}")
+
+    def _start_trace(self, attributes: Optional[Dict[str, Any]]):
+        """Tag the current trace and decide whether its judges run."""
         # Update trace metadata (v3 pattern)
-        langfuse = get_client()
-        langfuse.update_current_trace(
+        langfuse = langfuse_client()
+        # Fall back to a fresh id when tracing is disabled so sampling still works
+        trace_id = langfuse.get_current_trace_id() or langfuse.create_trace_id()
+        sampling = self.sampler.decide(trace_id, attributes)
+        if trace_sampled_out():
+            # Judge scores for a trace that is never exported would be dropped
+            sampling = {**sampling, "sampled": False, "reason": "trace_not_sampled"}
+        update_trace(
             user_id="production-user",
             session_id="rag-session",
-            tags=["rag", "production", "quality-checked"]
+            tags=["rag", "production", "quality-checked" if sampling["sampled"] else "quality-unchecked"],
+            metadata={"evaluation_sampling": sampling}
         )
-        
+        return trace_id, sampling
+
+    def _record_error(self, trace_id: str, attributes: Optional[Dict[str, Any]], error: Exception,
+                      sampling: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Log a pipeline error on the current trace.
+
+        Returns the evaluation decision for the failed trace: failed traces
+        are forced into the evaluation set when the on_error trigger is
+        configured. `late` is True when the trace's judges were skipped so
+        far and should run now.
+        """
+        error_sampling = self.sampler.decide(
+            trace_id, {**(attributes or {}), "error": str(error)}
+        )
+        if trace_sampled_out():
+            error_sampling = {**error_sampling, "sampled": False, "reason": "trace_not_sampled"}
+        error_sampling["late"] = error_sampling["sampled"] and not sampling["sampled"]
+        update_trace(
+            metadata={
+                "error": str(error),
+                "error_type": type(error).__name__,
+                "evaluation_sampling": error_sampling
+            }
+        )
+        return error_sampling
+
+    def record_feedback(self, trace_id: str, feedback: Any, user_query: str,
+                        result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Attach end-user feedback to an answered query's trace.
+
+        Negative feedback queues the judges the trace skipped when the
+        on_user_feedback_negative trigger is configured. Returns the
+        evaluation decision, with the judges' status as "evaluation".
+        """
+        sampling = self._feedback_sampling(trace_id, feedback, result)
+        if sampling["late"]:
+            sampling["evaluation"] = self._queue_judges(
+                trace_id, None, user_query, self._feedback_progress(result)
+            )
+        return sampling
+
+    def _feedback_sampling(self, trace_id: str, feedback: Any, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Score the feedback and decide whether the trace's skipped judges run now."""
+        if isinstance(feedback, str):
+            tail_sampling.create_score(trace_id=trace_id, name="user_feedback", value=feedback,
+                                       data_type="CATEGORICAL")
+        else:
+            tail_sampling.create_score(trace_id=trace_id, name="user_feedback", value=float(feedback))
+        sampling = self.sampler.decide(trace_id, {"user_feedback": feedback})
+        # Only traces whose answer was generated without judging
+        sampling["late"] = sampling["sampled"] and result["quality_checks"].get("evaluation") == "not_sampled"
+        return sampling
+
+    def _feedback_progress(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """What _run_judges() needs, rebuilt from a query result."""
+        return {
+            "contexts": result["contexts"],
+            "relevance": result["quality_checks"]["relevance"],
+            "packed": self.context_packer.pack(result["contexts"], self.generation_model),
+            "answer": result["answer"]
+        }
+
+    @traced()
+    def query(self, user_query: str, attributes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Main RAG query method with full observability.
+
+        `attributes` feed the evaluation sampling rules (e.g. `user_feedback`).
+        """
+        print(f"Processing query: {user_query}")
+
+        trace_id, sampling = self._start_trace(attributes)
+
+        if self.singleflight is not None:
+            result = self._query_coalesced(user_query, trace_id, sampling, attributes)
+        else:
+            result = self._run_pipeline(user_query, trace_id, sampling, attributes)
+        # For record_feedback()
+        return {**result, "trace_id": trace_id}
+
+    def _query_coalesced(self, user_query: str, trace_id: str, sampling: Dict[str, Any],
+                         attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Share one pipeline execution between identical concurrent queries."""
+        result, flight = self.singleflight.do(
+            self._coalescing_key(user_query),
+            lambda: self._run_pipeline(user_query, trace_id, sampling, attributes),
+            caller_id=trace_id
+        )
+        return self._record_flight(trace_id, result, flight)
+
+    def _record_flight(self, trace_id: str, result: Dict[str, Any], flight: Dict[str, Any]) -> Dict[str, Any]:
+        """Link every caller's trace to the trace that ran the pipeline."""
+        update_trace(
+            metadata={
+                "singleflight": {
+                    "role": "leader" if flight["leader"] else "follower",
+                    "leader_trace_id": flight["leader_id"],
+                    "fan_in": flight["fan_in"]
+                }
+            }
+        )
+        if flight["leader"]:
+            tail_sampling.create_score(
+                trace_id=trace_id,
+                name="singleflight_fan_in",
+                value=flight["fan_in"],
+                comment="Callers served by this pipeline execution"
+            )
+
+        return {**result, "coalesced": not flight["leader"]}
+
+    def _coalescing_key(self, user_query: str):
+        """Normalized query plus every setting that influences the result."""
+        normalized = " ".join(user_query.lower().split())
+        return (normalized, self.embedding_model, self.generation_model, self.eval_model)
+
+    def _run_pipeline(self, user_query: str, trace_id: str, sampling: Dict[str, Any],
+                      attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Retrieve, grade, generate, check and score within the current trace."""
+        langfuse = langfuse_client()
+        # What the judges can look at should a later step fail
+        progress: Dict[str, Any] = {}
+
         try:
             # Step 1: Retrieve contexts
             contexts = self.retrieve_contexts(user_query, top_k=3)
+            progress["contexts"] = contexts
             print(f"Retrieved {len(contexts)} contexts")
             
-            # Step 2: Evaluate context relevance
+            # Step 2: Evaluate context relevance (the off-topic gate runs for
+            # every query; sampling only decides whether judge scores are recorded)
             relevance_scores = []
-            for ctx in contexts:
-                rel_eval = self.evaluate_context_relevance(user_query, ctx['content'])
+            for rel_eval in self.grade_contexts(user_query, contexts):
                 relevance_scores.append(rel_eval['score'])
                 print(f"Context relevance: {rel_eval['relevance']}")
             
             # Check if we have relevant contexts
             avg_relevance = sum(relevance_scores) / len(relevance_scores) if relevance_scores else 0
+            progress["relevance"] = avg_relevance
             
             if avg_relevance < 0.3:
                 return {
@@ -224,38 +605,69 @@ class ProductionRAGSystem:
                     }
                 }
             
-            # Step 3: Generate answer
-            answer = self.generate_answer(user_query, contexts)
+            # Step 3: Generate answer from the token-budgeted context
+            packed = self.context_packer.pack(contexts, self.generation_model)
+            answer = self.generate_answer(user_query, packed)
+            progress.update(packed=packed, answer=answer)
             print(f"Generated answer: {answer[:100]}...")
             
-            # Step 4: Check for hallucinations
-            combined_context = " ".join([ctx['content'] for ctx in contexts])
+            # Step 4: Check for hallucinations against the same packed context
+            combined_context = packed["text"]
+
+            if not sampling["sampled"]:
+                return {
+                    "answer": answer,
+                    "contexts": contexts,
+                    "quality_checks": {
+                        "relevance": avg_relevance,
+                        "hallucination": None,
+                        "overall": None,
+                        "quality_passed": None,
+                        "evaluation": "not_sampled"
+                    }
+                }
+
+            if self.eval_worker is not None:
+                # Return right away; grounding check and scores are attached
+                # to this trace by the background worker. The tail sampler
+                # waits for those scores before deciding on the trace.
+                tail_sampling.hold(trace_id)
+                queued = self.eval_worker.submit(
+                    trace_id,
+                    self._evaluate_in_background,
+                    trace_id,
+                    langfuse.get_current_observation_id(),
+                    user_query,
+                    combined_context,
+                    answer,
+                    avg_relevance,
+                    len(packed["contexts"])
+                )
+                if not queued:
+                    tail_sampling.release(trace_id)
+                return {
+                    "answer": answer,
+                    "contexts": contexts,
+                    "quality_checks": {
+                        "relevance": avg_relevance,
+                        "hallucination": None,
+                        "overall": None,
+                        "quality_passed": None,
+                        "evaluation": "queued" if queued else "dropped"
+                    }
+                }
+
             hallucination_check = self.check_hallucination(
                 user_query, combined_context, answer
             )
             print(f"Hallucination check: {hallucination_check['status']}")
             
-            # Step 5: Score the result (v3 pattern)
-            langfuse = get_client()
-
-            # Add quality scores using score_current_trace (v3 API)
-            langfuse.score_current_trace(
-                name="context_relevance",
-                value=avg_relevance,
-                comment=f"Average relevance across {len(contexts)} contexts"
-            )
-            
-            langfuse.score_current_trace(
-                name="hallucination_check",
-                value=hallucination_check['score'],
-                comment=hallucination_check['explanation'][:200]  # Truncate for comment
-            )
-            
-            # Overall quality score
-            quality_score = (avg_relevance + hallucination_check['score']) / 2
-            langfuse.score_current_trace(
-                name="overall_quality",
-                value=quality_score
+            # Step 5: Score the result
+            quality_score = self.score_result(
+                trace_id,
+                avg_relevance,
+                hallucination_check,
+                len(packed["contexts"])
             )
             
             print(f"Overall quality score: {quality_score:.2f}")
@@ -274,12 +686,11 @@ class ProductionRAGSystem:
         except Exception as e:
             print(f"Error in RAG pipeline: {e}")
 
-            # Log error (v3 pattern)
-            langfuse = get_client()
-            langfuse.update_current_trace(
-                metadata={"error": str(e), "error_type": type(e).__name__}
-            )
-
+            error_sampling = self._record_error(trace_id, attributes, e, sampling)
+            if error_sampling["late"]:
+                update_trace(metadata={"failure_evaluation": self._queue_judges(
+                    trace_id, langfuse.get_current_observation_id(), user_query, progress
+                )})
             raise
 
 
@@ -288,8 +699,15 @@ def main():
     print("\n" + "="*70)
     print("Langfuse Example 6: Production RAG System")
     print("="*70 + "\n")
-    
-    rag = ProductionRAGSystem()
+
+    # Create the shared client from configs/ (SDK settings, head and tail
+    # sampling, capture policy, PII masking) before anything else traces
+    init_client()
+
+    rag = ProductionRAGSystem(
+        async_evaluation=os.getenv("RAG_ASYNC_EVALUATION", "false").lower() == "true",
+        coalesce=os.getenv("RAG_COALESCE_QUERIES", "false").lower() == "true"
+    )
     
     # Test queries
     queries = [
@@ -304,6 +722,14 @@ def main():
         print(f"\nFinal Answer: {result['answer']}")
         print(f"Quality Passed: {result['quality_checks']['quality_passed']}")
         print("-"*70)
+
+    # Negative feedback on an unjudged answer queues its judges
+    # (on_user_feedback_negative in evaluation.triggers)
+    feedback = rag.record_feedback(result["trace_id"], "negative", query, result)
+    print(f"\nFeedback evaluation: {feedback['reason']} ({feedback.get('evaluation', 'no judges queued')})")
+
+    # Wait for queued evaluations before flushing traces
+    rag.shutdown()
     
     print("\n" + "="*70)
     print("Production RAG System Complete")
@@ -320,7 +746,7 @@ def main():
     print("="*70 + "\n")
 
     # Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
-    langfuse = get_client()
+    langfuse = langfuse_client()
     langfuse.shutdown()
 
 
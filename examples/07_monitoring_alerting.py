@@ -14,7 +14,8 @@ import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
 from dotenv import load_dotenv
-from langfuse import Langfuse
+
+from tracing_utils import langfuse_client
 
 load_dotenv()
 
@@ -23,7 +24,7 @@ class ProductionMonitor:
     """Production monitoring system for Langfuse traces."""
     
     def __init__(self):
-        self.langfuse = Langfuse()
+        self.langfuse = langfuse_client()
         self.alert_thresholds = {
             'error_rate': 0.05,          # 5%
             'daily_cost': 100.0,         # $100
@@ -0,0 +1,437 @@
+"""
+Example 8: Async Production RAG System
+
+Demonstrates:
+- The Example 6 pipeline (retrieve -> grade -> generate -> check -> score)
+  on async OpenAI clients
+- Per-model caps on in-flight LLM calls (rate_limiting.model_concurrency)
+- Correct @observe span nesting across await points
+- Serving many concurrent queries from one event loop
+"""
+
+import asyncio
+import importlib
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langfuse import observe
+from langfuse.openai import AsyncOpenAI
+from openai import DefaultAsyncHttpxClient
+
+import tail_sampling
+from config import load_config
+from tracing_utils import init_client, langfuse_client, update_trace
+
+load_dotenv()
+
+ProductionRAGSystem = importlib.import_module("06_production_rag_system").ProductionRAGSystem
+
+# Caps on concurrent requests per model when rate_limiting.model_concurrency
+# does not set them
+DEFAULT_MODEL_CONCURRENCY = {
+    "gpt-4o": 64,
+    "gpt-4o-mini": 128,
+    "text-embedding-3-small": 128,
+}
+
+
+class ModelConcurrencyLimiter:
+    """One asyncio.Semaphore per model to bound in-flight LLM calls."""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = 32):
+        self.limits = {**DEFAULT_MODEL_CONCURRENCY, **(limits or {})}
+        self.default_limit = default_limit
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def from_config(cls, concurrency_cfg: Optional[Dict[str, Any]],
+                    limits: Optional[Dict[str, int]] = None) -> "ModelConcurrencyLimiter":
+        """Limits from `rate_limiting.model_concurrency`; `limits` override them."""
+        configured = {model: int(limit) for model, limit in (concurrency_cfg or {}).items()}
+        default_limit = configured.pop("default", 32)
+        return cls({**configured, **(limits or {})}, default_limit)
+
+    def __call__(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limits.get(model, self.default_limit))
+            self._semaphores[model] = semaphore
+        return semaphore
+
+    def total_limit(self) -> int:
+        return sum(self.limits.values())
+
+
+class AsyncProductionRAGSystem(ProductionRAGSystem):
+    """
+    Async variant of ProductionRAGSystem for high-concurrency serving.
+
+    Shares retrieval, sampling, prefilter, context packing and scoring with
+    the sync system; every LLM call goes through an AsyncOpenAI client and a
+    per-model semaphore. `@observe` keeps span nesting across awaits because
+    the current span lives in a contextvar that every asyncio task inherits.
+    """
+
+    def __init__(self, model_concurrency: Optional[Dict[str, int]] = None,
+                 async_evaluation: bool = False, eval_queue_size: int = 1000,
+                 eval_submit_timeout: Optional[float] = 5.0, **kwargs):
+        # Background evaluation uses asyncio tasks instead of worker threads
+        super().__init__(async_evaluation=False, **kwargs)
+        self.limiter = ModelConcurrencyLimiter.from_config(
+            (load_config().get("rate_limiting") or {}).get("model_concurrency"), model_concurrency
+        )
+        self.client = AsyncOpenAI(
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.limiter.total_limit(),
+                    max_keepalive_connections=self.limiter.total_limit()
+                )
+            )
+        )
+
+        self.async_evaluation = async_evaluation
+        # Like EvaluationWorker.submit: wait up to eval_submit_timeout for a
+        # free slot, then drop the evaluation
+        self.eval_submit_timeout = eval_submit_timeout
+        self._eval_slots = asyncio.Semaphore(eval_queue_size)
+        self._eval_tasks = set()
+        self.eval_stats = {"queued": 0, "dropped": 0}
+
+    async def _acquire_eval_slot(self, trace_id: str) -> bool:
+        """Reserve a background evaluation slot; False when the evaluation is dropped."""
+        try:
+            await asyncio.wait_for(self._eval_slots.acquire(), self.eval_submit_timeout)
+        except asyncio.TimeoutError:
+            print(f"Evaluation queue full, dropping job for trace {trace_id}")
+            self.eval_stats["dropped"] += 1
+            return False
+        self.eval_stats["queued"] += 1
+        return True
+
+    async def _chat(self, model: str, messages: List[Dict[str, str]], **kwargs) -> str:
+        async with self.limiter(model):
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **kwargs
+            )
+        return response.choices[0].message.content
+
+    @observe(as_type="generation")
+    async def evaluate_context_relevance(self, query: str, context: str) -> Dict[str, Any]:
+        """Evaluate if retrieved context is relevant to the query."""
+        evaluation = await self._chat(
+            self.eval_model,
+            self._relevance_messages(query, context),
+            temperature=0.1,
+            max_tokens=100
+        )
+        return self._parse_relevance(evaluation)
+
+    @observe()
+    async def grade_contexts(self, query: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Grade context relevance; ambiguous contexts are judged concurrently."""
+        if self.prefilter is None or not contexts:
+            return list(await asyncio.gather(*[
+                self.evaluate_context_relevance(query, ctx['content']) for ctx in contexts
+            ]))
+
+        async with self.limiter(self.embedding_model):
+            response = await self.client.embeddings.create(
+                model=self.embedding_model,
+                input=[query] + [ctx['content'] for ctx in contexts]
+            )
+        vectors = [item.embedding for item in response.data]
+        similarities, auto_labels, to_judge = self._plan_grading(query, contexts, vectors)
+
+        verdicts = await asyncio.gather(*[
+            self.evaluate_context_relevance(query, contexts[i]['content']) for i in to_judge
+        ])
+        return self._merge_grading(
+            contexts, similarities, auto_labels, dict(zip(to_judge, verdicts))
+        )
+
+    @observe(as_type="generation")
+    async def generate_answer(self, query: str, packed: Dict[str, Any]) -> str:
+        """Generate answer using the packed contexts (see ContextPacker.pack)."""
+        answer = await self._chat(
+            self.generation_model,
+            self._generation_messages(query, packed["text"]),
+            temperature=0.4,
+            max_tokens=300
+        )
+        self._record_packing(packed)
+        return answer
+
+    @observe(as_type="evaluator")
+    async def check_hallucination(self, query: str, context: str, answer: str) -> Dict[str, Any]:
+        """Check if answer is grounded in the provided context."""
+        evaluation = await self._chat(
+            self.eval_model,
+            self._grounding_messages(context, answer),
+            temperature=0.1,
+            max_tokens=150
+        )
+        return self._parse_grounding(evaluation)
+
+    async def _evaluate_in_background(self, trace_id: str, parent_observation_id: str,
+                                      user_query: str, context: str, answer: str,
+                                      avg_relevance: float, num_contexts: int):
+        """Background task: run the grounding check and score the original trace."""
+        try:
+            hallucination_check = await self.check_hallucination(
+                user_query, context, answer,
+                langfuse_trace_id=trace_id,
+                langfuse_parent_observation_id=parent_observation_id
+            )
+            self.score_result(trace_id, avg_relevance, hallucination_check, num_contexts)
+        except Exception as e:
+            print(f"Evaluation task failed for trace {trace_id}: {e}")
+        finally:
+            self._eval_slots.release()
+            tail_sampling.release(trace_id)
+
+    async def _run_judges(self, trace_id: str, user_query: str, progress: Dict[str, Any],
+                          **observe_kwargs) -> None:
+        """Judge whatever a pipeline run produced and score its trace (see Example 6)."""
+        relevance = progress.get("relevance")
+        if relevance is None:
+            grades = await self.grade_contexts(user_query, progress["contexts"], **observe_kwargs)
+            relevance = sum(g["score"] for g in grades) / len(grades)
+
+        if progress.get("answer") is None:
+            self._score_relevance(trace_id, relevance, len(progress["contexts"]))
+            return
+
+        packed = progress["packed"]
+        hallucination_check = await self.check_hallucination(user_query, packed["text"], progress["answer"],
+                                                             **observe_kwargs)
+        self.score_result(trace_id, relevance, hallucination_check, len(packed["contexts"]))
+
+    async def _run_judges_in_background(self, trace_id: str, parent_observation_id: Optional[str],
+                                        user_query: str, progress: Dict[str, Any]):
+        """Background task: _run_judges() attached to the original trace."""
+        try:
+            await self._run_judges(trace_id, user_query, progress, langfuse_trace_id=trace_id,
+                                   langfuse_parent_observation_id=parent_observation_id)
+        except Exception as e:
+            print(f"Evaluation task failed for trace {trace_id}: {e}")
+        finally:
+            self._eval_slots.release()
+            tail_sampling.release(trace_id)
+
+    async def _queue_judges(self, trace_id: str, parent_observation_id: Optional[str],
+                            user_query: str, progress: Dict[str, Any]) -> str:
+        """Run the judges for a late-sampled trace as a task (inline without async evaluation)."""
+        if not progress.get("contexts"):
+            return "nothing_to_evaluate"
+        if self.async_evaluation:
+            if not await self._acquire_eval_slot(trace_id):
+                return "dropped"
+            tail_sampling.hold(trace_id)
+            task = asyncio.create_task(self._run_judges_in_background(
+                trace_id, parent_observation_id, user_query, progress
+            ))
+            self._eval_tasks.add(task)
+            task.add_done_callback(self._eval_tasks.discard)
+            return "queued"
+        try:
+            await self._run_judges(trace_id, user_query, progress)
+            return "evaluated"
+        except Exception as e:
+            print(f"Evaluation failed for trace {trace_id}: {e}")
+            return "failed"
+
+    async def record_feedback(self, trace_id: str, feedback: Any, user_query: str,
+                              result: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach end-user feedback to a trace; see Example 6."""
+        sampling = self._feedback_sampling(trace_id, feedback, result)
+        if sampling["late"]:
+            sampling["evaluation"] = await self._queue_judges(
+                trace_id, None, user_query, self._feedback_progress(result)
+            )
+        return sampling
+
+    async def shutdown(self):
+        """Wait for pending background evaluations and close the HTTP client."""
+        if self._eval_tasks:
+            await asyncio.gather(*self._eval_tasks, return_exceptions=True)
+        await self.client.close()
+
+    @observe()
+    async def query(self, user_query: str, attributes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Async RAG query with the same pipeline and scoring as Example 6."""
+        trace_id, sampling = self._start_trace(attributes)
+
+        if self.singleflight is not None:
+            result = await self._query_coalesced(user_query, trace_id, sampling, attributes)
+        else:
+            result = await self._run_pipeline(user_query, trace_id, sampling, attributes)
+        # For record_feedback()
+        return {**result, "trace_id": trace_id}
+
+    async def _query_coalesced(self, user_query: str, trace_id: str, sampling: Dict[str, Any],
+                               attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Share one pipeline execution between identical concurrent queries."""
+        result, flight = await self.singleflight.do_async(
+            self._coalescing_key(user_query),
+            lambda: self._run_pipeline(user_query, trace_id, sampling, attributes),
+            caller_id=trace_id
+        )
+        return self._record_flight(trace_id, result, flight)
+
+    async def _run_pipeline(self, user_query: str, trace_id: str, sampling: Dict[str, Any],
+                            attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Retrieve, grade, generate, check and score within the current trace."""
+        langfuse = langfuse_client()
+        # What the judges can look at should a later step fail
+        progress: Dict[str, Any] = {}
+
+        try:
+            # Step 1: Retrieve contexts (in-memory, no I/O to await)
+            contexts = self.retrieve_contexts(user_query, top_k=3)
+            progress["contexts"] = contexts
+
+            # Step 2: Evaluate context relevance (the off-topic gate runs for
+            # every query; sampling only decides whether judge scores are recorded)
+            relevance_scores = [e['score'] for e in await self.grade_contexts(user_query, contexts)]
+            avg_relevance = sum(relevance_scores) / len(relevance_scores) if relevance_scores else 0
+            progress["relevance"] = avg_relevance
+
+            if avg_relevance < 0.3:
+                return {
+                    "answer": "I don't have enough relevant information to answer that question.",
+                    "contexts": contexts,
+                    "quality_checks": {
+                        "relevance": avg_relevance,
+                        "hallucination": None,
+                        "quality_passed": False
+                    }
+                }
+
+            # Step 3: Generate answer from the token-budgeted context
+            packed = self.context_packer.pack(contexts, self.generation_model)
+            answer = await self.generate_answer(user_query, packed)
+            progress.update(packed=packed, answer=answer)
+
+            quality_checks = {
+                "relevance": avg_relevance,
+                "hallucination": None,
+                "overall": None,
+                "quality_passed": None
+            }
+
+            if not sampling["sampled"]:
+                quality_checks["evaluation"] = "not_sampled"
+            elif self.async_evaluation and not await self._acquire_eval_slot(trace_id):
+                quality_checks["evaluation"] = "dropped"
+            elif self.async_evaluation:
+                # Step 4+5 off the critical path; backpressure once
+                # eval_queue_size evaluations are pending
+                tail_sampling.hold(trace_id)
+                task = asyncio.create_task(self._evaluate_in_background(
+                    trace_id,
+                    langfuse.get_current_observation_id(),
+                    user_query,
+                    packed["text"],
+                    answer,
+                    avg_relevance,
+                    len(packed["contexts"])
+                ))
+                self._eval_tasks.add(task)
+                task.add_done_callback(self._eval_tasks.discard)
+                quality_checks["evaluation"] = "queued"
+            else:
+                # Step 4: Check for hallucinations against the same packed context
+                hallucination_check = await self.check_hallucination(
+                    user_query, packed["text"], answer
+                )
+
+                # Step 5: Score the result
+                quality_score = self.score_result(
+                    trace_id, avg_relevance, hallucination_check, len(packed["contexts"])
+                )
+                quality_checks.update({
+                    "hallucination": hallucination_check['score'],
+                    "overall": quality_score,
+                    "quality_passed": quality_score >= 0.7
+                })
+
+            return {
+                "answer": answer,
+                "contexts": contexts,
+                "quality_checks": quality_checks
+            }
+
+        except Exception as e:
+            print(f"Error in RAG pipeline: {e}")
+            error_sampling = self._record_error(trace_id, attributes, e, sampling)
+            if error_sampling["late"]:
+                update_trace(metadata={"failure_evaluation": await self._queue_judges(
+                    trace_id, langfuse.get_current_observation_id(), user_query, progress
+                )})
+            raise
+
+
+async def run_concurrent_queries(rag: AsyncProductionRAGSystem, queries: List[str]) -> List[Any]:
+    """Serve all queries concurrently on the current event loop."""
+    return await asyncio.gather(*[rag.query(q) for q in queries], return_exceptions=True)
+
+
+async def async_main():
+    print("\n" + "="*70)
+    print("Langfuse Example 8: Async Production RAG System")
+    print("="*70 + "\n")
+
+    # Create the shared client from configs/ (SDK settings, head and tail
+    # sampling, capture policy, PII masking) before anything else traces
+    init_client()
+
+    rag = AsyncProductionRAGSystem(
+        async_evaluation=os.getenv("RAG_ASYNC_EVALUATION", "false").lower() == "true",
+        coalesce=os.getenv("RAG_COALESCE_QUERIES", "false").lower() == "true"
+    )
+
+    base_queries = [
+        "What tracing capabilities does Langfuse provide?",
+        "How does prompt management work?",
+        "What is the capital of France?"
+    ]
+    num_queries = int(os.getenv("RAG_CONCURRENT_QUERIES", "30"))
+    queries = [base_queries[i % len(base_queries)] for i in range(num_queries)]
+
+    start = time.perf_counter()
+    results = await run_concurrent_queries(rag, queries)
+    elapsed = time.perf_counter() - start
+
+    await rag.shutdown()
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    print(f"Served {len(queries)} concurrent queries in {elapsed:.2f}s "
+          f"({len(queries) / elapsed:.1f} queries/s, {len(errors)} errors)")
+    if rag.async_evaluation:
+        print(f"Background evaluations: {rag.eval_stats}")
+    if rag.singleflight is not None:
+        print(f"Coalescing: {rag.singleflight.stats()}")
+    for query, result in list(zip(queries, results))[:len(base_queries)]:
+        if not isinstance(result, Exception):
+            print(f"\nQ: {query}\nA: {result['answer']}")
+
+    print("\n" + "="*70)
+    print(f"View traces in: {os.getenv('LANGFUSE_HOST')}")
+    print("="*70 + "\n")
+
+
+def main():
+    """Run the async RAG example."""
+    asyncio.run(async_main())
+
+    # Shutdown to ensure all traces are sent and resources cleaned up (v3 pattern)
+    langfuse_client().shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Deterministic A/B routing of prompt variants.
+
+Implements `prompts.ab_testing` from configs/*.yaml:
+
+    prompts:
+      ab_testing:
+        enabled: true
+        traffic_split:
+          variant_a: 0.5
+          variant_b: 0.5
+        labels:                  # prompt label served per variant
+          variant_a: production  # (default: the variant name)
+          variant_b: variant-b
+
+A user (or session) is assigned by hashing its id together with the
+experiment name onto [0, 1) and picking the variant whose share of the
+split covers that point. Every process computes the same assignment
+without coordination, a user keeps its variant across requests, and
+different experiments split users independently. With two variants,
+changing the split only moves the users between the old and new boundary.
+
+Per-variant outcomes (requests, latency, tokens, cost, scores) are added to
+per-thread counters, so recording never takes a lock; stats() sums the
+threads' counters when read.
+
+Usage:
+
+    router = install_variant_router()
+    variant, prompt = router.get_prompt("customer-support-prompt", user_id)
+    ...
+    router.record(variant, latency_ms=..., tokens=..., cost=...)
+"""
+
+import hashlib
+import random
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import load_config
+
+_SCALE = float(1 << 64)
+
+_FIELDS = ("requests", "latency_ms", "tokens", "cost", "scores", "score_total")
+
+
+def bucket(unit_id: str, salt: str = "") -> float:
+    """Stable position of `unit_id` in [0, 1) for the experiment `salt`."""
+    digest = hashlib.blake2b(f"{salt}:{unit_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / _SCALE
+
+
+class VariantRouter:
+    """Assigns users to prompt variants and tracks per-variant outcomes."""
+
+    def __init__(self, traffic_split: Dict[str, float], labels: Optional[Dict[str, str]] = None):
+        if not traffic_split or any(share < 0 for share in traffic_split.values()):
+            raise ValueError(f"traffic_split needs non-negative shares, got {traffic_split}")
+        total = sum(traffic_split.values())
+        if total <= 0:
+            raise ValueError("traffic_split shares sum to 0")
+
+        self.variants: List[str] = list(traffic_split)
+        self.split = {variant: share / total for variant, share in traffic_split.items()}
+        self.labels = {variant: (labels or {}).get(variant, variant) for variant in self.variants}
+
+        # Upper boundary of each variant on [0, 1)
+        self._bounds: List[float] = []
+        upper = 0.0
+        for variant in self.variants:
+            upper += self.split[variant]
+            self._bounds.append(upper)
+        self._bounds[-1] = 1.0
+
+        self._local = threading.local()
+        self._shards: List[Dict[str, List[float]]] = []
+        self._shards_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, ab_cfg: Optional[Dict[str, Any]]) -> "VariantRouter":
+        ab_cfg = ab_cfg or {}
+        return cls(ab_cfg.get("traffic_split") or {"production": 1.0}, ab_cfg.get("labels"))
+
+    def assign(self, unit_id: Optional[str], experiment: str = "") -> str:
+        """The variant for a user/session id; random when there is no id."""
+        point = bucket(str(unit_id), experiment) if unit_id is not None else random.random()
+        return self.variants[bisect_right(self._bounds, point)]
+
+    def get_prompt(self, name: str, unit_id: Optional[str]) -> Tuple[str, Any]:
+        """(variant, prompt) for a user, served through the prompt cache."""
+        from prompt_cache import get_prompt
+
+        variant = self.assign(unit_id, experiment=name)
+        return variant, get_prompt(name, label=self.labels[variant])
+
+    def _shard(self) -> Dict[str, List[float]]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {variant: [0.0] * len(_FIELDS) for variant in self.variants}
+            self._local.shard = shard
+            # Once per thread; recording itself only touches this thread's shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, variant: str, latency_ms: float = 0.0, tokens: int = 0, cost: float = 0.0):
+        """Count one request served with `variant`."""
+        counters = self._shard()[variant]
+        counters[0] += 1
+        counters[1] += latency_ms
+        counters[2] += tokens
+        counters[3] += cost
+
+    def record_score(self, variant: str, value: float):
+        """Add an evaluation score for a request served with `variant`."""
+        counters = self._shard()[variant]
+        counters[4] += 1
+        counters[5] += value
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-variant totals and means over all threads."""
+        with self._shards_lock:
+            shards = list(self._shards)
+
+        stats = {}
+        for variant in self.variants:
+            totals = [sum(values) for values in zip(*(shard[variant] for shard in shards))] or [0.0] * len(_FIELDS)
+            requests, latency_ms, tokens, cost, scores, score_total = totals
+            stats[variant] = {
+                "label": self.labels[variant],
+                "share": self.split[variant],
+                "requests": int(requests),
+                "mean_latency_ms": latency_ms / requests if requests else 0.0,
+                "tokens": int(tokens),
+                "mean_tokens": tokens / requests if requests else 0.0,
+                "cost": cost,
+                "mean_cost": cost / requests if requests else 0.0,
+                "scores": int(scores),
+                "mean_score": score_total / scores if scores else None,
+            }
+        return stats
+
+
+_installed: Optional[VariantRouter] = None
+
+
+def install_variant_router(ab_cfg: Optional[Dict[str, Any]] = None) -> Optional[VariantRouter]:
+    """
+    Build the process-wide router from `prompts.ab_testing`.
+
+    Returns None when A/B testing is disabled.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if ab_cfg is None:
+        ab_cfg = (load_config().get("prompts") or {}).get("ab_testing") or {}
+    if not ab_cfg.get("enabled", False):
+        return None
+
+    _installed = VariantRouter.from_config(ab_cfg)
+    split = ", ".join(f"{v}={s:.0%} ({_installed.labels[v]})" for v, s in _installed.split.items())
+    print(f"Prompt A/B routing: {split}")
+    return _installed
+
+
+def variant_router() -> Optional[VariantRouter]:
+    """The installed router, if any."""
+    return _installed
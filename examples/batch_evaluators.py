@@ -0,0 +1,318 @@
+"""
+Deterministic batch evaluators for dataset experiments.
+
+Scores many outputs against their expected outputs in one vectorized step
+per metric, instead of one LLM judge call per item:
+
+- exact_match: normalized strings are equal (1.0 / 0.0)
+- token_f1: SQuAD-style token overlap F1; token counts of all pairs are
+  matched at once with numpy (unique/intersect over (row, token) keys)
+- rouge_l: F-measure of the longest common token subsequence; the LCS
+  tables of a whole chunk of pairs are filled one anti-diagonal at a time
+- embedding_similarity: cosine similarity of output and expected embeddings,
+  one batched embeddings request per `batch_size` texts and a row-wise
+  matrix product
+
+Text is normalized (lowercase, no punctuation, no articles, single spaces)
+before matching. Dict outputs/expected outputs are reduced to their
+"answer" / "output" / "text" field, or compared as canonical JSON.
+
+Configured by `evaluation.batch_evaluators` in configs/*.yaml:
+
+    evaluation:
+      batch_evaluators:
+        metrics: [exact_match, token_f1, rouge_l, embedding_similarity]
+        embedding_model: text-embedding-3-small
+        batch_size: 256
+
+Usage:
+
+    results = runner.run(dataset.items, task, run_name=..., store=store)
+    summary = get_batch_evaluator().score_results(dataset.items, results, store=store)
+"""
+
+import json
+import re
+import string
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import load_config
+import tail_sampling
+
+DEFAULT_METRICS = ("exact_match", "token_f1", "rouge_l")
+
+_ARTICLES = re.compile(r"\b(a|an|the)\b")
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+# Cells of the LCS tables filled per chunk (int32, so 16 MB)
+_LCS_CELLS_PER_CHUNK = 4_000_000
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and articles, collapse whitespace."""
+    return " ".join(_ARTICLES.sub(" ", text.lower().translate(_PUNCTUATION)).split())
+
+
+def as_text(value: Any) -> str:
+    """Text to evaluate for an output or expected output."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        for key in ("answer", "output", "text"):
+            if isinstance(value.get(key), str):
+                return value[key]
+        if len(value) == 1:
+            return as_text(next(iter(value.values())))
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class _Tokens:
+    """Normalized texts and token ids of both sides, over one shared vocabulary."""
+
+    def __init__(self, outputs: Sequence[str], expected: Sequence[str]):
+        self.outputs = [normalize(text) for text in outputs]
+        self.expected = [normalize(text) for text in expected]
+        vocabulary: Dict[str, int] = {}
+        self.output_ids = [[vocabulary.setdefault(t, len(vocabulary)) for t in text.split()] for text in self.outputs]
+        self.expected_ids = [[vocabulary.setdefault(t, len(vocabulary)) for t in text.split()]
+                             for text in self.expected]
+        self.vocabulary_size = max(1, len(vocabulary))
+
+
+def _tokens(outputs, expected) -> _Tokens:
+    return outputs if isinstance(outputs, _Tokens) else _Tokens(outputs, expected)
+
+
+def _counts(id_lists: List[List[int]], vocabulary_size: int):
+    """Per-row lengths plus unique (row, token) keys with their counts."""
+    lengths = np.fromiter(map(len, id_lists), dtype=np.int64, count=len(id_lists))
+    rows = np.repeat(np.arange(len(id_lists), dtype=np.int64), lengths)
+    tokens = np.fromiter(chain.from_iterable(id_lists), dtype=np.int64, count=int(lengths.sum()))
+    keys, counts = np.unique(rows * vocabulary_size + tokens, return_counts=True)
+    return lengths, keys, counts
+
+
+def _f_measure(overlap: np.ndarray, output_lengths: np.ndarray, expected_lengths: np.ndarray) -> np.ndarray:
+    precision = overlap / np.maximum(output_lengths, 1)
+    recall = overlap / np.maximum(expected_lengths, 1)
+    total = precision + recall
+    scores = np.divide(2 * precision * recall, total, out=np.zeros_like(total), where=total > 0)
+    # Two empty texts match perfectly
+    scores[(output_lengths == 0) & (expected_lengths == 0)] = 1.0
+    return scores
+
+
+def exact_match(outputs: Sequence[str], expected: Sequence[str] = ()) -> np.ndarray:
+    """1.0 where the normalized texts are equal."""
+    tokens = _tokens(outputs, expected)
+    return np.fromiter((o == e for o, e in zip(tokens.outputs, tokens.expected)),
+                       dtype=np.float64, count=len(tokens.outputs))
+
+
+def token_f1(outputs: Sequence[str], expected: Sequence[str] = ()) -> np.ndarray:
+    """Token overlap F1 of every output/expected pair."""
+    tokens = _tokens(outputs, expected)
+    vocabulary_size = tokens.vocabulary_size
+    output_lengths, output_keys, output_counts = _counts(tokens.output_ids, vocabulary_size)
+    expected_lengths, expected_keys, expected_counts = _counts(tokens.expected_ids, vocabulary_size)
+
+    common, in_output, in_expected = np.intersect1d(output_keys, expected_keys, assume_unique=True,
+                                                    return_indices=True)
+    overlap = np.bincount(common // vocabulary_size,
+                          weights=np.minimum(output_counts[in_output], expected_counts[in_expected]),
+                          minlength=len(output_lengths))
+    return _f_measure(overlap, output_lengths, expected_lengths)
+
+
+def _lcs_lengths(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """LCS length of each row pair of two padded token matrices."""
+    n, la = a.shape
+    lb = b.shape[1]
+    table = np.zeros((n, la + 1, lb + 1), dtype=np.int32)
+    # Cells on one anti-diagonal only depend on the two before it
+    for d in range(2, la + lb + 1):
+        i = np.arange(max(1, d - lb), min(la, d - 1) + 1)
+        j = d - i
+        match = a[:, i - 1] == b[:, j - 1]
+        table[:, i, j] = np.where(match, table[:, i - 1, j - 1] + 1,
+                                  np.maximum(table[:, i - 1, j], table[:, i, j - 1]))
+    return table[:, la, lb]
+
+
+def _padded(id_lists: List[List[int]], rows: Sequence[int], width: int, pad: int) -> np.ndarray:
+    matrix = np.full((len(rows), width), pad, dtype=np.int64)
+    for k, row in enumerate(rows):
+        matrix[k, :len(id_lists[row])] = id_lists[row]
+    return matrix
+
+
+def rouge_l(outputs: Sequence[str], expected: Sequence[str] = ()) -> np.ndarray:
+    """ROUGE-L F-measure (longest common token subsequence) of every pair."""
+    tokens = _tokens(outputs, expected)
+    output_ids, expected_ids = tokens.output_ids, tokens.expected_ids
+    output_lengths = np.fromiter(map(len, output_ids), dtype=np.int64, count=len(output_ids))
+    expected_lengths = np.fromiter(map(len, expected_ids), dtype=np.int64, count=len(expected_ids))
+    lcs = np.zeros(len(output_ids), dtype=np.float64)
+
+    # Pairs of similar size share a chunk, so little of each table is padding
+    order = np.lexsort((expected_lengths, output_lengths))
+    order = order[(output_lengths[order] > 0) & (expected_lengths[order] > 0)]
+    start = 0
+    while start < len(order):
+        end = start + 1
+        la, lb = int(output_lengths[order[start]]), int(expected_lengths[order[start]])
+        while end < len(order):
+            next_la = int(output_lengths[order[end]])
+            next_lb = max(lb, int(expected_lengths[order[end]]))
+            if (end - start + 1) * (next_la + 1) * (next_lb + 1) > _LCS_CELLS_PER_CHUNK:
+                break
+            la, lb = next_la, next_lb
+            end += 1
+        rows = order[start:end]
+        # Different pad values on both sides never match
+        lcs[rows] = _lcs_lengths(_padded(output_ids, rows, la, -1), _padded(expected_ids, rows, lb, -2))
+        start = end
+    return _f_measure(lcs, output_lengths, expected_lengths)
+
+
+def _openai_embed(model: str) -> Callable[[List[str]], List[List[float]]]:
+    def embed(texts: List[str]) -> List[List[float]]:
+        import openai
+
+        response = openai.embeddings.create(model=model, input=texts)
+        return [item.embedding for item in response.data]
+    return embed
+
+
+def embedding_similarity(outputs: Sequence[str], expected: Sequence[str],
+                         embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                         batch_size: int = 256, model: str = "text-embedding-3-small") -> np.ndarray:
+    """
+    Cosine similarity of output and expected embeddings, row by row.
+
+    Pairs with an empty (or whitespace-only) side score 0.0; empty texts are
+    never sent to `embed`, as the embeddings API rejects empty input.
+    """
+    embed = embed or _openai_embed(model)
+    scores = np.zeros(len(outputs), dtype=np.float32)
+    rows = [k for k, (output, exp) in enumerate(zip(outputs, expected)) if output.strip() and exp.strip()]
+    if not rows:
+        return scores
+    outputs = [outputs[k] for k in rows]
+    expected = [expected[k] for k in rows]
+    # Each distinct text is embedded once (expected outputs repeat a lot)
+    texts = list(dict.fromkeys(chain(outputs, expected)))
+    index = {text: k for k, text in enumerate(texts)}
+    vectors = np.asarray(
+        list(chain.from_iterable(embed(texts[k:k + batch_size]) for k in range(0, len(texts), batch_size))),
+        dtype=np.float32,
+    ).reshape(len(texts), -1)
+
+    a = vectors[[index[text] for text in outputs]]
+    b = vectors[[index[text] for text in expected]]
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    scores[rows] = np.einsum("ij,ij->i", a, b) / np.maximum(norms, 1e-12)
+    return scores
+
+
+METRICS = {
+    "exact_match": exact_match,
+    "token_f1": token_f1,
+    "rouge_l": rouge_l,
+    "embedding_similarity": embedding_similarity,
+}
+
+
+class BatchEvaluator:
+    """Scores experiment results with a set of batch metrics and writes the scores back."""
+
+    def __init__(self, metrics: Sequence[str] = DEFAULT_METRICS, embedding_model: str = "text-embedding-3-small",
+                 batch_size: int = 256, embed: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        unknown = [metric for metric in metrics if metric not in METRICS]
+        if unknown:
+            raise ValueError(f"Unknown metrics {unknown}; available: {sorted(METRICS)}")
+        self.metrics = list(metrics)
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.embed = embed
+
+    @classmethod
+    def from_config(cls, batch_cfg: Optional[Dict[str, Any]]) -> "BatchEvaluator":
+        batch_cfg = batch_cfg or {}
+        return cls(
+            metrics=batch_cfg.get("metrics") or DEFAULT_METRICS,
+            embedding_model=batch_cfg.get("embedding_model", "text-embedding-3-small"),
+            batch_size=batch_cfg.get("batch_size", 256),
+        )
+
+    def evaluate(self, outputs: Sequence[Any], expected: Sequence[Any]) -> Dict[str, np.ndarray]:
+        """Per-metric score arrays for aligned outputs and expected outputs."""
+        outputs = [as_text(value) for value in outputs]
+        expected = [as_text(value) for value in expected]
+        # Normalized and tokenized once for all text metrics
+        tokens = _Tokens(outputs, expected) if set(self.metrics) - {"embedding_similarity"} else None
+        scores = {}
+        for metric in self.metrics:
+            if metric == "embedding_similarity":
+                scores[metric] = embedding_similarity(outputs, expected, embed=self.embed,
+                                                      batch_size=self.batch_size, model=self.embedding_model)
+            else:
+                scores[metric] = METRICS[metric](tokens)
+        return scores
+
+    def score_results(self, items: Sequence[Any], results: Sequence[Dict[str, Any]], langfuse=None,
+                      store: Optional[Any] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Score ExperimentRunner results against their items' expected outputs.
+
+        Adds the scores to each result's "scores", writes them to the items'
+        traces (queued and sent in batches by the SDK; score ids are derived
+        from trace and metric, so writing again overwrites) and, with a
+        `store`, keeps them with the stored results. Stored results that
+        already carry all metrics are not written again. Failed results and
+        items without an expected output are not scored. Returns the mean
+        and count per metric.
+        """
+        if langfuse is None:
+            from tracing_utils import langfuse_client
+            langfuse = langfuse_client()
+
+        scored = [(item, result) for item, result in zip(items, results)
+                  if result["error"] is None and item.expected_output is not None]
+        if not scored:
+            return {}
+        scores = self.evaluate([result["output"] for _, result in scored],
+                               [item.expected_output for item, _ in scored])
+
+        written = 0
+        for k, (item, result) in enumerate(scored):
+            values = {metric: float(scores[metric][k]) for metric in self.metrics}
+            up_to_date = result.get("cached") and all(metric in result["scores"] for metric in self.metrics)
+            result["scores"].update(values)
+            if up_to_date or result["trace_id"] is None:
+                continue
+            for metric, value in values.items():
+                tail_sampling.create_score(langfuse, trace_id=result["trace_id"], name=metric, value=value,
+                                           data_type="NUMERIC", score_id=f"{result['trace_id']}-{metric}",
+                                           comment="batch evaluator")
+                written += 1
+            if store is not None:
+                store.add_scores(result["trace_id"], values)
+
+        summary = {metric: {"mean": float(values.mean()), "count": len(values)} for metric, values in scores.items()}
+        means = ", ".join(f"{metric}={stats['mean']:.3f}" for metric, stats in summary.items())
+        unscored = sum(result["error"] is None for result in results) - len(scored)
+        print(f"Batch evaluation of {len(scored)} results: {means} ({written} scores written"
+              + (f", {unscored} without expected output skipped)" if unscored else ")"))
+        return summary
+
+
+def get_batch_evaluator(**overrides) -> BatchEvaluator:
+    """Evaluator from the environment's `evaluation.batch_evaluators` config; keyword overrides win."""
+    batch_cfg = (load_config().get("evaluation") or {}).get("batch_evaluators") or {}
+    return BatchEvaluator.from_config({**batch_cfg, **overrides})
@@ -0,0 +1,223 @@
+"""
+Capture policy for span inputs, outputs and metadata.
+
+Applies the `observability` section of configs/*.yaml to trace payloads:
+
+    observability:
+      capture_inputs: true
+      capture_outputs: true
+      capture_metadata: true
+      capture_limits:
+        input_bytes: 16384       # per encoded field
+        output_bytes: 16384
+        metadata_bytes: 8192     # per metadata key
+        string_bytes: 4096       # per string inside a payload
+        truncate: head_tail      # head | tail | head_tail
+        hash_over_bytes: 262144  # larger payloads are replaced by a sha256 digest
+
+Without a `capture_limits` section nothing is truncated or hashed; within
+it, only the limits that are set apply.
+
+prepare() runs when tracing_utils applies deferred updates, i.e. only for
+spans that are recorded: it walks the payload once (string transforms such
+as PII masking, then per-string truncation), encodes it with the stdlib json
+encoder and enforces the field cap. A field over its cap is replaced by a
+JSON object marked `"truncated": true` that carries a cut preview of the
+encoded payload as a string, so the field stays valid JSON. mask() is the same walk without
+encoding, for use as the Langfuse client's `mask` hook on payloads captured
+by @observe or langfuse.openai. Sizes are measured in characters of the
+ASCII-escaped JSON, i.e. bytes on the wire.
+"""
+
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from langfuse._utils.serializer import EventSerializer
+
+from config import load_config
+
+FIELDS = ("input", "output", "metadata")
+TRUNCATE_MODES = ("head", "tail", "head_tail")
+
+
+class PreparedPayload(str):
+    """Encoded payload that already went through the policy; mask() skips it."""
+
+    __slots__ = ()
+
+
+def encode_payload(value: Any) -> str:
+    """JSON-encode like the SDK does, but in C for plain JSON-compatible data."""
+    try:
+        # EventSerializer.default only runs for values json can't encode natively
+        return json.dumps(value, default=EventSerializer().default, allow_nan=False)
+    except (TypeError, ValueError):
+        return json.dumps(value, cls=EventSerializer)
+
+
+def truncate_text(text: str, limit: int, mode: str = "head_tail") -> str:
+    """Cut `text` to about `limit` characters, marking what was removed."""
+    removed = len(text) - limit
+    if removed <= 0:
+        return text
+    marker = f"...[truncated {removed} chars]..."
+    if mode == "head":
+        return text[:limit] + marker
+    if mode == "tail":
+        return marker + text[-limit:]
+    half = limit // 2
+    return text[:half] + marker + text[len(text) - (limit - half):]
+
+
+def truncated_payload(encoded: str, limit: int, mode: str = "head_tail") -> str:
+    """Valid JSON of about `limit` characters standing in for an encoded payload over its cap."""
+    marked = {"truncated": True, "bytes": len(encoded)}
+    budget = limit - len(json.dumps({**marked, "preview": ""}))
+    while True:
+        result = json.dumps({**marked, "preview": truncate_text(encoded, max(budget, 0), mode)})
+        # The truncation marker and the escaping of the payload's quotes and
+        # backslashes add to the preview; shrink it by the overshoot until it fits
+        if len(result) <= limit or budget <= 0:
+            return result
+        budget -= len(result) - limit
+
+
+def digest_payload(encoded: str) -> str:
+    return json.dumps({
+        "omitted": "payload over hash_over_bytes",
+        "sha256": hashlib.sha256(encoded.encode("utf-8")).hexdigest(),
+        "bytes": len(encoded)
+    })
+
+
+class CapturePolicy:
+    """Decides what of each payload is captured and how large it may be."""
+
+    def __init__(self, capture_inputs: bool = True, capture_outputs: bool = True,
+                 capture_metadata: bool = True, field_bytes: Optional[Dict[str, int]] = None,
+                 string_bytes: Optional[int] = None, truncate: str = "head_tail",
+                 hash_over_bytes: Optional[int] = None):
+        if truncate not in TRUNCATE_MODES:
+            raise ValueError(f"truncate must be one of {TRUNCATE_MODES}, got {truncate!r}")
+
+        self.capture = {"input": capture_inputs, "output": capture_outputs, "metadata": capture_metadata}
+        self.field_bytes = dict(field_bytes or {})
+        self.string_bytes = string_bytes
+        self.truncate = truncate
+        self.hash_over_bytes = hash_over_bytes
+        self.string_transforms: List[Callable[[str], str]] = []
+
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    @classmethod
+    def from_config(cls, observability_cfg: Optional[Dict[str, Any]]) -> "CapturePolicy":
+        observability_cfg = observability_cfg or {}
+        limits = observability_cfg.get("capture_limits") or {}
+        return cls(
+            capture_inputs=observability_cfg.get("capture_inputs", True),
+            capture_outputs=observability_cfg.get("capture_outputs", True),
+            capture_metadata=observability_cfg.get("capture_metadata", True),
+            field_bytes={
+                field: int(limits[f"{field}_bytes"]) for field in FIELDS
+                if limits.get(f"{field}_bytes") is not None
+            },
+            string_bytes=int(limits["string_bytes"]) if limits.get("string_bytes") is not None else None,
+            truncate=limits.get("truncate", "head_tail"),
+            hash_over_bytes=int(limits["hash_over_bytes"]) if limits.get("hash_over_bytes") is not None else None,
+        )
+
+    def add_string_transform(self, transform: Callable[[str], str]):
+        """Run `transform` on every string in captured payloads (e.g. PII masking)."""
+        self.string_transforms.append(transform)
+
+    def captures(self, field: str) -> bool:
+        return self.capture.get(field, True)
+
+    # Payload processing
+
+    def _walk(self, value: Any, counters: Dict[str, int]) -> Any:
+        if isinstance(value, PreparedPayload):
+            return value
+        if isinstance(value, str):
+            for transform in self.string_transforms:
+                value = transform(value)
+            if self.string_bytes is not None and len(value) > self.string_bytes:
+                counters["strings_truncated"] += 1
+                counters["bytes_saved"] += len(value) - self.string_bytes
+                value = truncate_text(value, self.string_bytes, self.truncate)
+            return value
+        if isinstance(value, dict):
+            return {k: self._walk(v, counters) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._walk(v, counters) for v in value]
+        return value
+
+    def prepare(self, field: str, value: Any) -> Optional[str]:
+        """Policy-applied, encoded payload for one field, or None if not captured."""
+        if value is None or isinstance(value, PreparedPayload):
+            return value
+
+        counters: Dict[str, int] = defaultdict(int)
+        if not self.captures(field):
+            counters["dropped"] += 1
+            self._record(field, counters)
+            return None
+
+        walked = self._walk(value, counters)
+        encoded = walked if isinstance(walked, str) else encode_payload(walked)
+        counters["bytes_in"] += len(encoded) + counters["bytes_saved"]
+
+        limit = self.field_bytes.get(field)
+        if self.hash_over_bytes is not None and len(encoded) > self.hash_over_bytes:
+            counters["hashed"] += 1
+            result = digest_payload(encoded)
+        elif limit is not None and len(encoded) > limit:
+            counters["truncated"] += 1
+            result = truncated_payload(encoded, limit, self.truncate)
+        else:
+            result = encoded
+
+        counters["bytes_out"] += len(result)
+        counters["bytes_saved"] = counters["bytes_in"] - counters["bytes_out"]
+        self._record(field, counters)
+        return PreparedPayload(result)
+
+    def mask(self, *, data: Any, **kwargs) -> Any:
+        """Langfuse `mask` hook: transforms and per-string limits, structure kept."""
+        # Payloads from tracing_utils (and metadata dicts of them) are
+        # returned untouched by _walk
+        counters: Dict[str, int] = defaultdict(int)
+        masked = self._walk(data, counters)
+        if counters:
+            self._record("sdk_capture", counters)
+        return masked
+
+    def _record(self, field: str, counters: Dict[str, int]):
+        with self._lock:
+            for name, count in counters.items():
+                self._counters[field][name] += count
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-field counters: bytes_in/out/saved, truncated, hashed, dropped."""
+        with self._lock:
+            return {field: dict(counters) for field, counters in self._counters.items()}
+
+
+_policy: Optional[CapturePolicy] = None
+
+
+def get_capture_policy() -> CapturePolicy:
+    """Capture policy from the environment's `observability` config, built once."""
+    global _policy
+    if _policy is None:
+        _policy = CapturePolicy.from_config(load_config().get("observability"))
+    return _policy
+
+
+def set_capture_policy(policy: CapturePolicy):
+    global _policy
+    _policy = policy
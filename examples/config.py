@@ -0,0 +1,90 @@
+"""
+Environment configuration loader.
+
+Resolves `configs/<environment>.yaml` once per process. The environment is
+taken from the LANGFUSE_ENVIRONMENT variable (see .env.example) and defaults
+to `development`. `{{VAR}}` placeholders in string values are replaced with
+the environment variable of that name (empty when unset).
+
+langfuse_client_kwargs() maps the `langfuse` section to Langfuse client
+arguments; tracing_utils.init_client() builds the process-wide client from it.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs")
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+def substitute_env(value: Any) -> Any:
+    """Replace `{{VAR}}` in every string of a config value with $VAR."""
+    if isinstance(value, str):
+        return _PLACEHOLDER.sub(lambda m: os.getenv(m.group(1), ""), value)
+    if isinstance(value, dict):
+        return {k: substitute_env(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [substitute_env(v) for v in value]
+    return value
+
+
+@lru_cache(maxsize=None)
+def load_config(environment: Optional[str] = None) -> Dict[str, Any]:
+    """Load and cache the configuration for an environment."""
+    environment = environment or os.getenv("LANGFUSE_ENVIRONMENT", "development")
+    path = os.path.join(CONFIG_DIR, f"{environment}.yaml")
+
+    if not os.path.exists(path):
+        print(f"No config file for environment '{environment}', using defaults")
+        return {}
+
+    with open(path) as f:
+        return substitute_env(yaml.safe_load(f) or {})
+
+
+def langfuse_client_kwargs(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Langfuse() arguments for the `langfuse` section of a config.
+
+    `sdk.flush_interval` and `sdk.timeout` are in milliseconds in the config
+    files. Values the SDK also reads from environment variables (host, debug,
+    environment) are only passed when that variable is unset, so .env keeps
+    precedence.
+    """
+    config = load_config() if config is None else config
+    langfuse_cfg = config.get("langfuse") or {}
+    sdk = langfuse_cfg.get("sdk") or {}
+
+    kwargs: Dict[str, Any] = {}
+    if "batch_size" in sdk:
+        kwargs["flush_at"] = int(sdk["batch_size"])
+    if "flush_interval" in sdk:
+        kwargs["flush_interval"] = sdk["flush_interval"] / 1000
+    if "timeout" in sdk:
+        kwargs["timeout"] = max(1, round(sdk["timeout"] / 1000))
+    if "enabled" in sdk:
+        kwargs["tracing_enabled"] = bool(sdk["enabled"])
+    if "debug" in sdk and not os.getenv("LANGFUSE_DEBUG"):
+        kwargs["debug"] = bool(sdk["debug"])
+    if langfuse_cfg.get("host") and not os.getenv("LANGFUSE_HOST"):
+        kwargs["host"] = langfuse_cfg["host"]
+    if config.get("environment") and not os.getenv("LANGFUSE_TRACING_ENVIRONMENT"):
+        kwargs["environment"] = config["environment"]
+    return kwargs
+
+
+def default_trace_tags(config: Optional[Dict[str, Any]] = None) -> List[str]:
+    config = load_config() if config is None else config
+    return [str(tag) for tag in (config.get("langfuse") or {}).get("default_tags") or []]
+
+
+def default_trace_metadata(config: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """`langfuse.default_metadata`, without values whose placeholder was unset."""
+    config = load_config() if config is None else config
+    metadata = (config.get("langfuse") or {}).get("default_metadata") or {}
+    return {str(k): str(v) for k, v in metadata.items() if v not in (None, "")}
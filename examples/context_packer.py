@@ -0,0 +1,101 @@
+"""
+Token-budgeted context assembly for RAG prompts.
+
+Each retrieved chunk is tokenized once and its token count cached by document
+id. `pack()` then greedily fills a per-model token budget with the
+highest-scoring chunks and renders them into a single context string, so the
+generation prompt and the grounding check see exactly the same context.
+
+tiktoken is optional; without it token counts fall back to a
+4-characters-per-token estimate.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Context token budgets per generation model (prompt instructions excluded)
+DEFAULT_BUDGETS = {
+    "gpt-4o": 8000,
+    "gpt-4o-mini": 4000,
+}
+
+# "[Source N]: " prefix plus the separator between chunks
+CHUNK_OVERHEAD_TOKENS = 6
+
+
+class ContextPacker:
+    """Packs the best-scoring contexts into a per-model token budget."""
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None,
+                 default_budget: int = 4000, max_cache_entries: int = 100_000):
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self.default_budget = default_budget
+        self.max_cache_entries = max_cache_entries
+        self._token_cache: Dict[Any, int] = {}
+        self._encodings: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def budget_for(self, model: str) -> int:
+        """Token budget for the context section of a model's prompt."""
+        return self.budgets.get(model, self.default_budget)
+
+    def count_tokens(self, context: Dict[str, Any], model: str) -> int:
+        """Token count of a context's content, cached per document id."""
+        encoding = self._encoding(model)
+        key = (context['id'], encoding.name if encoding else None)
+
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            content = context['content']
+            tokens = len(encoding.encode(content)) if encoding else len(content) // 4 + 1
+            with self._lock:
+                if len(self._token_cache) >= self.max_cache_entries:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    self._token_cache.pop(next(iter(self._token_cache)))
+                self._token_cache[key] = tokens
+        return tokens
+
+    def pack(self, contexts: List[Dict[str, Any]], model: str,
+             budget: Optional[int] = None) -> Dict[str, Any]:
+        """Select the highest-scoring contexts that fit the budget and render them."""
+        budget = budget or self.budget_for(model)
+        ranked = sorted(contexts, key=lambda ctx: ctx.get('score', 0.0), reverse=True)
+
+        packed, dropped, used = [], [], 0
+        for ctx in ranked:
+            cost = self.count_tokens(ctx, model) + CHUNK_OVERHEAD_TOKENS
+            if used + cost <= budget:
+                packed.append(ctx)
+                used += cost
+            else:
+                dropped.append(ctx)
+
+        text = "\n\n".join(
+            f"[Source {i+1}]: {ctx['content']}" for i, ctx in enumerate(packed)
+        )
+
+        return {
+            "contexts": packed,
+            "text": text,
+            "tokens": used,
+            "budget": budget,
+            "dropped": [ctx['id'] for ctx in dropped]
+        }
+
+    def _encoding(self, model: str):
+        if tiktoken is None:
+            return None
+
+        encoding = self._encodings.get(model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            self._encodings[model] = encoding
+        return encoding
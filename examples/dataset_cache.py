@@ -0,0 +1,366 @@
+"""
+Local snapshot cache for Langfuse datasets.
+
+`langfuse.get_dataset()` downloads every item of a dataset on every call and
+keeps them all in memory. The cache keeps a snapshot of each dataset in a
+local SQLite file instead and serves items from it:
+
+- one cheap request (the first item of the newest-first item list, plus the
+  total count) tells whether the dataset changed since the last sync; an
+  unchanged dataset is served without downloading anything
+- when items were added, only the new pages are downloaded: the list is
+  ordered newest first, so the sync stops at the first item it already has
+- edits to older items and deletions are picked up by a full sync, which
+  runs every `full_sync_interval` seconds, when the item count does not add
+  up, or with refresh=True
+- pinned versions (`version=<datetime>`, items as they were at that time)
+  never change and are kept as their own snapshots
+- items are stored as compressed JSON and read lazily in chunks, so
+  iterating a dataset of hundreds of thousands of items starts immediately
+  and never holds the whole dataset in memory
+
+Configured by `evaluation.dataset_cache` in configs/*.yaml:
+
+    evaluation:
+      dataset_cache:
+        enabled: true
+        path: .langfuse_datasets/datasets.sqlite   # relative to the repo root
+        full_sync_interval: 21600                  # seconds
+
+Usage:
+
+    dataset = get_dataset("qa-evaluation-dataset")
+    for item in dataset.items:       # lazy, newest first like the API
+        ...
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+from langfuse._client.datasets import DatasetClient, DatasetItemClient
+from langfuse.api import Dataset, DatasetItem
+
+from config import CONFIG_DIR, load_config
+
+REPO_ROOT = os.path.dirname(CONFIG_DIR)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id             INTEGER PRIMARY KEY,
+    dataset        TEXT NOT NULL,
+    version        TEXT NOT NULL,
+    fingerprint    TEXT,
+    dataset_json   TEXT,
+    items          INTEGER NOT NULL DEFAULT 0,
+    synced_at      REAL NOT NULL DEFAULT 0,
+    full_synced_at REAL NOT NULL DEFAULT 0,
+    UNIQUE (dataset, version)
+);
+CREATE TABLE IF NOT EXISTS items (
+    snapshot_id INTEGER NOT NULL,
+    id          TEXT NOT NULL,
+    created_at  TEXT NOT NULL,
+    updated_at  TEXT NOT NULL,
+    data        BLOB NOT NULL,
+    PRIMARY KEY (snapshot_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS items_order ON items (snapshot_id, created_at DESC, id);
+"""
+
+# SQLite's default limit on bound parameters is 999
+_MAX_PARAMS = 900
+
+
+def _iso(value: Any) -> str:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+    return str(value)
+
+
+_ITEM_FIELDS = ("id", "status", "input", "expected_output", "metadata", "source_trace_id",
+                "source_observation_id", "dataset_id", "dataset_name", "created_at", "updated_at")
+
+
+def _encode(item: DatasetItem) -> bytes:
+    values = [getattr(item, field) for field in _ITEM_FIELDS]
+    return zlib.compress(json.dumps(values, default=_iso, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob: bytes) -> SimpleNamespace:
+    # DatasetItemClient only reads these attributes; skipping pydantic
+    # validation keeps iteration cheap
+    item = SimpleNamespace(**dict(zip(_ITEM_FIELDS, json.loads(zlib.decompress(blob)))))
+    item.created_at = datetime.fromisoformat(item.created_at)
+    item.updated_at = datetime.fromisoformat(item.updated_at)
+    return item
+
+
+def _fingerprint(head) -> str:
+    newest = head.data[0] if head.data else None
+    return json.dumps([head.meta.total_items, newest.id if newest else None,
+                       _iso(newest.updated_at) if newest else None])
+
+
+class CachedItems:
+    """Lazy, read-only sequence of a snapshot's items, newest first."""
+
+    def __init__(self, cache: "DatasetCache", snapshot_id: int, count: int, langfuse, chunk_size: int = 500):
+        self._cache = cache
+        self._snapshot_id = snapshot_id
+        self._count = count
+        self._langfuse = langfuse
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _client(self, blob: bytes) -> DatasetItemClient:
+        return DatasetItemClient(_decode(blob), langfuse=self._langfuse)
+
+    def __iter__(self) -> Iterator[DatasetItemClient]:
+        # Keyset pagination: each chunk is one short query, nothing stays open
+        # between chunks
+        last: Optional[tuple] = None
+        while True:
+            if last is None:
+                rows = self._cache._query(
+                    "SELECT created_at, id, data FROM items WHERE snapshot_id = ? "
+                    "ORDER BY created_at DESC, id LIMIT ?", (self._snapshot_id, self.chunk_size))
+            else:
+                rows = self._cache._query(
+                    "SELECT created_at, id, data FROM items WHERE snapshot_id = ? "
+                    "AND (created_at < ? OR (created_at = ? AND id > ?)) "
+                    "ORDER BY created_at DESC, id LIMIT ?",
+                    (self._snapshot_id, last[0], last[0], last[1], self.chunk_size))
+            for _, _, blob in rows:
+                yield self._client(blob)
+            if len(rows) < self.chunk_size:
+                return
+            last = rows[-1][:2]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                return list(self)[index]
+            rows = self._cache._query(
+                "SELECT data FROM items WHERE snapshot_id = ? ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+                (self._snapshot_id, max(0, stop - start), start))
+            return [self._client(blob) for (blob,) in rows]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("dataset item index out of range")
+        rows = self._cache._query(
+            "SELECT data FROM items WHERE snapshot_id = ? ORDER BY created_at DESC, id LIMIT 1 OFFSET ?",
+            (self._snapshot_id, index))
+        return self._client(rows[0][0])
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+
+class DatasetCache:
+    """Dataset snapshots in SQLite, synced incrementally from Langfuse."""
+
+    def __init__(self, path: str, full_sync_interval: float = 21600.0, page_size: int = 100, langfuse=None):
+        self.path = path
+        self.full_sync_interval = full_sync_interval
+        self.page_size = page_size
+        self._langfuse = langfuse
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA mmap_size=268435456")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, cache_cfg: Optional[Dict[str, Any]]) -> "DatasetCache":
+        cache_cfg = cache_cfg or {}
+        path = os.path.join(REPO_ROOT, cache_cfg.get("path", os.path.join(".langfuse_datasets", "datasets.sqlite")))
+        return cls(path, full_sync_interval=cache_cfg.get("full_sync_interval", 21600.0),
+                   page_size=cache_cfg.get("page_size", 100))
+
+    def _client(self):
+        if self._langfuse is None:
+            from tracing_utils import langfuse_client
+            return langfuse_client()
+        return self._langfuse
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _snapshot(self, name: str, version: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT id, fingerprint, dataset_json, items, synced_at, full_synced_at "
+                           "FROM snapshots WHERE dataset = ? AND version = ?", (name, version))
+        if not rows:
+            return None
+        snapshot_id, fingerprint, dataset_json, items, synced_at, full_synced_at = rows[0]
+        return {"id": snapshot_id, "fingerprint": fingerprint, "dataset": json.loads(dataset_json or "null"),
+                "items": items, "synced_at": synced_at, "full_synced_at": full_synced_at}
+
+    def _stored_versions(self, snapshot_id: int, ids: List[str]) -> Dict[str, str]:
+        stored = {}
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[start:start + _MAX_PARAMS]
+            stored.update(self._db.execute(
+                f"SELECT id, updated_at FROM items WHERE snapshot_id = ? AND id IN ({', '.join('?' * len(chunk))})",
+                [snapshot_id, *chunk]).fetchall())
+        return stored
+
+    def sync(self, name: str, version: Optional[datetime] = None, full: bool = False) -> Dict[str, Any]:
+        """
+        Bring the snapshot of `name` (at `version`) up to date.
+
+        Returns {"mode", "items", "fetched", "changed", "removed", "seconds"};
+        mode is "pinned", "unchanged", "incremental" or "full".
+        """
+        start = time.perf_counter()
+        key = _iso(version) if version is not None else ""
+        result = {"mode": "unchanged", "items": 0, "fetched": 0, "changed": 0, "removed": 0}
+
+        with self._lock:
+            snapshot = self._snapshot(name, key)
+            if snapshot is not None and version is not None and not full:
+                result.update(mode="pinned", items=snapshot["items"], seconds=time.perf_counter() - start)
+                return result
+
+            api = self._client().api
+            head = api.dataset_items.list(dataset_name=name, page=1, limit=1, version=version)
+            fingerprint = _fingerprint(head)
+            full = full or snapshot is None or time.time() - snapshot["full_synced_at"] >= self.full_sync_interval
+            if not full and fingerprint == snapshot["fingerprint"]:
+                result.update(items=snapshot["items"], seconds=time.perf_counter() - start)
+                return result
+
+            dataset = api.datasets.get(dataset_name=quote(name, safe=""))
+            if snapshot is None:
+                self._db.execute("INSERT INTO snapshots (dataset, version) VALUES (?, ?)", (name, key))
+                snapshot = self._snapshot(name, key)
+            snapshot_id = snapshot["id"]
+
+            try:
+                seen = self._download(api, name, version, snapshot_id, full, result)
+                if full:
+                    self._db.execute("CREATE TEMP TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)")
+                    self._db.execute("DELETE FROM seen")
+                    self._db.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((i,) for i in seen))
+                    result["removed"] = self._db.execute(
+                        "DELETE FROM items WHERE snapshot_id = ? AND id NOT IN (SELECT id FROM seen)",
+                        (snapshot_id,)).rowcount
+                count = self._db.execute("SELECT COUNT(*) FROM items WHERE snapshot_id = ?",
+                                         (snapshot_id,)).fetchone()[0]
+                if not full and count != head.meta.total_items:
+                    # Items were deleted (or the listing moved under us): start over
+                    self._db.commit()
+                    return self.sync(name, version, full=True)
+
+                now = time.time()
+                self._db.execute(
+                    "UPDATE snapshots SET fingerprint = ?, dataset_json = ?, items = ?, synced_at = ?, "
+                    "full_synced_at = CASE WHEN ? THEN ? ELSE full_synced_at END WHERE id = ?",
+                    (fingerprint, json.dumps(dataset.dict(by_alias=True), default=_iso), count, now,
+                     full, now, snapshot_id))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+        result.update(mode="full" if full else "incremental", items=count, seconds=time.perf_counter() - start)
+        return result
+
+    def _download(self, api, name: str, version: Optional[datetime], snapshot_id: int, full: bool,
+                  result: Dict[str, Any]) -> List[str]:
+        """Write new/changed items; returns the ids seen (all ids on a full sync)."""
+        seen: List[str] = []
+        page = 1
+        while True:
+            response = api.dataset_items.list(dataset_name=name, page=page, limit=self.page_size, version=version)
+            ids = [item.id for item in response.data]
+            stored = self._stored_versions(snapshot_id, ids)
+            changed = [item for item in response.data if stored.get(item.id) != _iso(item.updated_at)]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+                [(snapshot_id, item.id, _iso(item.created_at), _iso(item.updated_at), _encode(item))
+                 for item in changed])
+            result["fetched"] += len(ids)
+            result["changed"] += len(changed)
+            seen.extend(ids)
+
+            if page >= response.meta.total_pages or not ids:
+                return seen
+            # Newest first: past the first item we already have, the rest is stored
+            if not full and len(changed) < len(ids):
+                return seen
+            page += 1
+
+    def get_dataset(self, name: str, version: Optional[datetime] = None, refresh: bool = False) -> DatasetClient:
+        """The dataset with lazily loaded items, synced first (refresh=True forces a full sync)."""
+        result = self.sync(name, version, full=refresh)
+        print(f"Dataset '{name}': {result['items']} items ({result['mode']} sync, "
+              f"{result['changed']} downloaded, {result['removed']} removed, {result['seconds'] * 1000:.0f} ms)")
+        snapshot = self._snapshot(name, _iso(version) if version is not None else "")
+        items = CachedItems(self, snapshot["id"], snapshot["items"], self._client())
+        return DatasetClient(Dataset.parse_obj(snapshot["dataset"]), items=items, version=version)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop the snapshots of `name` (all datasets by default)."""
+        with self._lock:
+            where, params = ("WHERE dataset = ?", (name,)) if name is not None else ("", ())
+            ids = [row[0] for row in self._db.execute(f"SELECT id FROM snapshots {where}", params)]
+            self._db.executemany("DELETE FROM items WHERE snapshot_id = ?", ((i,) for i in ids))
+            self._db.execute(f"DELETE FROM snapshots {where}", params)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_installed: Optional[DatasetCache] = None
+
+
+def install_dataset_cache(cache_cfg: Optional[Dict[str, Any]] = None) -> Optional[DatasetCache]:
+    """
+    Open the process-wide cache from `evaluation.dataset_cache`.
+
+    Returns None when the cache is disabled.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if cache_cfg is None:
+        cache_cfg = (load_config().get("evaluation") or {}).get("dataset_cache") or {}
+    if not cache_cfg.get("enabled", False):
+        return None
+
+    _installed = DatasetCache.from_config(cache_cfg)
+    return _installed
+
+
+def dataset_cache() -> Optional[DatasetCache]:
+    """The installed cache, if any."""
+    return _installed
+
+
+def get_dataset(name: str, version: Optional[datetime] = None, refresh: bool = False) -> DatasetClient:
+    """Dataset through the configured cache; langfuse.get_dataset() when it is disabled."""
+    cache = install_dataset_cache()
+    if cache is None:
+        from tracing_utils import langfuse_client
+        return langfuse_client().get_dataset(name, version=version)
+    return cache.get_dataset(name, version=version, refresh=refresh)
@@ -0,0 +1,120 @@
+"""
+Evaluation sampling policy for LLM-as-a-Judge checks.
+
+Decides per trace whether the (expensive) judges should run, driven by the
+`evaluation.triggers` list in configs/*.yaml:
+
+- `random_sampling_<N>_percent`: rate-based sampling. The decision is a pure
+  function of the trace id hash, so every service and every retry of the same
+  trace agrees on it.
+- `on_error`: always evaluate traces whose pipeline failed.
+- `on_user_feedback_negative`: always evaluate traces with negative feedback.
+- Custom rules registered with `add_rule()`.
+
+The decision is returned as a dict that should be recorded on the trace.
+`weight` is the inverse sampling probability for traces in the random sample
+and 0 for traces that were only evaluated because a rule fired, so weighted
+aggregates stay unbiased even though rule-triggered traces are over-represented.
+"""
+
+import hashlib
+import re
+from typing import Any, Callable, Dict, Optional
+
+RATE_TRIGGER = re.compile(r"^random_sampling_(\d+(?:_\d+)?)_percent$")
+
+
+def hash_fraction(key: str) -> float:
+    """Map a key (e.g. a trace id) to a stable float in [0, 1)."""
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def _has_error(attributes: Dict[str, Any]) -> bool:
+    return bool(attributes.get("error"))
+
+
+def _has_negative_feedback(attributes: Dict[str, Any]) -> bool:
+    feedback = attributes.get("user_feedback")
+    if feedback is None:
+        return False
+    if isinstance(feedback, str):
+        return feedback.lower() in ("negative", "thumbs_down")
+    return feedback < 0
+
+
+BUILTIN_TRIGGERS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    "on_error": _has_error,
+    "on_user_feedback_negative": _has_negative_feedback,
+}
+
+
+class EvaluationSampler:
+    """Deterministic, trace-id based sampling of evaluation runs."""
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        rules: Optional[Dict[str, Callable[[Dict[str, Any]], bool]]] = None,
+        enabled: bool = True
+    ):
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Sampling rate must be between 0 and 1, got {rate}")
+
+        self.rate = rate
+        self.rules = dict(rules or {})
+        self.enabled = enabled
+
+    @classmethod
+    def from_config(cls, evaluation_config: Dict[str, Any]) -> "EvaluationSampler":
+        """
+        Build a sampler from the `evaluation` section of a config file.
+
+        Without a `triggers` list every trace is evaluated (development
+        behaviour); with one, only the listed triggers apply.
+        """
+        enabled = evaluation_config.get("enabled", True)
+        triggers = evaluation_config.get("triggers")
+        if triggers is None:
+            return cls(rate=1.0, enabled=enabled)
+
+        rate = 0.0
+        rules = {}
+        for trigger in triggers:
+            match = RATE_TRIGGER.match(trigger)
+            if match:
+                percent = float(match.group(1).replace("_", "."))
+                rate = max(rate, percent / 100)
+            elif trigger in BUILTIN_TRIGGERS:
+                rules[trigger] = BUILTIN_TRIGGERS[trigger]
+            else:
+                print(f"Unknown evaluation trigger '{trigger}', ignoring")
+
+        return cls(rate=rate, rules=rules, enabled=enabled)
+
+    def add_rule(self, name: str, predicate: Callable[[Dict[str, Any]], bool]):
+        """Register a rule that forces evaluation when it returns True."""
+        self.rules[name] = predicate
+
+    def decide(self, trace_id: str, attributes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Decide whether to run the judges for a trace."""
+        attributes = attributes or {}
+        in_random_sample = self.enabled and hash_fraction(trace_id) < self.rate
+
+        reason = None
+        if self.enabled:
+            for name, predicate in self.rules.items():
+                if predicate(attributes):
+                    reason = name
+                    break
+
+        if reason is None and in_random_sample:
+            reason = "random_sampling"
+
+        return {
+            "sampled": reason is not None,
+            "reason": reason or "not_sampled",
+            "rate": self.rate,
+            "weight": 1.0 / self.rate if in_random_sample else 0.0,
+            "in_random_sample": in_random_sample
+        }
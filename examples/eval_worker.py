@@ -0,0 +1,124 @@
+"""
+Background evaluation worker for off-critical-path quality checks.
+
+Evaluation jobs (hallucination checks, quality scoring, ...) are pushed onto a
+bounded queue and executed by a small pool of daemon threads. Each job carries
+the id of the trace it belongs to, so scores can be attached to the original
+trace after the user already received the response.
+
+- Bounded queue: `submit()` blocks when the queue is full (backpressure) and
+  drops the job after `submit_timeout` seconds instead of growing unbounded.
+- Graceful shutdown: `shutdown()` drains queued and in-flight jobs before the
+  worker threads exit.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+_STOP = object()
+
+
+class EvaluationWorker:
+    """Thread pool that runs evaluation jobs from a bounded queue."""
+
+    def __init__(
+        self,
+        num_workers: int = 4,
+        max_queue_size: int = 100,
+        submit_timeout: Optional[float] = 5.0,
+        name: str = "eval-worker"
+    ):
+        self.submit_timeout = submit_timeout
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        # Signalled whenever a worker takes an item off the queue; shares
+        # _lock so submit() checks _closed and enqueues atomically
+        self._space = threading.Condition(self._lock)
+        self._closed = False
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0}
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, trace_id: Optional[str], job: Callable[..., Any], *args, **kwargs) -> bool:
+        """
+        Queue a job for background execution.
+
+        Blocks while the queue is full. Returns False if the job was dropped
+        because the queue stayed full for `submit_timeout` seconds or the worker
+        is shutting down.
+        """
+        deadline = None if self.submit_timeout is None else time.monotonic() + self.submit_timeout
+        with self._space:
+            # Holding the lock keeps shutdown() from queuing its sentinels
+            # between the _closed check and the put
+            while not self._closed:
+                try:
+                    self._queue.put_nowait((trace_id, job, args, kwargs))
+                    self._stats["submitted"] += 1
+                    return True
+                except queue.Full:
+                    pass
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._space.wait(remaining)
+
+            closed = self._closed
+            self._stats["dropped"] += 1
+
+        if not closed:
+            print(f"Evaluation queue full, dropping job for trace {trace_id}")
+        return False
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Stop accepting jobs and wait until all queued jobs have finished."""
+        with self._space:
+            if self._closed:
+                return
+            self._closed = True
+            # Blocked submitters give up instead of racing the sentinels
+            self._space.notify_all()
+
+        # Sentinels are queued behind pending jobs, so everything is drained first
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """Return job counters and the current queue depth."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            with self._space:
+                self._space.notify()
+            try:
+                if item is _STOP:
+                    return
+
+                trace_id, job, args, kwargs = item
+                try:
+                    job(*args, **kwargs)
+                    self._count("completed")
+                except Exception as e:
+                    # A failing evaluation must never take down the worker
+                    print(f"Evaluation job failed for trace {trace_id}: {e}")
+                    self._count("failed")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,239 @@
+"""
+Parallel experiment runner for Langfuse datasets.
+
+Runs a task over dataset items on a bounded thread pool instead of one item
+at a time. Experiment runs mostly wait on the LLM, so the wall time drops
+roughly by the concurrency limit until a rate limit is reached.
+
+Configured by `evaluation.experiments` in configs/*.yaml:
+
+    evaluation:
+      experiments:
+        concurrency: 16            # items in flight
+        rate_limits:               # requests per minute per model
+          gpt-4o-mini: 500
+        progress_interval: 5       # seconds between progress lines
+
+- every item still runs inside its own `item.run(...)`, so each gets its own
+  trace linked to the dataset run; worker threads start with an empty
+  context, so items never nest under each other
+- per-model token buckets (RateLimiter) pace item starts; tasks that call
+  further models (e.g. a judge) can pace those with runner.acquire(model)
+- progress lines report done/total, errors, items/s and the ETA
+- results come back in item order; a failing item is reported in its result
+  and does not stop the run
+- items are consumed as they are needed (a few per worker ahead), so lazily
+  loaded datasets (dataset_cache.py) start running immediately
+- with an ExperimentStore (experiment_store.py), items whose stored result
+  still applies are linked to their original trace instead of running again
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from config import load_config
+import tail_sampling
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` acquisitions, in bursts of up to `burst`."""
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None):
+        if per_minute <= 0:
+            raise ValueError(f"per_minute must be positive, got {per_minute}")
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, int(self.rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class _ScoreRecorder:
+    """Root span stand-in that keeps the scores a task adds to the item's trace."""
+
+    def __init__(self, span):
+        self._span = span
+        self.scores: Dict[str, Any] = {}
+
+    def score_trace(self, *, name: str, value: Any, **kwargs):
+        self.scores[name] = value
+        # Through the tail sampler, which sends it only if the trace is kept
+        tail_sampling.create_score(trace_id=self._span.trace_id, name=name, value=value, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._span, name)
+
+
+def _ordered_map(pool: ThreadPoolExecutor, fn: Callable[[Any], Any], items: Iterable[Any],
+                 window: int) -> Iterator[Any]:
+    """pool.map() that only reads `window` items ahead of the oldest unfinished one."""
+    pending: deque = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class _Progress:
+    def __init__(self, run_name: str, total: Optional[int], interval: float):
+        self.run_name = run_name
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def item_done(self, failed: bool):
+        with self._lock:
+            self.done += 1
+            self.errors += failed
+            now = time.monotonic()
+            if self.done != self.total and now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            line = self.line(now)
+        print(line)
+
+    def line(self, now: float) -> str:
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        if self.total is None:
+            return (f"  [{self.run_name}] {self.done} items ({self.errors} errors), "
+                    f"{rate:.1f} items/s, elapsed {elapsed:.0f}s")
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        return (f"  [{self.run_name}] {self.done}/{self.total} items ({self.errors} errors), "
+                f"{rate:.1f} items/s, elapsed {elapsed:.0f}s, ETA {eta:.0f}s")
+
+
+class ExperimentRunner:
+    """Runs a task over dataset items with bounded concurrency and per-model rate limits."""
+
+    def __init__(self, concurrency: int = 8, rate_limits: Optional[Dict[str, float]] = None,
+                 progress_interval: float = 5.0):
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self._limiters = {model: RateLimiter(rpm) for model, rpm in (rate_limits or {}).items()}
+
+    @classmethod
+    def from_config(cls, experiments_cfg: Optional[Dict[str, Any]]) -> "ExperimentRunner":
+        experiments_cfg = experiments_cfg or {}
+        return cls(
+            concurrency=experiments_cfg.get("concurrency", 8),
+            rate_limits=experiments_cfg.get("rate_limits"),
+            progress_interval=experiments_cfg.get("progress_interval", 5.0),
+        )
+
+    def acquire(self, model: Optional[str]) -> float:
+        """Wait for the rate limit of `model` (no-op for models without one)."""
+        limiter = self._limiters.get(model)
+        return limiter.acquire() if limiter is not None else 0.0
+
+    def run(self, items: Iterable[Any], task: Callable[[Any, Any], Any], run_name: str,
+            run_description: Optional[str] = None, run_metadata: Optional[Dict[str, Any]] = None,
+            model: Optional[str] = None, store: Optional[Any] = None,
+            prompt_version: Any = None) -> List[Dict[str, Any]]:
+        """
+        Run `task(item, root_span)` for every dataset item inside `item.run()`.
+
+        `model` (default: run_metadata["model"]) selects the rate limit that
+        paces item starts. With a `store`, items with a stored result for
+        (model, prompt_version, run_metadata) are linked to the stored trace
+        instead of running. Returns one result per item, in item order:
+        {"item_id", "trace_id", "output", "scores", "error", "cached",
+        "latency_s", "rate_limited_s"}; `scores` are those the task added with
+        root_span.score_trace().
+        """
+        total = len(items) if hasattr(items, "__len__") else None
+        model = model or (run_metadata or {}).get("model")
+        progress = _Progress(run_name, total, self.progress_interval)
+        if store is not None:
+            from experiment_store import config_hash
+            config = config_hash(model, prompt_version, run_metadata)
+
+        def reuse_item(item) -> Optional[Dict[str, Any]]:
+            stored = store.get(item, config)
+            if stored is None:
+                return None
+            # Unless this very item is already part of the run
+            if stored["run_name"] != run_name or stored["item_id"] != item.id:
+                store.link(item, stored["trace_id"], run_name, run_description, run_metadata)
+            return {"item_id": item.id, "trace_id": stored["trace_id"], "output": stored["output"],
+                    "scores": stored["scores"], "error": None, "cached": True,
+                    "latency_s": 0.0, "rate_limited_s": 0.0}
+
+        def run_item(item) -> Dict[str, Any]:
+            if store is not None:
+                try:
+                    result = reuse_item(item)
+                except Exception as e:
+                    print(f"  [{run_name}] could not reuse the stored result of {item.id}: {e}")
+                    result = None
+                if result is not None:
+                    store.record(run_name, item, config, result)
+                    progress.item_done(False)
+                    return result
+
+            result = {"item_id": item.id, "trace_id": None, "output": None, "scores": {}, "error": None,
+                      "cached": False, "latency_s": 0.0, "rate_limited_s": self.acquire(model)}
+            start = time.perf_counter()
+            try:
+                with item.run(run_name=run_name, run_description=run_description,
+                              run_metadata=run_metadata) as root_span:
+                    result["trace_id"] = root_span.trace_id
+                    recorder = _ScoreRecorder(root_span)
+                    result["scores"] = recorder.scores
+                    try:
+                        result["output"] = task(item, recorder)
+                    except Exception as e:
+                        root_span.update(level="ERROR", status_message=str(e))
+                        raise
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            result["latency_s"] = time.perf_counter() - start
+            if store is not None:
+                if result["error"] is None:
+                    store.put(item, config, result["output"], result["scores"], result["trace_id"], run_name)
+                store.record(run_name, item, config, result)
+            progress.item_done(result["error"] is not None)
+            return result
+
+        print(f"Running '{run_name}' over {total if total is not None else 'streamed'} items "
+              f"(concurrency {self.concurrency}, model {model or '-'})")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="experiment") as pool:
+            results = list(_ordered_map(pool, run_item, items, window=self.concurrency * 4))
+        if not results:
+            print(f"  [{run_name}] no items")
+        elif store is not None:
+            reused = sum(1 for result in results if result["cached"])
+            print(f"  [{run_name}] {reused} of {len(results)} items reused from the result store")
+        return results
+
+
+def get_experiment_runner(**overrides) -> ExperimentRunner:
+    """Runner from the environment's `evaluation.experiments` config; keyword overrides win."""
+    experiments_cfg = (load_config().get("evaluation") or {}).get("experiments") or {}
+    return ExperimentRunner.from_config({**experiments_cfg, **overrides})
@@ -0,0 +1,246 @@
+"""
+Result store for incremental dataset experiment re-runs.
+
+Keeps the output, scores and trace of every successfully executed dataset
+item in a local SQLite file, keyed by
+
+- the item's content hash (input and expected_output; scores are computed
+  against the expected output, so changing it re-runs the item too)
+- the run configuration hash (model, prompt version, run_metadata)
+
+ExperimentRunner.run(..., store=store) looks every item up first. Items with
+a stored result are not executed again: the new dataset run links them to
+the trace of the original execution (which already carries their scores),
+and their result comes from the store. Only new items, changed items and
+items run under a different configuration are executed, so a re-run costs
+time in proportion to what changed. Failed items are never stored.
+
+Every run also records its items (trace, reused or not, error, scores) by
+run name, which scripts/compare_experiments.py reads to compare runs.
+
+Configured by `evaluation.experiments.store` in configs/*.yaml:
+
+    evaluation:
+      experiments:
+        store:
+          enabled: true
+          path: .langfuse_experiments/results.sqlite   # relative to the repo root
+
+Usage:
+
+    store = install_experiment_store()
+    results = get_experiment_runner().run(dataset.items, task, run_name=...,
+                                          run_metadata={"model": "gpt-4o-mini"}, store=store)
+    store.invalidate(item_ids=[...])   # force items to run again
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from langfuse.api import CreateDatasetRunItemRequest
+
+from config import CONFIG_DIR, load_config
+
+REPO_ROOT = os.path.dirname(CONFIG_DIR)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    item_hash   TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    item_id     TEXT NOT NULL,
+    output      TEXT,
+    scores      TEXT NOT NULL,
+    trace_id    TEXT,
+    run_name    TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (item_hash, config_hash)
+);
+CREATE INDEX IF NOT EXISTS results_item_id ON results (item_id);
+CREATE INDEX IF NOT EXISTS results_trace_id ON results (trace_id);
+CREATE TABLE IF NOT EXISTS run_items (
+    run_name    TEXT NOT NULL,
+    item_id     TEXT NOT NULL,
+    item_hash   TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    trace_id    TEXT,
+    cached      INTEGER NOT NULL,
+    error       TEXT,
+    scores      TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (run_name, item_id)
+);
+CREATE INDEX IF NOT EXISTS run_items_trace_id ON run_items (trace_id);
+"""
+
+
+def _hash(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def item_hash(item: Any) -> str:
+    """Content hash of a dataset item (input and expected_output)."""
+    return _hash([item.input, item.expected_output])
+
+
+def config_hash(model: Optional[str] = None, prompt_version: Any = None,
+                run_metadata: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of the settings that decide an item's result."""
+    return _hash({"model": model, "prompt_version": prompt_version, "run_metadata": run_metadata or {}})
+
+
+class ExperimentStore:
+    """Stored item results by (item content, run configuration)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Worker threads share one connection; the lock serialises its use
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def get(self, item: Any, config: str) -> Optional[Dict[str, Any]]:
+        """Stored result of `item` under the configuration hash `config`, if any."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT item_id, output, scores, trace_id, run_name, created_at FROM results "
+                "WHERE item_hash = ? AND config_hash = ?",
+                (item_hash(item), config),
+            ).fetchone()
+        if row is None:
+            return None
+        item_id, output, scores, trace_id, run_name, created_at = row
+        return {"item_id": item_id, "output": json.loads(output), "scores": json.loads(scores),
+                "trace_id": trace_id, "run_name": run_name, "created_at": created_at}
+
+    def put(self, item: Any, config: str, output: Any, scores: Optional[Dict[str, Any]],
+            trace_id: Optional[str], run_name: str):
+        """Store the result of a successful execution of `item`."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (item_hash(item), config, item.id, json.dumps(output, default=str),
+                 json.dumps(scores or {}, default=str), trace_id, run_name, time.time()),
+            )
+            self._db.commit()
+
+    def record(self, run_name: str, item: Any, config: str, result: Dict[str, Any]):
+        """Record an item's result (executed, reused or failed) as part of the run `run_name`."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO run_items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_name, item.id, item_hash(item), config, result["trace_id"], int(result["cached"]),
+                 result["error"], json.dumps(result["scores"] or {}, default=str), time.time()),
+            )
+            self._db.commit()
+
+    def add_scores(self, trace_id: str, scores: Dict[str, Any]):
+        """Merge scores computed later (e.g. batch evaluators) into everything recorded for `trace_id`."""
+        with self._lock:
+            for table in ("results", "run_items"):
+                rows = self._db.execute(f"SELECT rowid, scores FROM {table} WHERE trace_id = ?",
+                                        (trace_id,)).fetchall()
+                for rowid, stored in rows:
+                    merged = {**json.loads(stored), **scores}
+                    self._db.execute(f"UPDATE {table} SET scores = ? WHERE rowid = ?",
+                                     (json.dumps(merged, default=str), rowid))
+            self._db.commit()
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """Recorded runs, oldest first."""
+        rows = self._query(
+            "SELECT run_name, COUNT(*), SUM(cached), SUM(error IS NOT NULL), MIN(created_at), MAX(created_at) "
+            "FROM run_items GROUP BY run_name ORDER BY MIN(created_at)")
+        return [{"run_name": run_name, "items": items, "reused": reused, "errors": errors,
+                 "started_at": started_at, "finished_at": finished_at}
+                for run_name, items, reused, errors, started_at, finished_at in rows]
+
+    def run_items(self, run_name: str) -> List[Dict[str, Any]]:
+        """The recorded items of a run."""
+        rows = self._query("SELECT item_id, item_hash, config_hash, trace_id, cached, error, scores "
+                           "FROM run_items WHERE run_name = ? ORDER BY created_at", (run_name,))
+        return [{"item_id": item_id, "item_hash": item_hash, "config_hash": config_hash, "trace_id": trace_id,
+                 "cached": bool(cached), "error": error, "scores": json.loads(scores)}
+                for item_id, item_hash, config_hash, trace_id, cached, error, scores in rows]
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def invalidate(self, item_ids: Optional[Iterable[str]] = None, config: Optional[str] = None) -> int:
+        """Drop stored results (of some items and/or one configuration; all by default)."""
+        query, params = "DELETE FROM results", []
+        conditions = []
+        if item_ids is not None:
+            item_ids = list(item_ids)
+            conditions.append(f"item_id IN ({', '.join('?' * len(item_ids))})" if item_ids else "0")
+            params.extend(item_ids)
+        if config is not None:
+            conditions.append("config_hash = ?")
+            params.append(config)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            deleted = self._db.execute(query, params).rowcount
+            self._db.commit()
+        return deleted
+
+    def link(self, item: Any, trace_id: str, run_name: str, run_description: Optional[str] = None,
+             run_metadata: Optional[Dict[str, Any]] = None):
+        """Add `item` to the dataset run `run_name` with the trace of a stored result."""
+        item.langfuse.api.dataset_run_items.create(
+            request=CreateDatasetRunItemRequest(
+                runName=run_name,
+                datasetItemId=item.id,
+                traceId=trace_id,
+                metadata=run_metadata,
+                runDescription=run_description,
+            )
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_installed: Optional[ExperimentStore] = None
+
+
+def install_experiment_store(store_cfg: Optional[Dict[str, Any]] = None) -> Optional[ExperimentStore]:
+    """
+    Open the process-wide store from `evaluation.experiments.store`.
+
+    Returns None when the store is disabled.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if store_cfg is None:
+        experiments_cfg = (load_config().get("evaluation") or {}).get("experiments") or {}
+        store_cfg = experiments_cfg.get("store") or {}
+    if not store_cfg.get("enabled", False):
+        return None
+
+    path = os.path.join(REPO_ROOT, store_cfg.get("path", os.path.join(".langfuse_experiments", "results.sqlite")))
+    _installed = ExperimentStore(path)
+    print(f"Experiment result store: {len(_installed)} stored results in {path}")
+    return _installed
+
+
+def experiment_store() -> Optional[ExperimentStore]:
+    """The installed store, if any."""
+    return _installed
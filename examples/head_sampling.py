@@ -0,0 +1,178 @@
+"""
+Config-driven head sampling for traces.
+
+Reads `langfuse.sampling` from configs/*.yaml:
+
+    sampling:
+      enabled: true
+      rate: 0.1            # default share of traces kept
+      routes:              # per root span name (the @observe'd entry point)
+        query: 0.25
+      tags:                # per tag set with sampling_hints(tags=[...])
+        vip: 1.0
+
+The decision is made once per trace, when its root span starts, from the
+trace id alone (same rule as OpenTelemetry's TraceIdRatioBased), so every
+service that sees the same trace id at the same rate agrees. Child spans,
+including `langfuse.openai` generations, follow their parent's decision.
+Unsampled traces get non-recording spans: the SDK skips attribute
+serialization for them and tracing_utils.update_span() returns immediately.
+
+install_head_sampler() must run before the first Langfuse client is created;
+the SDK adopts the globally installed tracer provider.
+"""
+
+import contextlib
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.sampling import Decision, ParentBased, Sampler, SamplingResult
+
+from config import load_config
+
+# Attribute recorded on sampled root spans so counts can be re-weighted
+SAMPLING_RATE_ATTRIBUTE = "sampling.rate"
+
+_TRACE_ID_LIMIT = (1 << 64) - 1
+
+_hints: contextvars.ContextVar[Optional[Dict[str, object]]] = contextvars.ContextVar(
+    "head_sampling_hints", default=None
+)
+
+
+@contextlib.contextmanager
+def sampling_hints(route: Optional[str] = None, tags: Optional[Iterable[str]] = None):
+    """
+    Route and tags for traces started inside the block.
+
+    Tags are normally attached after the root span exists, too late for a
+    head decision, so tag-based rates need them up front:
+
+        with sampling_hints(tags=["vip"]):
+            rag.query(question)
+    """
+    token = _hints.set({"route": route, "tags": list(tags or [])})
+    try:
+        yield
+    finally:
+        _hints.reset(token)
+
+
+class HeadSampler(Sampler):
+    """Trace-id ratio sampler with per-route and per-tag rates."""
+
+    def __init__(self, rate: float = 1.0, route_rates: Optional[Dict[str, float]] = None,
+                 tag_rates: Optional[Dict[str, float]] = None, max_remembered: int = 100_000):
+        self.rate = rate
+        self.route_rates = dict(route_rates or {})
+        self.tag_rates = dict(tag_rates or {})
+        self.max_remembered = max_remembered
+        # trace id -> rate of recent root decisions. The SDK samples scores by
+        # asking the sampler again with only the trace id, so they have to
+        # resolve to the rate their trace was started with.
+        self._decisions: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, sampling_cfg: Optional[Dict]) -> Optional["HeadSampler"]:
+        """Build from `langfuse.sampling`; None when sampling is disabled."""
+        sampling_cfg = sampling_cfg or {}
+        if not sampling_cfg.get("enabled", False):
+            return None
+        return cls(
+            rate=float(sampling_cfg.get("rate", 1.0)),
+            route_rates={k: float(v) for k, v in (sampling_cfg.get("routes") or {}).items()},
+            tag_rates={k: float(v) for k, v in (sampling_cfg.get("tags") or {}).items()},
+        )
+
+    def rate_for(self, route: Optional[str], tags: Iterable[str] = ()) -> float:
+        """Route rate if configured, raised to the highest matching tag rate."""
+        rate = self.route_rates.get(route, self.rate) if route else self.rate
+        for tag in tags:
+            if tag in self.tag_rates:
+                rate = max(rate, self.tag_rates[tag])
+        return rate
+
+    @staticmethod
+    def keep(trace_id: int, rate: float) -> bool:
+        """Deterministic keep decision, compatible with TraceIdRatioBased."""
+        return (trace_id & _TRACE_ID_LIMIT) < round(rate * (_TRACE_ID_LIMIT + 1))
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None,
+                      links=None, trace_state=None) -> SamplingResult:
+        with self._lock:
+            rate = self._decisions.get(trace_id)
+
+        if rate is None:
+            hints = _hints.get() or {}
+            rate = self.rate_for(hints.get("route") or name, hints.get("tags", ()))
+            with self._lock:
+                self._decisions[trace_id] = rate
+                if len(self._decisions) > self.max_remembered:
+                    self._decisions.popitem(last=False)
+
+        if self.keep(trace_id, rate):
+            return SamplingResult(
+                Decision.RECORD_AND_SAMPLE,
+                {**(attributes or {}), SAMPLING_RATE_ATTRIBUTE: rate},
+                _trace_state(parent_context)
+            )
+        return SamplingResult(Decision.DROP, None, _trace_state(parent_context))
+
+    def get_description(self) -> str:
+        return f"HeadSampler{{rate={self.rate}, routes={self.route_rates}, tags={self.tag_rates}}}"
+
+
+def trace_sampled_out() -> bool:
+    """True inside a trace that exists but was dropped by the sampler."""
+    span = otel_trace.get_current_span()
+    return span.get_span_context().is_valid and not span.is_recording()
+
+
+def _trace_state(parent_context):
+    parent = otel_trace.get_current_span(parent_context).get_span_context()
+    return parent.trace_state if parent.is_valid else None
+
+
+_installed: Optional[HeadSampler] = None
+
+
+def install_head_sampler(sampling_cfg: Optional[Dict] = None) -> Optional[HeadSampler]:
+    """
+    Install the configured head sampler as the global tracer provider.
+
+    Reads `langfuse.sampling` from the environment's config when
+    `sampling_cfg` is not given. Returns the sampler, or None when sampling is
+    disabled or another tracer provider is already installed.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if sampling_cfg is None:
+        sampling_cfg = (load_config().get("langfuse") or {}).get("sampling")
+    sampler = HeadSampler.from_config(sampling_cfg)
+    if sampler is None:
+        return None
+
+    if not isinstance(otel_trace.get_tracer_provider(), otel_trace.ProxyTracerProvider):
+        print("Tracer provider already initialized; head sampling config not applied")
+        return None
+
+    # Same resource attributes the SDK puts on the provider it creates itself
+    resource = Resource.create({
+        key: value for key, value in {
+            "langfuse.environment": os.getenv("LANGFUSE_TRACING_ENVIRONMENT"),
+            "langfuse.release": os.getenv("LANGFUSE_RELEASE"),
+        }.items() if value
+    })
+    otel_trace.set_tracer_provider(TracerProvider(resource=resource, sampler=ParentBased(root=sampler)))
+    _installed = sampler
+    print(f"Head sampling enabled: {sampler.get_description()}")
+    return sampler
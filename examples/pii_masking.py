@@ -0,0 +1,342 @@
+"""
+PII masking for trace payloads.
+
+Implements `observability.pii_masking` from configs/*.yaml:
+
+    observability:
+      pii_masking:
+        enabled: true
+        mode: inline           # inline | export
+        fields:
+          - email
+          - phone
+          - ssn
+          - credit_card
+
+All configured detectors are compiled into one scanner with a named group
+per detector, so each string is scanned once instead of once per field.
+Most of the cost of a regex scan is trying every position of the text; the
+scanner keeps that cheap by only running the email alternative on strings
+that contain an '@' and otherwise running a digit-led variant whose
+positions are rejected on their first character. Card numbers are
+Luhn-checked before they are replaced.
+
+Two modes:
+
+- inline: registered as a string transform on the capture policy
+  (capture_policy.py), so masking happens in the same single walk that
+  applies the capture limits, both for tracing_utils updates and for
+  payloads captured by @observe through the client's `mask` hook
+- export: masking moves off the request path into the exporter thread;
+  MaskingSpanExporter masks the payload attributes of each batch of queued
+  spans with one mask_batch() call before they are sent
+
+See scripts/benchmark_pii_masking.py for throughput in MB/s.
+"""
+
+import json
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from config import load_config
+from tail_sampling import tail_sampler
+
+# Priority order: at a given position the first matching detector wins, so
+# card numbers are tried before the (shorter) phone numbers they contain
+DETECTORS = {
+    "email": r"[\w.%+-]+@(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,}\b",
+    "ssn": r"\b\d{3}-\d{2}-\d{4}\b",
+    "credit_card": r"\b\d(?:[ -]?\d){12,18}\b",
+    "phone": r"(?<![\w+])(?:\+\d{1,3}[-.\s]?)?(?:\(\d{3}\)\s?|\d{3}[-.\s]?)\d{3}[-.\s]?\d{4}\b",
+}
+
+REPLACEMENTS = {
+    "email": "[EMAIL]",
+    "ssn": "[SSN]",
+    "credit_card": "[CREDIT_CARD]",
+    "phone": "[PHONE]",
+}
+
+MODES = ("inline", "export")
+
+# Detectors that can only match around an '@'; all others start with a digit,
+# '(' or '+'
+_AT_DETECTORS = ("email",)
+_DIGIT_LED = r"(?=[\d(+])"
+
+# Joins the strings of a batch; no detector matches across it
+_SEPARATOR = "\x00"
+
+# Span attributes holding encoded payloads (metadata also per key: "<prefix>.<key>")
+PAYLOAD_ATTRIBUTES = (
+    "langfuse.observation.input",
+    "langfuse.observation.output",
+    "langfuse.observation.metadata",
+    "langfuse.trace.input",
+    "langfuse.trace.output",
+    "langfuse.trace.metadata",
+)
+
+
+def luhn_valid(number: str) -> bool:
+    """Luhn checksum of the digits in `number`."""
+    total = 0
+    for i, ch in enumerate(reversed([c for c in number if c.isdigit()])):
+        digit = ord(ch) - 48
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def _compile(fields: Sequence[str], prefix: str = "") -> Optional["re.Pattern[str]"]:
+    if not fields:
+        return None
+    return re.compile(prefix + "(?:" + "|".join(f"(?P<{f}>{DETECTORS[f]})" for f in fields) + ")")
+
+
+class PIIMasker:
+    """Replaces emails, phone numbers, SSNs and card numbers in strings and payloads."""
+
+    def __init__(self, fields: Iterable[str] = tuple(DETECTORS), validate_cards: bool = True):
+        fields = set(fields)
+        unknown = fields - set(DETECTORS)
+        if unknown:
+            raise ValueError(f"Unknown PII fields {sorted(unknown)}; supported: {list(DETECTORS)}")
+
+        self.fields = [field for field in DETECTORS if field in fields]
+        self.validate_cards = validate_cards
+
+        digit_fields = [field for field in self.fields if field not in _AT_DETECTORS]
+        self._digit_scanner = _compile(digit_fields, _DIGIT_LED)
+        self._full_scanner = (_compile(self.fields) if len(digit_fields) < len(self.fields)
+                              else self._digit_scanner)
+
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+
+    @classmethod
+    def from_config(cls, pii_cfg: Optional[Dict[str, Any]]) -> "PIIMasker":
+        pii_cfg = pii_cfg or {}
+        return cls(
+            fields=pii_cfg.get("fields") or tuple(DETECTORS),
+            validate_cards=pii_cfg.get("validate_cards", True),
+        )
+
+    def _replace(self, match: "re.Match[str]") -> str:
+        field = match.lastgroup
+        if field == "credit_card" and self.validate_cards and not luhn_valid(match.group()):
+            return match.group()
+        with self._lock:
+            self._counters[field] += 1
+        return REPLACEMENTS[field]
+
+    def mask_text(self, text: str) -> str:
+        """`text` with every detected value replaced by its placeholder."""
+        scanner = self._full_scanner if "@" in text else self._digit_scanner
+        with self._lock:
+            self._counters["chars_scanned"] += len(text)
+        if scanner is None:
+            return text
+        return scanner.sub(self._replace, text)
+
+    def mask(self, value: Any) -> Any:
+        """Mask every string in a nested payload; dict keys are kept."""
+        if isinstance(value, str):
+            return self.mask_text(value)
+        if isinstance(value, dict):
+            return {k: self.mask(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.mask(v) for v in value]
+        return value
+
+    def mask_batch(self, payloads: Sequence[Any]) -> List[Any]:
+        """
+        Mask many payloads with a single scan.
+
+        The strings of all payloads are joined and scanned in one call per
+        scanner (strings with an '@' and strings without), which saves the
+        per-call overhead when a batch holds many short strings.
+        """
+        strings: List[str] = []
+        for payload in payloads:
+            _collect_strings(payload, strings)
+        if not strings:
+            return list(payloads)
+
+        masked: List[Optional[str]] = [None] * len(strings)
+        with_at = [i for i, s in enumerate(strings) if "@" in s]
+        groups = (with_at, [i for i, s in enumerate(strings) if "@" not in s]) if with_at else (range(len(strings)),)
+        for indices in groups:
+            for i, text in zip(indices, self._mask_joined([strings[i] for i in indices])):
+                masked[i] = text
+
+        masked_iter = iter(masked)
+        return [_replace_strings(payload, masked_iter) for payload in payloads]
+
+    def _mask_joined(self, strings: List[str]) -> List[str]:
+        if not strings:
+            return []
+        joined = _SEPARATOR.join(strings)
+        if joined.count(_SEPARATOR) != len(strings) - 1:
+            # A string contains the separator itself; scan them one by one
+            return [self.mask_text(s) for s in strings]
+        return self.mask_text(joined).split(_SEPARATOR)
+
+    def stats(self) -> Dict[str, int]:
+        """Matches per detector and characters scanned."""
+        with self._lock:
+            return dict(self._counters)
+
+
+def _collect_strings(value: Any, out: List[str]):
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_strings(v, out)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _collect_strings(v, out)
+
+
+def _replace_strings(value: Any, masked: Iterator[str]) -> Any:
+    if isinstance(value, str):
+        return next(masked)
+    if isinstance(value, dict):
+        return {k: _replace_strings(v, masked) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_strings(v, masked) for v in value]
+    return value
+
+
+class MaskingSpanExporter(SpanExporter):
+    """Masks payload attributes of each exported batch, then hands it to `delegate`."""
+
+    def __init__(self, delegate: SpanExporter, masker: PIIMasker):
+        self.delegate = delegate
+        self.masker = masker
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        locations = []
+        decoded = []
+        for i, span in enumerate(spans):
+            for key, value in (span.attributes or {}).items():
+                if isinstance(value, str) and key.startswith(PAYLOAD_ATTRIBUTES):
+                    # Payloads are JSON; mask the decoded strings so escapes
+                    # such as "\n" in front of a number don't hide it
+                    try:
+                        decoded.append(json.loads(value))
+                        locations.append((i, key, True))
+                    except ValueError:
+                        decoded.append(value)
+                        locations.append((i, key, False))
+
+        if not decoded:
+            return self.delegate.export(spans)
+
+        changes: Dict[int, Dict[str, str]] = defaultdict(dict)
+        for (i, key, is_json), before, after in zip(locations, decoded, self.masker.mask_batch(decoded)):
+            if after != before:
+                changes[i][key] = json.dumps(after) if is_json else after
+
+        return self.delegate.export([
+            _with_attributes(span, changes[i]) if i in changes else span
+            for i, span in enumerate(spans)
+        ])
+
+    def shutdown(self):
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+
+def _with_attributes(span: ReadableSpan, changes: Dict[str, str]) -> ReadableSpan:
+    return ReadableSpan(
+        name=span.name,
+        context=span.context,
+        parent=span.parent,
+        resource=span.resource,
+        attributes={**span.attributes, **changes},
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+_installed: Optional[PIIMasker] = None
+
+
+def install_pii_masking(pii_cfg: Optional[Dict[str, Any]] = None) -> Optional[PIIMasker]:
+    """
+    Enable the configured PII masking.
+
+    Reads `observability.pii_masking` from the environment's config when
+    `pii_cfg` is not given. Export mode wraps the Langfuse span exporter and
+    creates the client if needed. Returns the masker, or None when masking
+    is disabled or could not be installed.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if pii_cfg is None:
+        pii_cfg = (load_config().get("observability") or {}).get("pii_masking") or {}
+    if not pii_cfg.get("enabled", False):
+        return None
+
+    mode = pii_cfg.get("mode", "inline")
+    if mode not in MODES:
+        raise ValueError(f"pii_masking.mode must be one of {MODES}, got {mode!r}")
+    masker = PIIMasker.from_config(pii_cfg)
+
+    if mode == "inline":
+        from capture_policy import get_capture_policy
+        get_capture_policy().add_string_transform(masker.mask_text)
+    elif not _wrap_langfuse_exporter(masker):
+        print("No Langfuse span exporter found; PII masking not applied")
+        return None
+
+    _installed = masker
+    print(f"PII masking enabled ({mode}): {', '.join(masker.fields)}")
+    return masker
+
+
+def _wrap_langfuse_exporter(masker: PIIMasker) -> bool:
+    from langfuse._client.span_processor import LangfuseSpanProcessor
+    from tracing_utils import langfuse_client
+
+    langfuse_client()
+    multi = getattr(otel_trace.get_tracer_provider(), "_active_span_processor", None)
+    for processor in getattr(multi, "_span_processors", ()):
+        if not isinstance(processor, LangfuseSpanProcessor):
+            continue
+        # BatchSpanProcessor has no public API to replace its exporter
+        batch = getattr(processor, "_batch_processor", None)
+        if batch is None or not hasattr(batch, "_exporter"):
+            return False
+        # Inside the tail sampler, so only kept spans are masked
+        holder, attr = batch, "_exporter"
+        if getattr(holder, attr) is tail_sampler():
+            holder, attr = getattr(holder, attr), "delegate"
+        setattr(holder, attr, MaskingSpanExporter(getattr(holder, attr), masker))
+        return True
+    return False
+
+
+def pii_masker() -> Optional[PIIMasker]:
+    """The installed masker, if any."""
+    return _installed
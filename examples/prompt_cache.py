@@ -0,0 +1,230 @@
+"""
+Process-wide prompt cache with stale-while-revalidate.
+
+Implements the prompt caching settings from configs/*.yaml:
+
+    prompts:
+      default_label: production
+      cache_ttl: 3600          # seconds
+
+    caching:
+      prompts:
+        enabled: true
+        ttl: 3600              # overrides prompts.cache_ttl
+
+Prompts are cached per (name, label, version, type). Within the TTL a lookup is a
+dictionary read. Once an entry is stale it is still returned immediately,
+and a single background refresh per key fetches the new version; requests
+never wait on the prompt API after the first fetch. If a refresh fails the
+last good copy keeps being served and the refresh is retried after
+`retry_seconds`. Concurrent cold misses for the same key share one fetch
+(singleflight.py).
+
+Usage:
+
+    from prompt_cache import get_prompt
+
+    prompt = get_prompt("customer-support-prompt", label="production")
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langfuse.model import ChatPromptClient
+
+from config import load_config
+from singleflight import SingleFlight
+
+PromptKey = Tuple[str, Optional[str], Optional[int], str]
+
+
+class _Entry:
+    __slots__ = ("prompt", "fetched_at", "expires_at", "refreshing", "failures")
+
+    def __init__(self, prompt: Any, fetched_at: float, expires_at: float):
+        self.prompt = prompt
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+        self.refreshing = False
+        self.failures = 0
+
+
+class PromptCache:
+    """Caches fetched prompts and refreshes stale ones in the background."""
+
+    def __init__(self, ttl_seconds: float = 60, default_label: Optional[str] = None,
+                 retry_seconds: float = 10, fetch: Optional[Callable[..., Any]] = None):
+        """
+        `fetch(name, label=..., version=..., type=...)` loads a prompt from the
+        backend; by default it calls the shared Langfuse client with the SDK's
+        own cache disabled. A TTL of 0 disables caching (every lookup fetches).
+        """
+        self.ttl_seconds = ttl_seconds
+        self.default_label = default_label
+        self.retry_seconds = retry_seconds
+        self._fetch = fetch or _fetch_from_langfuse
+
+        self._lock = threading.Lock()
+        self._entries: Dict[PromptKey, _Entry] = {}
+        self._flight = SingleFlight()
+        self._counters: Dict[str, int] = defaultdict(int)
+
+    @classmethod
+    def from_config(cls, prompts_cfg: Optional[Dict[str, Any]],
+                    caching_cfg: Optional[Dict[str, Any]] = None) -> "PromptCache":
+        prompts_cfg = prompts_cfg or {}
+        cache_cfg = (caching_cfg or {}).get("prompts") or {}
+        ttl = cache_cfg.get("ttl", prompts_cfg.get("cache_ttl", 60))
+        if not cache_cfg.get("enabled", True):
+            ttl = 0
+        return cls(
+            ttl_seconds=ttl,
+            default_label=prompts_cfg.get("default_label"),
+            retry_seconds=cache_cfg.get("retry_seconds", 10),
+        )
+
+    def _key(self, name: str, label: Optional[str], version: Optional[int], type: str) -> PromptKey:
+        if label is None and version is None:
+            label = self.default_label
+        return (name, label, version, type)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, name: str, label: Optional[str] = None, version: Optional[int] = None,
+            type: str = "text") -> Any:
+        """
+        The prompt for (name, label/version, type).
+
+        Without a label or version the configured `prompts.default_label` is
+        used. Raises the fetch error only when there is no cached copy.
+        """
+        key = self._key(name, label, version, type)
+        now = time.monotonic()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds > 0:
+                if now < entry.expires_at:
+                    self._counters["hits"] += 1
+                    return entry.prompt
+                self._counters["stale_hits"] += 1
+                if not entry.refreshing:
+                    entry.refreshing = refresh = True
+
+        if entry is not None and self.ttl_seconds > 0:
+            if refresh:
+                threading.Thread(target=self._refresh, args=(key,), daemon=True,
+                                 name=f"prompt-refresh-{name}").start()
+            return entry.prompt
+
+        self._count("misses")
+        try:
+            prompt, _ = self._flight.do(key, lambda: self._load(key))
+        except Exception:
+            if entry is None:
+                raise
+            # Caching disabled but the backend is down: serve the last good copy
+            self._count("errors_served_stale")
+            return entry.prompt
+        return prompt
+
+    def _load(self, key: PromptKey) -> Any:
+        name, label, version, type = key
+        self._count("fetches")
+        prompt = self._fetch(name, label=label, version=version, type=type)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = _Entry(prompt, now, now + self.ttl_seconds)
+        return prompt
+
+    def _refresh(self, key: PromptKey):
+        try:
+            self._load(key)
+            self._count("refreshes")
+        except Exception as e:
+            failures = 0
+            with self._lock:
+                self._counters["refresh_errors"] += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # Keep serving the last good copy; try again later
+                    entry.expires_at = time.monotonic() + self.retry_seconds
+                    entry.refreshing = False
+                    entry.failures += 1
+                    failures = entry.failures
+            if failures == 1:
+                print(f"Prompt refresh failed for {key[0]!r}, serving cached copy: {e}")
+
+    def put(self, name: str, prompt: Any, label: Optional[str] = None, version: Optional[int] = None,
+            type: Optional[str] = None):
+        """
+        Seed the cache with a prompt loaded elsewhere (e.g. prompt_registry.py).
+
+        `type` defaults to the type of `prompt`. The entry counts as fetched
+        now; it is refreshed from the backend once the TTL has passed.
+        """
+        if type is None:
+            type = "chat" if isinstance(prompt, ChatPromptClient) else "text"
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(name, label, version, type)] = _Entry(prompt, now, now + self.ttl_seconds)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop cached entries for `name`, or all entries."""
+        with self._lock:
+            for key in [k for k in self._entries if name is None or k[0] == name]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, cached keys and the age of the oldest entry."""
+        now = time.monotonic()
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["oldest_age_s"] = max((now - e.fetched_at for e in self._entries.values()), default=0.0)
+        lookups = stats.get("hits", 0) + stats.get("stale_hits", 0) + stats.get("misses", 0)
+        stats["hit_rate"] = (lookups - stats.get("misses", 0)) / lookups if lookups else 0.0
+        return stats
+
+
+def _fetch_from_langfuse(name: str, label: Optional[str] = None, version: Optional[int] = None,
+                         type: str = "text") -> Any:
+    from tracing_utils import langfuse_client
+
+    # This cache owns TTL and refresh; bypass the SDK's cache
+    return langfuse_client().get_prompt(name, label=label, version=version, type=type,
+                                        cache_ttl_seconds=0)
+
+
+_cache: Optional[PromptCache] = None
+
+
+def get_prompt_cache() -> PromptCache:
+    """
+    Prompt cache from the environment's `prompts`/`caching` config, built once.
+
+    Building it installs the local prompt registry (prompts.registry), which
+    seeds it, so only processes that look prompts up load the prompt files.
+    """
+    global _cache
+    if _cache is None:
+        config = load_config()
+        _cache = PromptCache.from_config(config.get("prompts"), config.get("caching"))
+        from prompt_registry import install_prompt_registry
+        install_prompt_registry()
+    return _cache
+
+
+def set_prompt_cache(cache: PromptCache):
+    global _cache
+    _cache = cache
+
+
+def get_prompt(name: str, label: Optional[str] = None, version: Optional[int] = None,
+               type: str = "text") -> Any:
+    """Cached `Langfuse.get_prompt` for request paths."""
+    return get_prompt_cache().get(name, label=label, version=version, type=type)
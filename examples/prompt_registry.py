@@ -0,0 +1,217 @@
+"""
+Local prompt registry for zero-network startup.
+
+Loads prompts from files at startup into an in-memory index, so a worker
+can serve traffic before (or without) reaching the prompt API:
+
+- bundles: the prompts/*.json files in this repo; every entry with a
+  `template` becomes a chat prompt (its `system` message plus the template
+  as the user message) named after the entry, with the entry's `config`
+- snapshots: prompts exported from Langfuse with export_snapshot() or
+  scripts/export_prompts.py, in the prompt API's own JSON format
+
+Configured by `prompts.registry` in configs/*.yaml:
+
+    prompts:
+      registry:
+        enabled: true
+        paths:                     # globs, relative to the repository root
+          - prompts/*.json
+          - .langfuse_prompts/*.json
+        labels: [production]       # labels given to bundle entries
+
+Lookups by (name, label) or (name, version) are dictionary reads. The
+registry is the starting point only: install_prompt_registry(), called when
+the shared prompt cache (prompt_cache.py) is first used, seeds the cache
+with every loaded prompt, and the cache refreshes them from the prompt API
+in the background once its TTL has passed. Later files override earlier
+ones for the same name and label.
+"""
+
+import glob
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langfuse.api import Prompt_Chat, Prompt_Text
+from langfuse.model import ChatPromptClient, TextPromptClient
+
+from config import CONFIG_DIR, load_config
+
+REPO_ROOT = os.path.dirname(CONFIG_DIR)
+
+SNAPSHOT_FORMAT = "langfuse-prompt-snapshot/v1"
+
+
+def _client(data: Dict[str, Any]):
+    if data.get("type") == "chat":
+        return ChatPromptClient(Prompt_Chat.parse_obj(data))
+    return TextPromptClient(Prompt_Text.parse_obj({**data, "type": "text"}))
+
+
+class PromptRegistry:
+    """In-memory index of prompts by (name, label) and (name, version)."""
+
+    def __init__(self, default_label: Optional[str] = "production"):
+        self.default_label = default_label
+        self._by_label: Dict[Tuple[str, str], Any] = {}
+        self._by_version: Dict[Tuple[str, int], Any] = {}
+        self.sources: List[str] = []
+
+    def add(self, data: Dict[str, Any]):
+        """Index one prompt given in the prompt API's JSON format."""
+        prompt = _client(data)
+        self._by_version[(prompt.name, prompt.version)] = prompt
+        for label in prompt.labels:
+            self._by_label[(prompt.name, label)] = prompt
+
+    def load_bundle(self, path: str, labels: Sequence[str] = ("production",)) -> int:
+        """Index the entries of a prompts/*.json bundle; returns how many."""
+        with open(path) as f:
+            bundle = json.load(f)
+
+        count = 0
+        for section in ("prompts", "agents"):
+            for name, entry in (bundle.get(section) or {}).items():
+                if not isinstance(entry, dict) or "template" not in entry:
+                    continue
+                messages = [{"role": "user", "content": entry["template"]}]
+                if entry.get("system"):
+                    messages.insert(0, {"role": "system", "content": entry["system"]})
+                self.add({
+                    "name": name,
+                    "version": entry.get("prompt_version", 1),
+                    "type": "chat",
+                    "prompt": messages,
+                    "config": entry.get("config") or {},
+                    "labels": list(entry.get("labels") or labels),
+                    "tags": [bundle.get("name", os.path.basename(path))],
+                })
+                count += 1
+        self.sources.append(path)
+        return count
+
+    def load_snapshot(self, path: str) -> int:
+        """Index the prompts of a snapshot written by export_snapshot()."""
+        with open(path) as f:
+            snapshot = json.load(f)
+        for data in snapshot["prompts"]:
+            self.add(data)
+        self.sources.append(path)
+        return len(snapshot["prompts"])
+
+    def load(self, path: str, labels: Sequence[str] = ("production",)) -> int:
+        """Load a snapshot or a bundle, whichever `path` is."""
+        with open(path) as f:
+            is_snapshot = json.load(f).get("format") == SNAPSHOT_FORMAT
+        return self.load_snapshot(path) if is_snapshot else self.load_bundle(path, labels)
+
+    def get(self, name: str, label: Optional[str] = None, version: Optional[int] = None) -> Optional[Any]:
+        """The prompt client for (name, label) or (name, version), or None."""
+        if version is not None:
+            return self._by_version.get((name, version))
+        return self._by_label.get((name, label or self.default_label))
+
+    def entries(self) -> Iterable[Tuple[str, Optional[str], Optional[int], Any]]:
+        """(name, label, version, prompt) for every index entry."""
+        for (name, label), prompt in self._by_label.items():
+            yield name, label, None, prompt
+        for (name, version), prompt in self._by_version.items():
+            yield name, None, version, prompt
+
+    def names(self) -> List[str]:
+        return sorted({name for name, _ in self._by_version})
+
+    def __len__(self):
+        return len(self._by_version)
+
+
+def export_snapshot(path: str, names: Optional[Sequence[str]] = None,
+                    labels: Sequence[str] = ("production",)) -> int:
+    """
+    Write the given labels of Langfuse prompts to a snapshot file.
+
+    Exports every prompt in the project when `names` is not given. Returns
+    the number of prompt versions written.
+    """
+    from tracing_utils import langfuse_client
+
+    api = langfuse_client().api
+    if names is None:
+        names, page = [], 1
+        while True:
+            response = api.prompts.list(page=page, limit=100)
+            names.extend(meta.name for meta in response.data)
+            if page >= response.meta.total_pages:
+                break
+            page += 1
+
+    prompts: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for name in names:
+        for label in labels:
+            try:
+                prompt = api.prompts.get(name, label=label)
+            except Exception as e:
+                print(f"  Skipping {name} ({label}): {e}")
+                continue
+            prompts[(prompt.name, prompt.version)] = json.loads(prompt.json())
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "prompts": list(prompts.values()),
+        }, f, indent=2)
+    os.replace(tmp_path, path)
+    return len(prompts)
+
+
+_installed: Optional[PromptRegistry] = None
+
+
+def install_prompt_registry(registry_cfg: Optional[Dict[str, Any]] = None) -> Optional[PromptRegistry]:
+    """
+    Load the configured prompt files and seed the shared prompt cache.
+
+    Reads `prompts.registry` from the environment's config when
+    `registry_cfg` is not given. Returns the registry, or None when it is
+    disabled.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    prompts_cfg = load_config().get("prompts") or {}
+    if registry_cfg is None:
+        registry_cfg = prompts_cfg.get("registry") or {}
+    if not registry_cfg.get("enabled", False):
+        return None
+
+    default_label = prompts_cfg.get("default_label") or "production"
+    labels = registry_cfg.get("labels") or [default_label]
+    registry = PromptRegistry(default_label)
+    for pattern in registry_cfg.get("paths") or ["prompts/*.json"]:
+        for path in sorted(glob.glob(os.path.join(REPO_ROOT, pattern))):
+            try:
+                registry.load(path, labels)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load prompts from {path}: {e}")
+
+    from prompt_cache import get_prompt_cache
+    cache = get_prompt_cache()
+    for name, label, version, prompt in registry.entries():
+        cache.put(name, prompt, label=label, version=version)
+
+    _installed = registry
+    print(f"Prompt registry: {len(registry)} prompts from {len(registry.sources)} files")
+    return registry
+
+
+def prompt_registry() -> Optional[PromptRegistry]:
+    """The installed registry, if any."""
+    return _installed
@@ -0,0 +1,246 @@
+"""
+Precompiled prompt templates.
+
+`PromptClient.compile()` scans the `{{variable}}` template on every call.
+Here a template - a text prompt or a list of chat messages - is parsed once
+into a plan of literal segments and variable slots; rendering copies the
+plan, fills the slots and joins it. Compiled templates are cached by their
+text (Langfuse prompts by name and version), so compiling the same prompt
+again is a dictionary lookup.
+
+Variables are checked at render time: a missing variable is left as
+`{{name}}` like the SDK does (the default) or, with strict=True, raises
+ValueError naming all missing variables. None renders as "".
+
+For datasets, render_batch() renders a list of variable dicts or a pandas
+DataFrame (one row per render, one column per variable).
+
+Usage:
+
+    from prompt_templates import compile_prompt
+
+    template = compile_prompt(get_prompt("customer-support-prompt"))
+    text = template.render(tier="premium", question=question, tone="friendly")
+    texts = template.render_batch(df[["tier", "question", "tone"]])
+"""
+
+import json
+import threading
+from itertools import repeat
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+OPENING = "{{"
+CLOSING = "}}"
+
+# Compiled templates kept per process; prompts are few and reused
+MAX_CACHED_TEMPLATES = 1024
+
+# Marks a variable missing from one row of a batch (rendered as the placeholder)
+_MISSING = object()
+
+
+def _parse(text: str) -> Tuple[List[Optional[str]], List[Tuple[int, str, str]]]:
+    """Literal parts (None at slots) and (index, name, raw placeholder) slots."""
+    parts: List[Optional[str]] = []
+    slots: List[Tuple[int, str, str]] = []
+    pos = 0
+    while True:
+        start = text.find(OPENING, pos)
+        end = text.find(CLOSING, start) if start != -1 else -1
+        if end == -1:
+            break
+        if start > pos:
+            parts.append(text[pos:start])
+        end += len(CLOSING)
+        slots.append((len(parts), text[start + len(OPENING):end - len(CLOSING)].strip(), text[start:end]))
+        parts.append(None)
+        pos = end
+    if pos < len(text) or not parts:
+        parts.append(text[pos:])
+    return parts, slots
+
+
+class CompiledTemplate:
+    """A text template parsed into literal segments and variable slots."""
+
+    def __init__(self, text: str, strict: bool = False):
+        self.text = text
+        self.strict = strict
+        self._parts, self._slots = _parse(text)
+        self.variables: List[str] = list(dict.fromkeys(name for _, name, _ in self._slots))
+
+    def missing(self, variables: Iterable[str]) -> List[str]:
+        """Template variables not in `variables`."""
+        present = set(variables)
+        return [name for name in self.variables if name not in present]
+
+    def render(self, variables: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """The template with every variable filled in."""
+        if kwargs:
+            variables = {**variables, **kwargs} if variables else kwargs
+        variables = variables or {}
+        parts = self._parts.copy()
+        try:
+            for i, name, raw in self._slots:
+                value = variables[name]
+                parts[i] = "" if value is None else str(value)
+        except KeyError:
+            if self.strict:
+                raise ValueError(f"Missing template variables {self.missing(variables)}") from None
+            for i, name, raw in self._slots:
+                value = variables.get(name, raw)
+                parts[i] = "" if value is None else str(value)
+        return "".join(parts)
+
+    def render_batch(self, rows: Union[Sequence[Dict[str, Any]], Any]) -> List[str]:
+        """Render once per row of a list of dicts or a pandas DataFrame."""
+        return self._render_columns(_columns(rows, self), _num_rows(rows))
+
+    def _render_columns(self, columns: Dict[str, List[str]], num_rows: int) -> List[str]:
+        # Column-wise: each output row is one join over the zipped segments
+        if not self._slots:
+            return [self.text] * num_rows
+        segments = [repeat(part, num_rows) if part is not None else None for part in self._parts]
+        for i, name, raw in self._slots:
+            column = columns.get(name)
+            if column is None:
+                segments[i] = repeat(raw, num_rows)
+            elif _MISSING in column:
+                segments[i] = [raw if v is _MISSING else v for v in column]
+            else:
+                segments[i] = column
+        return ["".join(row) for row in zip(*segments)]
+
+    def __repr__(self):
+        return f"CompiledTemplate(variables={self.variables})"
+
+
+class CompiledChatTemplate:
+    """A list of chat messages whose contents are compiled templates."""
+
+    def __init__(self, messages: Sequence[Dict[str, Any]], strict: bool = False):
+        self.messages = [dict(message) for message in messages]
+        self.strict = strict
+        # Messages without string content (e.g. placeholders) are passed through
+        self._contents: List[Optional[CompiledTemplate]] = [
+            CompiledTemplate(m["content"], strict) if isinstance(m.get("content"), str) else None
+            for m in self.messages
+        ]
+        self.variables: List[str] = list(dict.fromkeys(
+            name for content in self._contents if content for name in content.variables))
+
+    def missing(self, variables: Iterable[str]) -> List[str]:
+        present = set(variables)
+        return [name for name in self.variables if name not in present]
+
+    def render(self, variables: Optional[Dict[str, Any]] = None, **kwargs) -> List[Dict[str, Any]]:
+        """The messages with every variable filled in."""
+        if kwargs:
+            variables = {**variables, **kwargs} if variables else kwargs
+        variables = variables or {}
+        try:
+            return [
+                {**message, "content": content.render(variables)} if content else dict(message)
+                for message, content in zip(self.messages, self._contents)
+            ]
+        except ValueError:
+            raise ValueError(f"Missing template variables {self.missing(variables)}") from None
+
+    def render_batch(self, rows: Union[Sequence[Dict[str, Any]], Any]) -> List[List[Dict[str, Any]]]:
+        """Render once per row of a list of dicts or a pandas DataFrame."""
+        columns, num_rows = _columns(rows, self), _num_rows(rows)
+        contents = [
+            content._render_columns(columns, num_rows) if content else repeat(None, num_rows)
+            for content in self._contents
+        ]
+        return [
+            [{**message, "content": text} if text is not None else dict(message)
+             for message, text in zip(self.messages, row)]
+            for row in zip(*contents)
+        ]
+
+    def __repr__(self):
+        return f"CompiledChatTemplate(messages={len(self.messages)}, variables={self.variables})"
+
+
+def _num_rows(rows) -> int:
+    return len(rows.index) if hasattr(rows, "columns") else len(rows)
+
+
+def _columns(rows, template) -> Dict[str, List[Any]]:
+    """Rendered value strings per template variable, read column by column."""
+    columns = {}
+    missing = []
+    for name in template.variables:
+        if hasattr(rows, "columns"):
+            if name not in rows.columns:
+                missing.append(name)
+                continue
+            # Missing values (NaN/None/NaT) render as "" like None
+            values = rows[name].astype(object).where(rows[name].notna(), None).tolist()
+        else:
+            values = [row.get(name, _MISSING) for row in rows]
+            if _MISSING in values:
+                missing.append(name)
+        columns[name] = ["" if v is None else v if v is _MISSING else str(v) for v in values]
+    if missing and template.strict:
+        raise ValueError(f"Missing template variables {missing}")
+    return columns
+
+
+_lock = threading.Lock()
+_cache: Dict[Any, Union[CompiledTemplate, CompiledChatTemplate]] = {}
+
+
+def _cached(key, build):
+    template = _cache.get(key)
+    if template is None:
+        template = build()
+        with _lock:
+            if len(_cache) >= MAX_CACHED_TEMPLATES:
+                _cache.clear()
+            _cache[key] = template
+    return template
+
+
+def compile_template(template: Union[str, Sequence[Dict[str, Any]]],
+                     strict: bool = False) -> Union[CompiledTemplate, CompiledChatTemplate]:
+    """Compiled (and cached) text template or chat message list."""
+    if isinstance(template, str):
+        return _cached((template, strict), lambda: CompiledTemplate(template, strict))
+    key = (json.dumps(list(template), sort_keys=True, default=str), strict)
+    return _cached(key, lambda: CompiledChatTemplate(template, strict))
+
+
+def compile_prompt(prompt: Any, strict: bool = False) -> Union[CompiledTemplate, CompiledChatTemplate]:
+    """Compiled template of a Langfuse TextPromptClient or ChatPromptClient."""
+    if getattr(prompt, "is_fallback", False):
+        return compile_template(prompt.prompt, strict)
+    # A prompt version never changes, so (name, version) identifies the text
+    key = ("prompt", prompt.name, prompt.version, strict)
+    return _cached(key, lambda: compile_template(prompt.prompt, strict))
+
+
+def load_prompt_templates(path: str, strict: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Compile every entry of a prompts/*.json file.
+
+    Entries with a `system` message and a `template` become two-message chat
+    templates. Returns {entry name: {"template": ..., "config": {...}}}.
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    templates = {}
+    for section in ("prompts", "agents"):
+        for name, entry in (data.get(section) or {}).items():
+            if not isinstance(entry, dict) or "template" not in entry:
+                continue
+            messages = [{"role": "user", "content": entry["template"]}]
+            if entry.get("system"):
+                messages.insert(0, {"role": "system", "content": entry["system"]})
+            templates[name] = {
+                "template": compile_template(messages, strict),
+                "config": entry.get("config") or {},
+            }
+    return templates
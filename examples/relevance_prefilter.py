@@ -0,0 +1,82 @@
+"""
+Embedding-similarity prefilter for context relevance grading.
+
+Most relevance verdicts are obvious from the cosine similarity between the
+query and context embeddings. The prefilter scores all contexts in one
+vectorized step and auto-labels the clear cases:
+
+- similarity >= relevant_threshold   -> RELEVANT
+- similarity <= irrelevant_threshold -> NOT_RELEVANT
+- anything in between                -> ambiguous, sent to the LLM judge
+
+A small, deterministic fraction of auto-labelled contexts (`audit_rate`) is
+still sent to the judge so the agreement between prefilter and judge can be
+tracked and the thresholds recalibrated.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from eval_sampling import hash_fraction
+
+
+def cosine_similarities(query_embedding: Sequence[float],
+                        context_embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+    """Cosine similarity between one query vector and a matrix of context vectors."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    contexts = np.asarray(context_embeddings, dtype=np.float32)
+    norms = np.linalg.norm(contexts, axis=1) * np.linalg.norm(query)
+    return contexts @ query / np.maximum(norms, 1e-12)
+
+
+class RelevancePrefilter:
+    """Threshold-based auto-labelling of contexts by embedding similarity."""
+
+    def __init__(self, relevant_threshold: float = 0.55,
+                 irrelevant_threshold: float = 0.25, audit_rate: float = 0.05):
+        if irrelevant_threshold > relevant_threshold:
+            raise ValueError("irrelevant_threshold must not exceed relevant_threshold")
+
+        self.relevant_threshold = relevant_threshold
+        self.irrelevant_threshold = irrelevant_threshold
+        self.audit_rate = audit_rate
+
+        # Process-wide agreement counters for threshold calibration
+        self._lock = threading.Lock()
+        self._audited = 0
+        self._agreed = 0
+
+    @classmethod
+    def from_config(cls, prefilter_config: Dict[str, Any]) -> "RelevancePrefilter":
+        """Build a prefilter from `evaluation.relevance_prefilter` settings."""
+        return cls(
+            relevant_threshold=prefilter_config.get("relevant_threshold", 0.55),
+            irrelevant_threshold=prefilter_config.get("irrelevant_threshold", 0.25),
+            audit_rate=prefilter_config.get("audit_rate", 0.05)
+        )
+
+    def classify(self, similarities: np.ndarray) -> List[Optional[str]]:
+        """Auto-label each similarity; None marks the ambiguous band."""
+        labels = np.full(similarities.shape, None, dtype=object)
+        labels[similarities >= self.relevant_threshold] = "RELEVANT"
+        labels[similarities <= self.irrelevant_threshold] = "NOT_RELEVANT"
+        return labels.tolist()
+
+    def should_audit(self, key: str) -> bool:
+        """Deterministically pick auto-labelled contexts to cross-check with the judge."""
+        return hash_fraction(key) < self.audit_rate
+
+    def record_audit(self, auto_label: str, judge_score: float) -> bool:
+        """Compare an auto label with the judge verdict and update agreement counters."""
+        agreed = (auto_label == "RELEVANT") == (judge_score >= 0.5)
+        with self._lock:
+            self._audited += 1
+            self._agreed += int(agreed)
+        return agreed
+
+    def agreement_rate(self) -> Optional[float]:
+        """Lifetime agreement between auto labels and the judge, if any were audited."""
+        with self._lock:
+            return self._agreed / self._audited if self._audited else None
@@ -0,0 +1,133 @@
+"""
+Singleflight request coalescing.
+
+Concurrent calls with the same key share one in-flight execution: the first
+caller (the leader) runs the function, later callers wait for its result
+instead of repeating the work. Once the execution finishes the key is
+released, so the next call starts a fresh execution - nothing is cached.
+
+do() runs plain functions; do_async() runs coroutine functions, and its
+followers wait without blocking the event loop.
+"""
+
+import asyncio
+import threading
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    def __init__(self, leader_id: Optional[str]):
+        self.leader_id = leader_id
+        self.fan_in = 1
+        self.done = threading.Event()
+        # Set for executions led by do_async()
+        self.future: Optional[asyncio.Future] = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Deduplicates concurrent executions of the same keyed call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._fan_in_histogram: Counter = Counter()
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           caller_id: Optional[str] = None) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Run `fn` once per concurrent group of callers sharing `key`.
+
+        Returns the result together with flight info: whether this caller led
+        the execution, the leader's caller id (e.g. its trace id) and the
+        fan-in (number of callers that received this result). Exceptions raised
+        by the leader are re-raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call(caller_id)
+                self._calls[key] = call
+                leader = True
+            else:
+                call.fan_in += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    self._fan_in_histogram[call.fan_in] += 1
+                call.done.set()
+        else:
+            call.done.wait()
+
+        return self._outcome(call, leader)
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                       caller_id: Optional[str] = None) -> Tuple[Any, Dict[str, Any]]:
+        """do() for coroutine functions: `fn()` is awaited once per group of callers."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call(caller_id)
+                call.future = asyncio.get_running_loop().create_future()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.fan_in += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = await fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    self._fan_in_histogram[call.fan_in] += 1
+                call.done.set()
+                call.future.set_result(None)
+        elif call.future is not None:
+            # Shielded: a cancelled follower must not cancel the leader's future
+            await asyncio.shield(call.future)
+        else:
+            # Led by a do() caller on another thread
+            await asyncio.get_running_loop().run_in_executor(None, call.done.wait)
+
+        return self._outcome(call, leader)
+
+    @staticmethod
+    def _outcome(call: _Call, leader: bool) -> Tuple[Any, Dict[str, Any]]:
+        info = {
+            "leader": leader,
+            "leader_id": call.leader_id,
+            "fan_in": call.fan_in
+        }
+        if call.error is not None:
+            raise call.error
+        return call.result, info
+
+    def stats(self) -> Dict[str, Any]:
+        """Executions, coalesced calls and the fan-in distribution so far."""
+        with self._lock:
+            histogram = dict(self._fan_in_histogram)
+            in_flight = len(self._calls)
+
+        executions = sum(histogram.values())
+        callers = sum(fan_in * count for fan_in, count in histogram.items())
+        return {
+            "executions": executions,
+            "callers": callers,
+            "coalesced_calls": callers - executions,
+            "max_fan_in": max(histogram, default=0),
+            "fan_in_histogram": histogram,
+            "in_flight": in_flight
+        }
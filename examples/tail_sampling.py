@@ -0,0 +1,499 @@
+"""
+Tail-based trace sampling.
+
+Head sampling decides before anything has happened, so at 10% it drops
+90% of the failed, slow and low-quality traces too. The tail sampler
+buffers each trace's finished spans in process and decides once its root
+span has ended, keeping the trace when any rule matches:
+
+- error: a span ended with ERROR status, or the trace carries `error`
+  metadata (see ProductionRAGSystem._record_error)
+- latency: the root span or a generation took longer than the
+  `latency_percentile` of recent spans with the same name (after
+  `min_latency_samples` observations)
+- score: a score created with create_score() (or fed in with
+  record_score()) is below its configured threshold, e.g.
+  `overall_quality: 0.7`
+- baseline: a deterministic `baseline_rate` share of all traces, so normal
+  traffic stays visible
+
+Everything else is dropped before it reaches the OTLP exporter. Buffers
+are bounded: a trace is decided early when it exceeds `timeout_seconds` or
+when the buffer holds more than `max_buffered_spans` spans (oldest first).
+
+Scores created with create_score() wait for the same decision: they are
+sent once their trace is kept and discarded with a dropped trace, so no
+score ends up without its trace.
+
+Configured under `langfuse.tail_sampling` in configs/*.yaml and installed
+with install_tail_sampler() after the Langfuse client exists. It wraps the
+Langfuse span exporter, so spans reach it in the SDK's export batches.
+Traces whose scores arrive after the root span ends (background evaluation)
+can be held open with hold()/release().
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import StatusCode
+
+from config import load_config
+from eval_sampling import hash_fraction
+
+# Thresholds are recomputed after this many new latency samples per span name
+PERCENTILE_REFRESH_EVERY = 50
+
+OBSERVATION_TYPE_ATTRIBUTE = "langfuse.observation.type"
+
+
+class _TraceBuffer:
+    __slots__ = ("spans", "started", "root_ended", "holds", "released_at", "scores", "deferred")
+
+    def __init__(self):
+        self.spans: List[ReadableSpan] = []
+        self.started = time.monotonic()
+        self.root_ended = False
+        self.holds = 0
+        # End-time (ns) by which spans ended before the last release() are exported
+        self.released_at = 0
+        self.scores: Dict[str, float] = {}
+        # Score creations waiting for the decision
+        self.deferred: List[Callable[[], Any]] = []
+
+
+class _LatencyTracker:
+    """Rolling per-name latency windows with a cached percentile threshold."""
+
+    def __init__(self, percentile: float, window: int, min_samples: int):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._thresholds: Dict[str, float] = {}
+        self._since_refresh: Dict[str, int] = defaultdict(int)
+
+    def observe(self, name: str, duration_ms: float) -> bool:
+        """Record a duration; True if it is above the name's threshold."""
+        samples = self._samples[name]
+        threshold = self._thresholds.get(name)
+        samples.append(duration_ms)
+
+        self._since_refresh[name] += 1
+        if len(samples) >= self.min_samples and (
+            threshold is None or self._since_refresh[name] >= PERCENTILE_REFRESH_EVERY
+        ):
+            ordered = sorted(samples)
+            self._thresholds[name] = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+            self._since_refresh[name] = 0
+
+        return threshold is not None and duration_ms > threshold
+
+
+class TailSamplingSpanExporter(SpanExporter):
+    """Buffers exported spans per trace and hands kept traces to `delegate`."""
+
+    def __init__(self, delegate: SpanExporter, baseline_rate: float = 0.01,
+                 latency_percentile: float = 99.0, min_latency_samples: int = 100,
+                 score_thresholds: Optional[Dict[str, float]] = None,
+                 timeout_seconds: float = 30.0, max_buffered_spans: int = 10_000,
+                 max_remembered: int = 100_000, flush_interval: float = 5.0):
+        self.delegate = delegate
+        self.baseline_rate = baseline_rate
+        self.score_thresholds = dict(score_thresholds or {})
+        self.timeout_seconds = timeout_seconds
+        self.max_buffered_spans = max_buffered_spans
+        self.max_remembered = max_remembered
+        # Longest a finished span waits for its export batch
+        self.flush_interval = flush_interval
+
+        self._latency = _LatencyTracker(latency_percentile, window=1000,
+                                        min_samples=min_latency_samples)
+        self._lock = threading.Lock()
+        # Kept traces are exported from the SDK's export thread, release() and
+        # the sweeper; exporters are not thread-safe
+        self._export_lock = threading.Lock()
+        self._buffers: "OrderedDict[int, _TraceBuffer]" = OrderedDict()
+        self._buffered_spans = 0
+        # Latest span end time exported; spans reach export() in end order
+        self._watermark = 0
+        # Released traces waiting for the watermark to pass their release
+        self._released: set = set()
+        # Recent decisions, so spans ending after their trace was decided follow it
+        self._decided: "OrderedDict[int, bool]" = OrderedDict()
+        # Scores of traces none of whose spans were exported yet
+        self._pending: "OrderedDict[int, _TraceBuffer]" = OrderedDict()
+        self._scores_to_send: List[Callable[[], Any]] = []
+        self._stats: Dict[str, int] = defaultdict(int)
+
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep, name="tail-sampler", daemon=True)
+        self._sweeper.start()
+
+    @classmethod
+    def from_config(cls, delegate: SpanExporter, tail_cfg: Dict[str, Any],
+                    flush_interval: float = 5.0) -> "TailSamplingSpanExporter":
+        return cls(
+            delegate,
+            baseline_rate=float(tail_cfg.get("baseline_rate", 0.01)),
+            latency_percentile=float(tail_cfg.get("latency_percentile", 99)),
+            min_latency_samples=int(tail_cfg.get("min_latency_samples", 100)),
+            score_thresholds={k: float(v) for k, v in (tail_cfg.get("score_thresholds") or {}).items()},
+            timeout_seconds=float(tail_cfg.get("timeout_seconds", 30)),
+            max_buffered_spans=int(tail_cfg.get("max_buffered_spans", 10_000)),
+            flush_interval=flush_interval,
+        )
+
+    # SpanExporter interface
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        to_forward: List[ReadableSpan] = []
+
+        with self._lock:
+            ended = set(self._released)
+            for span in spans:
+                trace_id = span.context.trace_id
+                self._watermark = max(self._watermark, span.end_time or 0)
+                decided = self._decided.get(trace_id)
+                if decided is not None:
+                    self._stats["late_spans"] += 1
+                    if decided:
+                        to_forward.append(span)
+                    else:
+                        self._stats["spans_dropped"] += 1
+                    continue
+
+                buffer = self._buffer_for(trace_id)
+                buffer.spans.append(span)
+                self._buffered_spans += 1
+                if span.parent is None or span.parent.is_remote:
+                    buffer.root_ended = True
+                    ended.add(trace_id)
+
+            # Decided after the whole batch is buffered, which may hold more of their spans
+            for trace_id in ended:
+                if self._ready(self._buffers[trace_id]):
+                    to_forward += self._finish(trace_id, "root_ended")
+            to_forward += self._evict_over_capacity()
+
+        return self._forward(to_forward)
+
+    def shutdown(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._decide_all("shutdown")
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """
+        Decide every released or ready trace and send its scores.
+
+        Runs after the batch processor exported everything that ended so
+        far (see _FlushHook), so released traces need not wait for newer
+        spans, and before Langfuse.flush()/shutdown() drain the score queue.
+        """
+        to_forward: List[ReadableSpan] = []
+        with self._lock:
+            for key in self._released:
+                self._buffers[key].released_at = 0
+            for key in [key for key, buffer in self._buffers.items() if self._ready(buffer)]:
+                to_forward += self._finish(key, "flush")
+        self._forward(to_forward)
+        return self.delegate.force_flush(timeout_millis)
+
+    # Signals from the application
+
+    def record_score(self, trace_id: str, name: str, value: Any,
+                     send: Optional[Callable[[], Any]] = None):
+        """
+        Feed a trace score into the score rule.
+
+        `send` creates the score in Langfuse. It runs once the trace is kept
+        and never when the trace is dropped.
+        """
+        key = int(trace_id, 16)
+        numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+        with self._lock:
+            decided = self._decided.get(key)
+            if decided is None:
+                buffer = self._buffers.get(key)
+                if buffer is None:
+                    # Score recorded before any span of the trace was exported
+                    buffer = self._pending.get(key)
+                    if buffer is None:
+                        buffer = self._pending[key] = _TraceBuffer()
+                        if len(self._pending) > self.max_remembered:
+                            self._drop_pending(next(iter(self._pending)))
+                if numeric:
+                    buffer.scores[name] = value
+                if send is not None:
+                    buffer.deferred.append(send)
+                return
+            if not decided:
+                if numeric and self._below_threshold({name: value}):
+                    self._stats["late_low_scores"] += 1
+                if send is not None:
+                    self._stats["scores_dropped"] += 1
+                return
+        if send is not None:
+            send()
+
+    def hold(self, trace_id: str):
+        """Keep a trace undecided after its root ends, until release()."""
+        key = int(trace_id, 16)
+        with self._lock:
+            if key not in self._decided:
+                self._buffer_for(key).holds += 1
+
+    def release(self, trace_id: str):
+        """
+        Drop a hold. The trace is decided once its root span and the spans
+        that ended before the release are exported.
+        """
+        key = int(trace_id, 16)
+        to_forward: List[ReadableSpan] = []
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                return
+            buffer.holds = max(0, buffer.holds - 1)
+            if buffer.holds == 0:
+                buffer.released_at = time.time_ns()
+                self._released.add(key)
+                if self._ready(buffer):
+                    to_forward = self._finish(key, "root_ended")
+        self._forward(to_forward)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "buffered_traces": len(self._buffers),
+                "buffered_spans": self._buffered_spans,
+            }
+
+    # Decision
+
+    def _buffer_for(self, trace_id: int) -> _TraceBuffer:
+        """Buffer of an undecided trace, created on first use (caller holds the lock)."""
+        buffer = self._buffers.get(trace_id)
+        if buffer is None:
+            buffer = self._buffers[trace_id] = self._pending.pop(trace_id, None) or _TraceBuffer()
+            buffer.started = time.monotonic()
+        return buffer
+
+    def _ready(self, buffer: _TraceBuffer) -> bool:
+        return buffer.root_ended and buffer.holds == 0 and self._watermark >= buffer.released_at
+
+    def _below_threshold(self, scores: Dict[str, float]) -> bool:
+        return any(
+            name in self.score_thresholds and value < self.score_thresholds[name]
+            for name, value in scores.items()
+        )
+
+    def _keep_reason(self, trace_id: int, buffer: _TraceBuffer) -> Optional[str]:
+        reason = None
+        for span in buffer.spans:
+            attributes = span.attributes or {}
+            # Only end-to-end and LLM latency count; checking every span name
+            # would keep a trace by chance once per few dozen spans. Latency
+            # windows are fed even once a reason is found.
+            slow = False
+            if span.parent is None or attributes.get(OBSERVATION_TYPE_ATTRIBUTE) == "generation":
+                slow = self._latency.observe(span.name, (span.end_time - span.start_time) / 1e6)
+            if reason is None:
+                if (span.status.status_code == StatusCode.ERROR
+                        or "langfuse.trace.metadata.error" in attributes):
+                    reason = "error"
+                elif slow:
+                    reason = "latency"
+
+        if reason is None and self._below_threshold(buffer.scores):
+            reason = "score"
+        if reason is None and hash_fraction(format(trace_id, "032x")) < self.baseline_rate:
+            reason = "baseline"
+        return reason
+
+    def _finish(self, trace_id: int, cause: str) -> List[ReadableSpan]:
+        """Decide a buffered trace (caller holds the lock); returns spans to export."""
+        buffer = self._buffers.pop(trace_id)
+        self._released.discard(trace_id)
+        self._buffered_spans -= len(buffer.spans)
+        self._stats[f"decided_{cause}"] += 1
+
+        reason = self._keep_reason(trace_id, buffer)
+        self._decided[trace_id] = reason is not None
+        if len(self._decided) > self.max_remembered:
+            self._decided.popitem(last=False)
+
+        if reason is None:
+            self._stats["traces_dropped"] += 1
+            self._stats["spans_dropped"] += len(buffer.spans)
+            self._stats["scores_dropped"] += len(buffer.deferred)
+            return []
+        self._stats[f"kept_{reason}"] += 1
+        self._stats["spans_kept"] += len(buffer.spans)
+        self._scores_to_send += buffer.deferred
+        return buffer.spans
+
+    def _evict_over_capacity(self) -> List[ReadableSpan]:
+        to_forward: List[ReadableSpan] = []
+        while self._buffered_spans > self.max_buffered_spans and self._buffers:
+            to_forward += self._finish(next(iter(self._buffers)), "memory_cap")
+        return to_forward
+
+    def _forward(self, spans: List[ReadableSpan]) -> SpanExportResult:
+        """Export kept spans, then send the scores of traces kept since the last call."""
+        result = SpanExportResult.SUCCESS
+        if spans:
+            with self._export_lock:
+                result = self.delegate.export(spans)
+        with self._lock:
+            scores, self._scores_to_send = self._scores_to_send, []
+        for send in scores:
+            send()
+        return result
+
+    def _sweep(self):
+        while not self._stop.wait(min(1.0, self.timeout_seconds)):
+            deadline = time.monotonic() - self.timeout_seconds
+            # Without newer spans the watermark stands still; after a flush
+            # interval everything that ended before a release is exported
+            flushed = time.time_ns() - int(self.flush_interval * 1e9)
+            to_forward: List[ReadableSpan] = []
+            with self._lock:
+                for key in [key for key in self._released if self._buffers[key].released_at < flushed]:
+                    self._buffers[key].released_at = 0
+                    if self._ready(self._buffers[key]):
+                        to_forward += self._finish(key, "root_ended")
+                expired = [key for key, buffer in self._buffers.items() if buffer.started < deadline]
+                for key in expired:
+                    to_forward += self._finish(key, "timeout")
+                # Scores of traces whose spans never arrived (e.g. head sampled out)
+                while self._pending and next(iter(self._pending.values())).started < deadline:
+                    self._drop_pending(next(iter(self._pending)))
+            self._forward(to_forward)
+
+    def _decide_all(self, cause: str):
+        with self._lock:
+            to_forward: List[ReadableSpan] = []
+            for key in list(self._buffers):
+                to_forward += self._finish(key, cause)
+            for key in list(self._pending):
+                self._drop_pending(key)
+        self._forward(to_forward)
+
+    def _drop_pending(self, trace_id: int):
+        """Discard the scores of a trace none of whose spans were exported (caller holds the lock)."""
+        self._stats["scores_dropped"] += len(self._pending.pop(trace_id).deferred)
+
+
+class _FlushHook(SpanProcessor):
+    """
+    Calls the sampler's force_flush() on TracerProvider.force_flush().
+
+    BatchSpanProcessor.force_flush() exports its queue but never flushes its
+    exporter. Registered after the Langfuse processor, so it runs once that
+    export is done.
+    """
+
+    def __init__(self, exporter: TailSamplingSpanExporter):
+        self.exporter = exporter
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.exporter.force_flush(timeout_millis)
+
+
+_installed: Optional[TailSamplingSpanExporter] = None
+
+
+def install_tail_sampler(tail_cfg: Optional[Dict[str, Any]] = None) -> Optional[TailSamplingSpanExporter]:
+    """
+    Put a tail sampler in front of the Langfuse span exporter.
+
+    Reads `langfuse.tail_sampling` from the environment's config when
+    `tail_cfg` is not given and creates the Langfuse client if needed.
+    Returns the exporter, or None when tail sampling is disabled or tracing
+    is not active.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if tail_cfg is None:
+        tail_cfg = (load_config().get("langfuse") or {}).get("tail_sampling") or {}
+    if not tail_cfg.get("enabled", False):
+        return None
+
+    from langfuse._client.span_processor import LangfuseSpanProcessor
+    from tracing_utils import langfuse_client
+
+    langfuse_client()
+    multi = getattr(otel_trace.get_tracer_provider(), "_active_span_processor", None)
+    if multi is None:
+        print("Tracing is not active; tail sampling not applied")
+        return None
+
+    for processor in getattr(multi, "_span_processors", ()):
+        if not isinstance(processor, LangfuseSpanProcessor):
+            continue
+        # BatchSpanProcessor has no public API to replace its exporter. The
+        # sampler goes outermost, so the other wrappers only see kept spans.
+        batch = getattr(processor, "_batch_processor", None)
+        if batch is not None and hasattr(batch, "_exporter"):
+            _installed = TailSamplingSpanExporter.from_config(batch._exporter, tail_cfg,
+                                                              getattr(batch, "_schedule_delay", 5.0))
+            batch._exporter = _installed
+            otel_trace.get_tracer_provider().add_span_processor(_FlushHook(_installed))
+        break
+
+    if _installed is None:
+        print("No Langfuse span exporter found; tail sampling not applied")
+    else:
+        print(f"Tail sampling enabled: baseline {_installed.baseline_rate:.1%}, "
+              f"score thresholds {_installed.score_thresholds}")
+    return _installed
+
+
+def create_score(langfuse=None, **score):
+    """
+    langfuse.create_score() for a trace the tail sampler may still drop.
+
+    The score feeds the score rule, is sent once its trace is kept and is
+    discarded with a dropped trace. Without a tail sampler (or without a
+    `trace_id`) it is sent right away.
+    """
+    if langfuse is None:
+        from tracing_utils import langfuse_client
+        langfuse = langfuse_client()
+    send = functools.partial(langfuse.create_score, **score)
+    if _installed is None or score.get("trace_id") is None:
+        send()
+    else:
+        _installed.record_score(score["trace_id"], score["name"], score["value"], send)
+
+
+def record_score(trace_id: str, name: str, value: float):
+    """Feed a score created elsewhere to the installed tail sampler (no-op without one)."""
+    if _installed is not None:
+        _installed.record_score(trace_id, name, value)
+
+
+def hold(trace_id: str):
+    if _installed is not None:
+        _installed.hold(trace_id)
+
+
+def release(trace_id: str):
+    if _installed is not None:
+        _installed.release(trace_id)
+
+
+def tail_sampler() -> Optional[TailSamplingSpanExporter]:
+    return _installed
@@ -0,0 +1,511 @@
+"""
+On-disk spool for exported spans.
+
+When the Langfuse host is slow or down, the SDK's BatchSpanProcessor either
+queues spans in memory (up to its queue size) or drops them, and flush() /
+shutdown() wait on the exporter. With the spool, the exporter only encodes
+each batch to OTLP protobuf and appends it to a local segment file; a
+background shipper thread replays the segments to the OTLP endpoint:
+
+- one batch in flight at a time, in order; failures (network errors, 429,
+  5xx, auth errors) are retried with exponential backoff and jitter,
+  honoring Retry-After, so an outage backs off instead of hammering the
+  host; batches the host rejects as malformed are dropped and counted
+- the shipped offset is recorded per segment and a segment file is deleted
+  once all of its batches are acknowledged
+- every process spools into its own subdirectory of the configured
+  directory and holds an exclusive lock (fcntl) on it while it runs, so
+  workers sharing the directory never write to the same segment; batches a
+  process left on disk (exit, crash) are adopted and shipped by the next
+  process whose shipper finds that directory unlocked
+- disk use is capped by `max_bytes`; beyond it new batches are dropped and
+  counted, memory use does not grow with the backlog
+- flush() returns as soon as batches are on disk, and shutdown() waits at
+  most `drain_timeout_seconds` for the shipper
+
+Configured under `langfuse.spool` in configs/*.yaml; installed by
+tracing_utils.init_client(). Without fcntl (Windows) directories of exited
+processes are not adopted. Scores and other ingestion API events are not
+spooled.
+"""
+
+import base64
+import os
+import random
+import shutil
+import struct
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+from langfuse.version import __version__ as langfuse_version
+from opentelemetry import trace as otel_trace
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from config import load_config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Record: payload length and crc32, then the OTLP ExportTraceServiceRequest
+_HEADER = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".seg"
+_ACK_SUFFIX = ".ack"
+# Per-process subdirectories; created under a temporary name and renamed once locked
+_PROCESS_PREFIX = "proc-"
+_LOCK_FILE = "lock"
+# Seconds between looks for directories of exited processes while idle
+ADOPT_INTERVAL_SECONDS = 30.0
+
+# Batches answered with these are dropped; everything else is retried
+REJECTED_STATUS = (400, 404, 413, 415, 422)
+
+
+class _Segment:
+    """One spool file plus the offset up to which it has been shipped."""
+
+    def __init__(self, directory: str, seq: int):
+        self.directory = directory
+        self.seq = seq
+        self.path = os.path.join(directory, f"{seq:016d}{_SEGMENT_SUFFIX}")
+        self.ack_path = os.path.join(directory, f"{seq:016d}{_ACK_SUFFIX}")
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def acked(self) -> int:
+        try:
+            with open(self.ack_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def ack(self, offset: int):
+        tmp = self.ack_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, self.ack_path)
+
+    def remove(self):
+        for path in (self.path, self.ack_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _list_segments(directory: str) -> List[_Segment]:
+    return [
+        _Segment(directory, int(name[:-len(_SEGMENT_SUFFIX)]))
+        for name in sorted(os.listdir(directory))
+        if name.endswith(_SEGMENT_SUFFIX) and name[:-len(_SEGMENT_SUFFIX)].isdigit()
+    ]
+
+
+def _try_lock(path: str, create: bool = False) -> Optional[int]:
+    """File descriptor holding an exclusive lock on `path`, or None if another process has it."""
+    try:
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+    except FileNotFoundError:
+        return None
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+    return fd
+
+
+def _remove_directory(directory: str, lock_fd: int):
+    """Delete a locked spool subdirectory; the lock is released last."""
+    shutil.rmtree(directory, ignore_errors=True)
+    os.close(lock_fd)
+
+
+class SpoolingSpanExporter(SpanExporter):
+    """Writes span batches to segment files and ships them from a background thread."""
+
+    def __init__(self, directory: str, endpoint: str, headers: Dict[str, str],
+                 segment_bytes: int = 8 * 1024 * 1024, max_bytes: int = 512 * 1024 * 1024,
+                 request_timeout_seconds: float = 10.0, retry_initial_seconds: float = 0.5,
+                 retry_max_seconds: float = 30.0, drain_timeout_seconds: float = 2.0,
+                 fsync: bool = False):
+        self.root = directory
+        self.endpoint = endpoint
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.fsync = fsync
+
+        # This process's own subdirectory, locked for as long as it runs
+        os.makedirs(directory, exist_ok=True)
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.directory = os.path.join(directory, _PROCESS_PREFIX + name)
+        # Others only see it once it is locked, so nobody adopts a live directory
+        pending = os.path.join(directory, f".{name}") if fcntl is not None else self.directory
+        os.makedirs(pending)
+        self._lock_fd = _try_lock(os.path.join(pending, _LOCK_FILE), create=True)
+        if pending != self.directory:
+            os.rename(pending, self.directory)
+        self._http = httpx.Client(
+            timeout=request_timeout_seconds,
+            headers={**headers, "Content-Type": "application/x-protobuf"},
+        )
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stopping = False
+        # Backoff waits on this rather than _changed, which new batches signal
+        self._stopped = threading.Event()
+        self._counters: Dict[str, int] = {
+            "batches_spooled": 0, "bytes_spooled": 0, "batches_shipped": 0, "bytes_shipped": 0,
+            "batches_dropped": 0, "batches_rejected": 0, "batches_corrupt": 0, "retries": 0,
+        }
+
+        # Segments left by exited processes are shipped first
+        self._segments: List[_Segment] = []
+        self._adopted: Dict[str, int] = {}
+        self._disk_bytes = 0
+        self._last_adopt = 0.0
+        self._adopt()
+        self._active: Optional[_Segment] = None
+        self._active_file = None
+        self._active_size = 0
+        self._open_segment()
+
+        self._shipper = threading.Thread(target=self._ship_loop, name="langfuse-spool-shipper", daemon=True)
+        self._shipper.start()
+
+    @classmethod
+    def from_config(cls, spool_cfg: Dict[str, Any], endpoint: str,
+                    headers: Dict[str, str]) -> "SpoolingSpanExporter":
+        return cls(
+            directory=spool_cfg.get("directory", ".langfuse_spool"),
+            endpoint=endpoint,
+            headers=headers,
+            segment_bytes=int(spool_cfg.get("segment_bytes", 8 * 1024 * 1024)),
+            max_bytes=int(spool_cfg.get("max_bytes", 512 * 1024 * 1024)),
+            request_timeout_seconds=float(spool_cfg.get("request_timeout_seconds", 10.0)),
+            retry_initial_seconds=float(spool_cfg.get("retry_initial_seconds", 0.5)),
+            retry_max_seconds=float(spool_cfg.get("retry_max_seconds", 30.0)),
+            drain_timeout_seconds=float(spool_cfg.get("drain_timeout_seconds", 2.0)),
+            fsync=bool(spool_cfg.get("fsync", False)),
+        )
+
+    # Writing (exporter thread)
+
+    def _open_segment(self):
+        seq = max((segment.seq for segment in self._segments if segment.directory == self.directory),
+                  default=0) + 1
+        self._active = _Segment(self.directory, seq)
+        self._active_file = open(self._active.path, "ab")
+        self._active_size = 0
+        self._segments.append(self._active)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        payload = encode_spans(spans).SerializePartialToString()
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            if self._stopping:
+                return SpanExportResult.FAILURE
+            if self._disk_bytes + len(record) > self.max_bytes:
+                self._counters["batches_dropped"] += 1
+                return SpanExportResult.FAILURE
+            if self._active_size and self._active_size + len(record) > self.segment_bytes:
+                self._active_file.close()
+                self._open_segment()
+
+            self._active_file.write(record)
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            self._active_size += len(record)
+            self._disk_bytes += len(record)
+            self._counters["batches_spooled"] += 1
+            self._counters["bytes_spooled"] += len(record)
+            self._changed.notify_all()
+        return SpanExportResult.SUCCESS
+
+    # Shipping (background thread)
+
+    def _adopt(self):
+        """Queue the segments of subdirectories whose process has exited (unlocked)."""
+        self._last_adopt = time.monotonic()
+        if fcntl is None:
+            return
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if not name.startswith(_PROCESS_PREFIX) or directory == self.directory or directory in self._adopted:
+                continue
+            lock_fd = _try_lock(os.path.join(directory, _LOCK_FILE))
+            if lock_fd is None:
+                continue
+            try:
+                segments = _list_segments(directory)
+            except FileNotFoundError:
+                # Removed by its owner between listing and locking
+                os.close(lock_fd)
+                continue
+            if not segments:
+                _remove_directory(directory, lock_fd)
+                continue
+            with self._lock:
+                self._adopted[directory] = lock_fd
+                # Ahead of this process's own segments, oldest directory first
+                own = [segment for segment in self._segments if segment.directory == self.directory]
+                adopted = [segment for segment in self._segments if segment.directory != self.directory]
+                self._segments = adopted + segments + own
+                self._disk_bytes += sum(segment.size() - segment.acked() for segment in segments)
+            print(f"Trace spool: adopted {len(segments)} segments from {directory}")
+
+    def _next_record(self):
+        """(segment, offset, payload) of the oldest unshipped batch, or None."""
+        while True:
+            with self._lock:
+                if not self._segments:
+                    return None
+                segment = self._segments[0]
+                is_active = segment is self._active
+                written = self._active_size if is_active else None
+
+            offset = segment.acked()
+            record = _read_record(segment.path, offset, written)
+            if record is not None:
+                if record is _CORRUPT:
+                    with self._lock:
+                        self._counters["batches_corrupt"] += 1
+                    self._finish_segment(segment, segment.size())
+                    continue
+                return segment, offset, record
+            if is_active:
+                return None
+            # Fully shipped (or ends in a torn write from a crash)
+            self._finish_segment(segment, segment.size())
+
+    def _finish_segment(self, segment: _Segment, size: int):
+        with self._lock:
+            if segment is self._active or segment not in self._segments:
+                return
+            self._disk_bytes -= max(0, size - segment.acked())
+            # Not necessarily the first one: _adopt() may have queued segments ahead of it
+            self._segments.remove(segment)
+            lock_fd = None
+            if segment.directory in self._adopted and not any(
+                    other.directory == segment.directory for other in self._segments):
+                lock_fd = self._adopted.pop(segment.directory)
+        segment.remove()
+        if lock_fd is not None:
+            _remove_directory(segment.directory, lock_fd)
+
+    def _ship_loop(self):
+        backoff = self.retry_initial_seconds
+        while True:
+            next_record = self._next_record()
+            if next_record is None:
+                if time.monotonic() - self._last_adopt >= ADOPT_INTERVAL_SECONDS:
+                    self._adopt()
+                    continue
+                with self._lock:
+                    if self._stopping:
+                        return
+                    self._changed.wait(timeout=1.0)
+                continue
+
+            with self._lock:
+                if self._stopping:
+                    return
+
+            segment, offset, payload = next_record
+            status, retry_after = self._post(payload)
+            record_size = _HEADER.size + len(payload)
+
+            if status is not None and (200 <= status < 300 or status in REJECTED_STATUS):
+                segment.ack(offset + record_size)
+                with self._lock:
+                    self._disk_bytes -= record_size
+                    if 200 <= status < 300:
+                        self._counters["batches_shipped"] += 1
+                        self._counters["bytes_shipped"] += len(payload)
+                    else:
+                        # Retrying a rejected batch would block the spool forever
+                        self._counters["batches_rejected"] += 1
+                    self._changed.notify_all()
+                backoff = self.retry_initial_seconds
+                continue
+
+            with self._lock:
+                self._counters["retries"] += 1
+            delay = retry_after if retry_after is not None else backoff * random.uniform(0.5, 1.0)
+            if self._stopped.wait(timeout=min(delay, self.retry_max_seconds)):
+                return
+            backoff = min(backoff * 2, self.retry_max_seconds)
+
+    def _post(self, payload: bytes):
+        """HTTP status (None on network errors) and Retry-After seconds."""
+        try:
+            response = self._http.post(self.endpoint, content=payload)
+        except httpx.HTTPError:
+            return None, None
+        retry_after = response.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        return response.status_code, retry_after
+
+    # Control
+
+    def backlog_bytes(self) -> int:
+        with self._lock:
+            return self._disk_bytes
+
+    def drain(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds until everything spooled is shipped."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._disk_bytes > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(timeout=min(remaining, 0.1))
+        return True
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        # Batches are on disk once export() returns; shipping continues in
+        # the background
+        return True
+
+    def shutdown(self):
+        if self._stopped.is_set():
+            return
+        self.drain(self.drain_timeout_seconds)
+        with self._lock:
+            self._stopping = True
+            self._changed.notify_all()
+        self._stopped.set()
+        self._shipper.join(timeout=self.drain_timeout_seconds)
+        with self._lock:
+            self._active_file.close()
+            if self._active.acked() >= self._active_size:
+                self._segments.remove(self._active)
+                self._active.remove()
+            own_left = any(segment.directory == self.directory for segment in self._segments)
+            adopted, self._adopted = self._adopted, {}
+        self._http.close()
+        # Unlocking leaves unshipped batches to the next process that adopts them
+        for lock_fd in adopted.values():
+            os.close(lock_fd)
+        if own_left:
+            os.close(self._lock_fd)
+        else:
+            _remove_directory(self.directory, self._lock_fd)
+        stats = self.stats()
+        if stats["backlog_bytes"]:
+            print(f"Trace spool: {stats['backlog_bytes']} bytes left in {self.root} "
+                  f"for the next run")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "backlog_bytes": self._disk_bytes, "segments": len(self._segments)}
+
+
+_CORRUPT = object()
+
+
+def _read_record(path: str, offset: int, written: Optional[int]):
+    """Payload of the record at `offset`; None at the end, _CORRUPT on a bad checksum."""
+    if written is not None and offset + _HEADER.size > written:
+        return None
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return None
+            length, crc = _HEADER.unpack(header)
+            payload = f.read(length)
+    except FileNotFoundError:
+        return None
+    if len(payload) < length:
+        return None
+    if zlib.crc32(payload) != crc:
+        return _CORRUPT
+    return payload
+
+
+_installed: Optional[SpoolingSpanExporter] = None
+
+
+def install_trace_spool(spool_cfg: Optional[Dict[str, Any]] = None) -> Optional[SpoolingSpanExporter]:
+    """
+    Route the Langfuse span exporter through the on-disk spool.
+
+    Reads `langfuse.spool` from the environment's config when `spool_cfg` is
+    not given and creates the Langfuse client if needed. Returns the
+    exporter, or None when the spool is disabled or tracing is not active.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+
+    if spool_cfg is None:
+        spool_cfg = (load_config().get("langfuse") or {}).get("spool") or {}
+    if not spool_cfg.get("enabled", False):
+        return None
+
+    from langfuse._client.span_processor import LangfuseSpanProcessor
+    from tracing_utils import langfuse_client
+
+    resources = getattr(langfuse_client(), "_resources", None)
+    multi = getattr(otel_trace.get_tracer_provider(), "_active_span_processor", None)
+    for processor in getattr(multi, "_span_processors", ()):
+        batch = getattr(processor, "_batch_processor", None)
+        if not isinstance(processor, LangfuseSpanProcessor) or resources is None or batch is None:
+            continue
+
+        # Same endpoint and headers the SDK gives its OTLP exporter
+        auth = base64.b64encode(f"{resources.public_key}:{resources.secret_key}".encode()).decode()
+        headers = {
+            "Authorization": f"Basic {auth}",
+            "x-langfuse-sdk-name": "python",
+            "x-langfuse-sdk-version": langfuse_version,
+            "x-langfuse-public-key": resources.public_key,
+            **(resources.additional_headers or {}),
+        }
+        export_path = os.getenv("LANGFUSE_OTEL_TRACES_EXPORT_PATH")
+        endpoint = (f"{resources.base_url}/{export_path}" if export_path
+                    else f"{resources.base_url}/api/public/otel/v1/traces")
+
+        _installed = SpoolingSpanExporter.from_config(spool_cfg, endpoint, headers)
+        # Innermost position, so wrapping exporters (tail sampling, PII
+        # masking) run before anything is written to disk
+        holder, attr = batch, "_exporter"
+        while hasattr(getattr(holder, attr), "delegate"):
+            holder, attr = getattr(holder, attr), "delegate"
+        getattr(holder, attr).shutdown()
+        setattr(holder, attr, _installed)
+        print(f"Trace spool enabled: {_installed.directory} "
+              f"({_installed.stats()['backlog_bytes']} bytes pending from earlier runs)")
+        return _installed
+
+    print("No Langfuse span exporter found; trace spool not applied")
+    return None
+
+
+def trace_spool() -> Optional[SpoolingSpanExporter]:
+    """The installed spool exporter, if any."""
+    return _installed
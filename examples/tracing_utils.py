@@ -0,0 +1,343 @@
+"""
+Low-overhead tracing helpers.
+
+`@observe` plus `get_client().update_current_span(...)` on every call adds up
+on hot paths: each update looks the client up again and serializes its
+payload to JSON immediately, even when the span is not being recorded. The
+helpers here keep instrumentation cheap:
+
+- langfuse_client(): the client handle, looked up once per process
+- is_recording(): whether the current span is sampled, so payloads for
+  dropped spans are never built
+- update_span()/update_trace(): inside a `@traced` function, updates are
+  merged and applied once when the function returns, so each payload is
+  serialized a single time; `lazy(fn)` values are only computed then and only
+  if the span is recorded
+- payloads go through the capture policy (capture_policy.py: capture flags,
+  size caps, string transforms) and are encoded with the C-accelerated stdlib
+  json encoder; the SDK stores pre-encoded strings as-is instead of walking
+  them in Python
+- init_client(): the process-wide client, built once from the environment's
+  config (SDK batching/flush/timeout settings, default trace tags and
+  metadata, head/tail sampling, on-disk spool, PII masking) with the capture policy as its
+  `mask` hook, so payloads captured by @observe itself are limited as well
+- LANGFUSE_LOW_OVERHEAD=true: `@traced` stops capturing function
+  arguments/return values by default and the SDK's per-span debug log line is
+  only formatted when debug logging is enabled
+
+See scripts/benchmark_tracing.py for the per-call costs these avoid.
+"""
+
+import contextvars
+import functools
+import inspect
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from langfuse import Langfuse, observe
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import SpanProcessor
+
+from capture_policy import get_capture_policy
+from config import default_trace_metadata, default_trace_tags, langfuse_client_kwargs, load_config
+
+LOW_OVERHEAD = os.getenv("LANGFUSE_LOW_OVERHEAD", "false").lower() == "true"
+
+_client = None
+_default_tags: List[str] = []
+_pending: contextvars.ContextVar[Optional["_PendingUpdates"]] = contextvars.ContextVar(
+    "langfuse_pending_updates", default=None
+)
+
+
+def langfuse_client():
+    """The process-wide Langfuse client, created by init_client() on first use."""
+    if _client is None:
+        return init_client()
+    return _client
+
+
+class _DefaultTraceAttributes(SpanProcessor):
+    """Adds `langfuse.default_tags`/`default_metadata` to every trace's root span."""
+
+    def __init__(self, tags, metadata: Dict[str, str]):
+        self.attributes: Dict[str, Any] = {
+            f"langfuse.trace.metadata.{key}": value for key, value in metadata.items()
+        }
+        if tags:
+            self.attributes["langfuse.trace.tags"] = list(tags)
+
+    def on_start(self, span, parent_context=None):
+        if span.parent is None:
+            span.set_attributes(self.attributes)
+
+
+def init_client(**client_kwargs):
+    """
+    Create the process-wide Langfuse client from the environment's config.
+
+    In order: installs the head sampler (langfuse.sampling), creates the
+    client with the `langfuse.sdk` settings and the capture policy as its
+    `mask` hook, adds default trace tags/metadata, then installs the tail
+    sampler (langfuse.tail_sampling), the on-disk spool (langfuse.spool)
+    and PII masking (observability.pii_masking). Later calls return the
+    same client;
+    `client_kwargs` override config values on the first call only.
+
+    Must run before anything else creates a client (the first client
+    created for a project is the one get_client() returns).
+    """
+    global _client, _default_tags
+    if _client is not None:
+        return _client
+
+    from head_sampling import install_head_sampler
+    from pii_masking import install_pii_masking
+    from trace_spool import install_trace_spool
+    import tail_sampling
+
+    install_head_sampler()
+
+    config = load_config()
+    kwargs = {**langfuse_client_kwargs(config), "mask": get_capture_policy().mask, **client_kwargs}
+    max_retries = ((config.get("langfuse") or {}).get("sdk") or {}).get("max_retries")
+    if max_retries and "httpx_client" not in kwargs:
+        # One pool for all API calls (prompts, datasets, scores)
+        kwargs["httpx_client"] = httpx.Client(
+            timeout=kwargs.get("timeout", 5),
+            transport=httpx.HTTPTransport(retries=int(max_retries)),
+        )
+    # LangfuseSpanProcessor drops the flush_at/flush_interval arguments unless
+    # the matching environment variable is set (an argument then wins over
+    # its value), so set the variables only while the client is built
+    previous = {}
+    for name, key in (("LANGFUSE_FLUSH_AT", "flush_at"), ("LANGFUSE_FLUSH_INTERVAL", "flush_interval")):
+        if kwargs.get(key) is not None:
+            previous[name] = os.environ.get(name)
+            os.environ[name] = str(kwargs[key])
+    try:
+        _client = Langfuse(**kwargs)
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    tags, metadata = default_trace_tags(config), default_trace_metadata(config)
+    _default_tags = tags
+    provider = otel_trace.get_tracer_provider()
+    if (tags or metadata) and hasattr(provider, "add_span_processor"):
+        provider.add_span_processor(_DefaultTraceAttributes(tags, metadata))
+
+    tail_sampling.install_tail_sampler()
+    install_trace_spool()
+    install_pii_masking()
+    return _client
+
+
+def is_recording() -> bool:
+    """True when the current span is sampled and will be exported."""
+    return otel_trace.get_current_span().is_recording()
+
+
+class lazy:
+    """Span payload computed only when (and if) it is written to a recorded span."""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self.fn = fn
+
+
+def _resolve(fields: Dict[str, Any]) -> Dict[str, Any]:
+    policy = get_capture_policy()
+    resolved = {}
+    for key, value in fields.items():
+        if isinstance(value, lazy):
+            value = value.fn()
+        if key in ("input", "output"):
+            value = policy.prepare(key, value)
+        elif key == "metadata":
+            # The SDK stores metadata per top-level key; prepare each one
+            if not policy.captures("metadata"):
+                value = None
+            elif isinstance(value, dict):
+                value = {
+                    k: v if isinstance(v, int) else policy.prepare("metadata", v)
+                    for k, v in value.items()
+                }
+            else:
+                value = policy.prepare("metadata", value)
+        elif key == "tags" and value is not None:
+            # Trace tags set here replace the attribute _DefaultTraceAttributes
+            # put on the root span; keep the configured default tags
+            value = list(dict.fromkeys([*_default_tags, *value]))
+        resolved[key] = value
+    return resolved
+
+
+def _merge(target: Dict[str, Any], fields: Dict[str, Any]):
+    for key, value in fields.items():
+        if key == "metadata" and isinstance(target.get(key), dict) and isinstance(value, dict):
+            target[key] = {**target[key], **value}
+        else:
+            target[key] = value
+
+
+class _PendingUpdates:
+    """Updates collected for one span while its function runs."""
+
+    __slots__ = ("span_id", "as_type", "span", "trace")
+
+    def __init__(self, span_id: int, as_type: Optional[str]):
+        self.span_id = span_id
+        self.as_type = as_type
+        self.span: Dict[str, Any] = {}
+        self.trace: Dict[str, Any] = {}
+
+    def flush(self):
+        langfuse = langfuse_client()
+        if self.span:
+            update = (langfuse.update_current_generation if self.as_type == "generation"
+                      else langfuse.update_current_span)
+            update(**_resolve(self.span))
+        if self.trace:
+            langfuse.update_current_trace(**_resolve(self.trace))
+
+
+def _pending_for_current_span() -> Optional[_PendingUpdates]:
+    pending = _pending.get()
+    if pending is None:
+        return None
+    # Only buffer into the span that owns the buffer, not into a nested span
+    # created by a plain @observe function
+    if otel_trace.get_current_span().get_span_context().span_id != pending.span_id:
+        return None
+    return pending
+
+
+def update_span(**fields):
+    """
+    Update the current span (or generation).
+
+    Deferred to the end of the enclosing `@traced` function when there is
+    one; applied immediately otherwise. Skipped entirely for spans that are
+    not recorded.
+    """
+    if not is_recording():
+        return
+    pending = _pending_for_current_span()
+    if pending is not None:
+        _merge(pending.span, fields)
+        return
+    langfuse = langfuse_client()
+    langfuse.update_current_span(**_resolve(fields))
+
+
+def update_trace(**fields):
+    """
+    Update the current trace; deferred and merged like update_span().
+
+    `tags` are added to the configured `langfuse.default_tags`, not
+    substituted for them.
+    """
+    if not is_recording():
+        return
+    pending = _pending_for_current_span()
+    if pending is not None:
+        _merge(pending.trace, fields)
+        return
+    langfuse_client().update_current_trace(**_resolve(fields))
+
+
+def _begin(as_type: Optional[str]):
+    span = otel_trace.get_current_span()
+    if not span.is_recording():
+        return None, None
+    pending = _PendingUpdates(span.get_span_context().span_id, as_type)
+    return pending, _pending.set(pending)
+
+
+def _end(pending: Optional[_PendingUpdates], token):
+    if pending is not None:
+        _pending.reset(token)
+        pending.flush()
+
+
+def traced(name: Optional[str] = None, as_type: Optional[str] = None,
+           capture_input: Optional[bool] = None, capture_output: Optional[bool] = None):
+    """
+    `@observe` with deferred span updates.
+
+    Calls to update_span()/update_trace() inside the function are applied in
+    one update when it returns. Input/output capture follows the
+    capture_inputs/capture_outputs config flags and is off in low-overhead
+    mode, unless set explicitly.
+    """
+    policy = get_capture_policy()
+    observe_kwargs = {
+        "name": name,
+        "as_type": as_type,
+        "capture_input": (policy.captures("input") and not LOW_OVERHEAD)
+                         if capture_input is None else capture_input,
+        "capture_output": (policy.captures("output") and not LOW_OVERHEAD)
+                          if capture_output is None else capture_output,
+    }
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                pending, token = _begin(as_type)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _end(pending, token)
+
+            return observe(**observe_kwargs)(async_wrapper)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            pending, token = _begin(as_type)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _end(pending, token)
+
+        return observe(**observe_kwargs)(wrapper)
+
+    return decorator
+
+
+def skip_debug_span_formatting():
+    """
+    Only format the SDK's per-span debug log line when debug logging is on.
+
+    LangfuseSpanProcessor.on_end builds that message (a full JSON dump of the
+    span) for every exported span regardless of the log level. Safe to call
+    more than once; a no-op if the SDK internals change.
+    """
+    try:
+        from langfuse._client import span_processor
+        from langfuse.logger import langfuse_logger
+    except ImportError:
+        return
+
+    formatter = getattr(span_processor, "span_formatter", None)
+    if formatter is None or getattr(formatter, "_skips_when_not_debug", False):
+        return
+
+    def span_formatter(span):
+        if langfuse_logger.isEnabledFor(logging.DEBUG):
+            return formatter(span)
+        return ""
+
+    span_formatter._skips_when_not_debug = True
+    span_processor.span_formatter = span_formatter
+
+
+if LOW_OVERHEAD:
+    skip_debug_span_formatting()
@@ -6,14 +6,21 @@ Usage:
 """
 
 import argparse
+import os
+import sys
 from datetime import datetime, timedelta
-from langfuse import Langfuse
 from collections import defaultdict
 
 
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+from tracing_utils import langfuse_client  # noqa: E402
+
+
 def analyze_costs(days: int = 7):
     """Analyze costs from Langfuse metrics."""
-    langfuse = Langfuse()
+    langfuse = langfuse_client()
     
     print(f"Analyzing costs from last {days} days...")
     print("="*60)
@@ -0,0 +1,177 @@
+"""
+Dataset load time with and without the local dataset snapshot cache
+
+Starts the stand-in server (scripts/stub_server.py) in-process, creates a
+dataset of --items items on it and loads and iterates it:
+
+- sdk: Langfuse.get_dataset(), every page downloaded on every call
+- cold: examples/dataset_cache.py with an empty cache (first sync)
+- unchanged: the same cache again, nothing changed remotely
+- appended: after --append new items were added remotely
+- full: refresh=True, the periodic full sync that picks up edits/deletions
+
+`first ms` is how long until the first item is available to an experiment,
+`list calls` the item list requests sent, `peak MB` the Python heap peak
+while loading and iterating (tracemalloc).
+
+Usage:
+    python scripts/benchmark_dataset_cache.py
+    python scripts/benchmark_dataset_cache.py --items 50000 --append 200 --stub-langfuse-latency-ms 30 \\
+        --output bench_dataset_cache.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+DATASET = "benchmark-dataset-cache"
+
+
+def start_stub_server(args: argparse.Namespace):
+    """Run the stand-in server on a background thread and point the SDKs at it."""
+    import stub_server
+
+    # No latency while seeding; --stub-langfuse-latency-ms applies afterwards
+    stub_args = stub_server.build_parser().parse_args(["--port", "0", "--ingestion-latency-ms", "0"])
+    server = stub_server.serve(stub_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "stub",
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-stub",
+        "LANGFUSE_SECRET_KEY": "sk-lf-stub",
+    })
+    # configs/development.yaml turns SDK debug logging on
+    os.environ.setdefault("LANGFUSE_DEBUG", "false")
+    return base_url, stub_args
+
+
+def stub_stats(base_url: str):
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.loads(response.read())
+
+
+def add_items(langfuse, start: int, count: int):
+    def create(i):
+        langfuse.create_dataset_item(
+            dataset_name=DATASET,
+            input={"question": f"Question {i}: how does tracing work for request {i}?"},
+            expected_output={"answer": f"Tracing records every step of request {i}."},
+            metadata={"difficulty": ["easy", "medium", "hard"][i % 3], "index": i},
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(create, range(start, start + count)))
+
+
+def measure(name: str, load, base_url: str):
+    """Load the dataset and iterate all its items."""
+    calls_before = stub_stats(base_url).get("langfuse.dataset_items.list_requests", 0)
+    tracemalloc.start()
+    start = time.perf_counter()
+    dataset = load()
+    first_ms = None
+    count = 0
+    for item in dataset.items:
+        if first_ms is None:
+            first_ms = (time.perf_counter() - start) * 1000
+        count += item.input is not None
+    wall_s = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    row = {
+        "variant": name,
+        "items": count,
+        "wall_s": wall_s,
+        "first_ms": first_ms or 0.0,
+        "list_calls": stub_stats(base_url).get("langfuse.dataset_items.list_requests", 0) - calls_before,
+        "peak_mb": peak / 1e6,
+    }
+    print(f"  {name}: {wall_s:.2f}s")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure dataset loading with the local snapshot cache')
+    parser.add_argument('--items', type=int, default=20000, help='Dataset items')
+    parser.add_argument('--append', type=int, default=100, help='Items added before the incremental sync')
+    parser.add_argument('--page-size', type=int, default=100, help='Items per list request')
+    parser.add_argument('--stub-langfuse-latency-ms', type=float, default=20, help='Median Langfuse API latency')
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+
+    args = parser.parse_args()
+
+    base_url, stub_args = start_stub_server(args)
+
+    from dataset_cache import DatasetCache
+    from tracing_utils import init_client
+
+    langfuse = init_client()
+    langfuse.create_dataset(name=DATASET, description="Benchmark items")
+    print(f"Creating {args.items} items...")
+    add_items(langfuse, 0, args.items)
+    stub_args.ingestion_latency_ms = args.stub_langfuse_latency_ms
+
+    cache = DatasetCache(os.path.join(tempfile.mkdtemp(), "datasets.sqlite"), page_size=args.page_size,
+                         langfuse=langfuse)
+    print(f"Benchmarking {args.items} items against {base_url}, {args.stub_langfuse_latency_ms} ms API latency")
+
+    rows = [
+        measure("sdk", lambda: langfuse.get_dataset(DATASET, fetch_items_page_size=args.page_size), base_url),
+        measure("cold", lambda: cache.get_dataset(DATASET), base_url),
+        measure("unchanged", lambda: cache.get_dataset(DATASET), base_url),
+    ]
+    stub_args.ingestion_latency_ms = 0
+    add_items(langfuse, args.items, args.append)
+    stub_args.ingestion_latency_ms = args.stub_langfuse_latency_ms
+    rows.append(measure("appended", lambda: cache.get_dataset(DATASET), base_url))
+    rows.append(measure("full", lambda: cache.get_dataset(DATASET, refresh=True), base_url))
+
+    # The cache must serve exactly the items the API serves
+    expected = {(item.id, item.updated_at) for item in
+                langfuse.get_dataset(DATASET, fetch_items_page_size=args.page_size).items}
+    consistent = {(item.id, item.updated_at) for item in cache.get_dataset(DATASET).items} == expected
+    cache.close()
+    cache_mb = os.path.getsize(cache.path) / 1e6
+    langfuse.flush()
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": rows,
+        "consistent": consistent,
+        "cache_file_mb": cache_mb,
+    }
+
+    print("\n" + "="*66)
+    print(f"{'variant':>10s} {'items':>7s} {'wall s':>8s} {'first ms':>9s} {'list calls':>11s} {'peak MB':>8s} {'speedup':>8s}")
+    print("-"*66)
+    for row in rows:
+        print(f"{row['variant']:>10s} {row['items']:7d} {row['wall_s']:8.2f} {row['first_ms']:9.1f} "
+              f"{row['list_calls']:11d} {row['peak_mb']:8.1f} {rows[0]['wall_s'] / row['wall_s']:7.1f}x")
+    print("="*66)
+    print(f"Cache file: {cache_mb:.1f} MB, items match the API: {consistent}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Dataset experiment wall time per concurrency limit
+
+Starts the stand-in server (scripts/stub_server.py) in-process, creates a
+dataset of --items questions on it and runs the example 04 QA task over it
+with examples/experiment_runner.py for every --concurrency value (1 is the
+serial loop), optionally under a per-model --rate-limit. Reports wall time,
+items/s, time spent waiting on the rate limit, and checks that every item
+got its own dataset run item and that results came back in item order.
+
+With --changed-items K it then measures an incremental re-run: a full run
+into an empty examples/experiment_store.py store, K items edited, and a
+second run that should only execute those K items and link the rest.
+
+Usage:
+    python scripts/benchmark_experiments.py
+    python scripts/benchmark_experiments.py --items 500 --concurrency 1 8 32 --rate-limit 600 --output bench_experiments.json
+    python scripts/benchmark_experiments.py --items 500 --concurrency 8 --changed-items 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+DATASET = "benchmark-experiment-dataset"
+MODEL = "gpt-4o-mini"
+
+
+def start_stub_server(args: argparse.Namespace) -> str:
+    """Run the stand-in server on a background thread and point the SDKs at it."""
+    import stub_server
+
+    stub_args = stub_server.build_parser().parse_args([
+        "--port", "0",
+        "--chat-latency-ms", str(args.stub_chat_latency_ms),
+        "--chat-latency-p99-ms", str(args.stub_chat_latency_ms * 3),
+        "--error-rate", str(args.stub_error_rate),
+    ])
+    server = stub_server.serve(stub_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "stub",
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-stub",
+        "LANGFUSE_SECRET_KEY": "sk-lf-stub",
+    })
+    # configs/development.yaml turns SDK debug logging on
+    os.environ.setdefault("LANGFUSE_DEBUG", "false")
+    return base_url
+
+
+def stub_stats(base_url: str):
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure parallel dataset experiment throughput')
+    parser.add_argument('--items', type=int, default=60, help='Dataset items')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='Concurrency limits')
+    parser.add_argument('--rate-limit', type=float, default=None, help=f'Requests per minute for {MODEL}')
+    parser.add_argument('--stub-chat-latency-ms', type=float, default=200, help='Median chat completion latency')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help='Share of chat requests that fail')
+    parser.add_argument('--changed-items', type=int, default=None,
+                        help='Also measure a re-run with a result store after editing this many items')
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+
+    args = parser.parse_args()
+
+    base_url = start_stub_server(args)
+
+    from experiment_runner import ExperimentRunner
+    from tracing_utils import init_client
+    import importlib
+
+    langfuse = init_client()
+    qa_system = importlib.import_module("04_dataset_evaluation").qa_system
+
+    langfuse.create_dataset(name=DATASET, description="Benchmark questions")
+    for i in range(args.items):
+        langfuse.create_dataset_item(dataset_name=DATASET, input={"question": f"Question {i}: what is tracing?"},
+                                     expected_output={"answer": "Tracing records every step."})
+    dataset = langfuse.get_dataset(DATASET)
+    print(f"Benchmarking {len(dataset.items)} items against {base_url}, "
+          f"{args.stub_chat_latency_ms} ms chat latency, rate limit {args.rate_limit or 'none'}")
+
+    def task(item, root_span):
+        return {"question": item.input["question"], "answer": qa_system(item.input["question"])}
+
+    rows = []
+    for concurrency in args.concurrency:
+        runner = ExperimentRunner(concurrency=concurrency,
+                                  rate_limits={MODEL: args.rate_limit} if args.rate_limit else None,
+                                  progress_interval=float("inf"))
+        run_name = f"benchmark-c{concurrency}-{int(time.time())}"
+        linked_before = stub_stats(base_url).get("langfuse.dataset_run_items.created", 0)
+
+        start = time.perf_counter()
+        results = runner.run(dataset.items, task, run_name=run_name, run_metadata={"model": MODEL})
+        wall_s = time.perf_counter() - start
+
+        in_order = all(
+            result["item_id"] == item.id and (result["error"] or result["output"]["question"] == item.input["question"])
+            for item, result in zip(dataset.items, results)
+        )
+        rows.append({
+            "concurrency": concurrency,
+            "items": len(results),
+            "errors": sum(1 for r in results if r["error"]),
+            "wall_s": wall_s,
+            "items_per_s": len(results) / wall_s,
+            "rate_limited_s": sum(r["rate_limited_s"] for r in results),
+            "linked_run_items": stub_stats(base_url).get("langfuse.dataset_run_items.created", 0) - linked_before,
+            "distinct_traces": len({r["trace_id"] for r in results}),
+            "in_order": in_order,
+        })
+        print(f"  concurrency={concurrency}: {wall_s:.1f}s")
+
+    incremental = []
+    if args.changed_items is not None:
+        from experiment_store import ExperimentStore
+
+        store = ExperimentStore(os.path.join(tempfile.mkdtemp(), "results.sqlite"))
+        runner = ExperimentRunner(concurrency=max(args.concurrency), progress_interval=float("inf"))
+        for phase in ("full", "incremental"):
+            if phase == "incremental":
+                for item in dataset.items[:args.changed_items]:
+                    langfuse.create_dataset_item(dataset_name=DATASET, id=item.id,
+                                                 input={"question": item.input["question"] + " (edited)"},
+                                                 expected_output=item.expected_output)
+                dataset = langfuse.get_dataset(DATASET)
+            run_name = f"benchmark-store-{phase}-{int(time.time())}"
+            linked_before = stub_stats(base_url).get("langfuse.dataset_run_items.created", 0)
+
+            start = time.perf_counter()
+            results = runner.run(dataset.items, task, run_name=run_name, run_metadata={"model": MODEL},
+                                 store=store)
+            wall_s = time.perf_counter() - start
+
+            incremental.append({
+                "phase": phase,
+                "items": len(results),
+                "executed": sum(1 for r in results if not r["cached"]),
+                "reused": sum(1 for r in results if r["cached"]),
+                "errors": sum(1 for r in results if r["error"]),
+                "wall_s": wall_s,
+                "linked_run_items": stub_stats(base_url).get("langfuse.dataset_run_items.created", 0) - linked_before,
+            })
+            print(f"  store {phase}: {wall_s:.1f}s")
+        store.close()
+
+    langfuse.flush()
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": rows,
+        "incremental": incremental,
+    }
+
+    print("\n" + "="*86)
+    print(f"{'conc':>5s} {'items':>6s} {'errors':>7s} {'wall s':>8s} {'items/s':>8s} {'speedup':>8s} "
+          f"{'limited s':>10s} {'linked':>7s} {'traces':>7s} {'ordered':>8s}")
+    print("-"*86)
+    for row in rows:
+        print(f"{row['concurrency']:5d} {row['items']:6d} {row['errors']:7d} {row['wall_s']:8.2f} "
+              f"{row['items_per_s']:8.1f} {rows[0]['wall_s'] / row['wall_s']:7.1f}x {row['rate_limited_s']:10.1f} "
+              f"{row['linked_run_items']:7d} {row['distinct_traces']:7d} {str(row['in_order']):>8s}")
+    print("="*86)
+
+    if incremental:
+        print(f"\n{'phase':>12s} {'items':>6s} {'executed':>9s} {'reused':>7s} {'errors':>7s} {'wall s':>8s} {'linked':>7s}")
+        print("-"*62)
+        for row in incremental:
+            print(f"{row['phase']:>12s} {row['items']:6d} {row['executed']:9d} {row['reused']:7d} "
+                  f"{row['errors']:7d} {row['wall_s']:8.2f} {row['linked_run_items']:7d}")
+        print("="*62)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
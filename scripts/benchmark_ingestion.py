@@ -0,0 +1,187 @@
+"""
+Span ingestion throughput for different SDK batching settings
+
+Starts the local OTLP collector (scripts/otlp_collector.py) in-process and,
+for every combination of --flush-at and --flush-interval, runs a fresh
+worker process that emits traces through the configured Langfuse client
+(examples/tracing_utils.init_client) as fast as it can, then flushes. The
+collector's decoded counts are combined with the worker's timings:
+
+- app spans/s: how fast the application created spans
+- delivered spans/s: spans received by the collector over emit + flush time
+- dropped: spans the SDK's bounded export queue discarded
+- requests, mean batch size, bytes per span, export latency p50/p99
+- flush: how long the final flush blocked the application
+
+Usage:
+    python scripts/benchmark_ingestion.py
+    python scripts/benchmark_ingestion.py --traces 2000 --flush-at 10 100 512 --flush-interval 0.5 5 \\
+        --collector-latency-ms 50 --collector-error-rate 0.02 --output bench_ingestion.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+
+def start_collector(args: argparse.Namespace) -> str:
+    """Run the collector on a background thread; returns its base URL."""
+    import otlp_collector
+
+    collector_args = otlp_collector.build_parser().parse_args([
+        "--port", "0",
+        "--latency-ms", str(args.collector_latency_ms),
+        "--latency-p99-ms", str(args.collector_latency_p99_ms or args.collector_latency_ms * 4),
+        "--error-rate", str(args.collector_error_rate),
+    ])
+    server = otlp_collector.serve(collector_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def collector_call(base_url: str, path: str, method: str = "GET") -> Dict[str, Any]:
+    request = urllib.request.Request(f"{base_url}{path}", method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_worker(args: argparse.Namespace):
+    """Emit traces with the given settings and print timings as JSON."""
+    from langfuse import observe
+    from tracing_utils import init_client
+
+    langfuse = init_client(flush_at=args.flush_at[0], flush_interval=args.flush_interval[0])
+    payload = "x" * args.payload_bytes
+
+    @observe(name="ingest-child")
+    def child(text):
+        return len(text)
+
+    @observe(name="ingest-root")
+    def root(text):
+        for _ in range(args.spans_per_trace - 1):
+            child(text)
+        return len(text)
+
+    start = time.perf_counter()
+    for _ in range(args.traces):
+        root(payload)
+    emit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    langfuse.flush()
+    flush_s = time.perf_counter() - start
+
+    print(json.dumps({"emitted": args.traces * args.spans_per_trace, "emit_s": emit_s, "flush_s": flush_s}))
+
+
+def run_case(args: argparse.Namespace, base_url: str, flush_at: int, flush_interval: float) -> Dict[str, Any]:
+    env = {
+        **os.environ,
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-local",
+        "LANGFUSE_SECRET_KEY": "sk-lf-local",
+        "LANGFUSE_FLUSH_AT": str(flush_at),
+        "LANGFUSE_FLUSH_INTERVAL": str(flush_interval),
+        "LANGFUSE_DEBUG": "false",
+    }
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--flush-at", str(flush_at), "--flush-interval", str(flush_interval),
+        "--traces", str(args.traces), "--spans-per-trace", str(args.spans_per_trace),
+        "--payload-bytes", str(args.payload_bytes),
+    ]
+    collector_call(base_url, "/reset", "POST")
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    worker = json.loads(output.strip().splitlines()[-1])
+    # Exports still in flight when the worker exited are counted too
+    time.sleep(0.2)
+    collected = collector_call(base_url, "/stats")
+
+    total_s = worker["emit_s"] + worker["flush_s"]
+    return {
+        "flush_at": flush_at,
+        "flush_interval": flush_interval,
+        "emitted": worker["emitted"],
+        "received": collected["spans"],
+        "dropped": worker["emitted"] - collected["spans"],
+        "app_spans_per_s": worker["emitted"] / worker["emit_s"],
+        "delivered_spans_per_s": collected["spans"] / total_s if total_s else 0.0,
+        "flush_s": worker["flush_s"],
+        "requests": collected["requests"],
+        "rejected": collected["rejected"],
+        "mean_batch": collected["batch_size"]["mean"],
+        "bytes_per_span": collected["bytes_per_span"],
+        "latency_p50_ms": collected["latency_ms"]["p50"],
+        "latency_p99_ms": collected["latency_ms"]["p99"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure span ingestion throughput per SDK setting')
+    parser.add_argument('--traces', type=int, default=1000, help='Traces per case')
+    parser.add_argument('--spans-per-trace', type=int, default=5, help='Spans per trace (root + children)')
+    parser.add_argument('--payload-bytes', type=int, default=200, help='Captured input size per span')
+    parser.add_argument('--flush-at', type=int, nargs='+', default=[10, 100, 512], help='Batch sizes (LANGFUSE_FLUSH_AT)')
+    parser.add_argument('--flush-interval', type=float, nargs='+', default=[1.0, 5.0],
+                        help='Flush intervals in seconds (LANGFUSE_FLUSH_INTERVAL)')
+    parser.add_argument('--collector-latency-ms', type=float, default=0, help='Injected median export latency')
+    parser.add_argument('--collector-latency-p99-ms', type=float, default=None, help='Injected p99 export latency')
+    parser.add_argument('--collector-error-rate', type=float, default=0.0, help='Share of exports that fail')
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    base_url = start_collector(args)
+    print(f"Benchmarking span ingestion against {base_url}: {args.traces} traces x "
+          f"{args.spans_per_trace} spans, {args.payload_bytes} B payloads, "
+          f"collector latency {args.collector_latency_ms} ms, error rate {args.collector_error_rate:.0%}")
+
+    rows = []
+    for flush_at in args.flush_at:
+        for flush_interval in args.flush_interval:
+            row = run_case(args, base_url, flush_at, flush_interval)
+            rows.append(row)
+            print(f"  flush_at={flush_at} flush_interval={flush_interval}s: "
+                  f"{row['delivered_spans_per_s']:.0f} spans/s delivered")
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "worker")},
+        "results": rows,
+    }
+
+    print("\n" + "="*100)
+    print(f"{'flush_at':>8s} {'interval':>8s} {'app/s':>9s} {'deliv/s':>9s} {'dropped':>8s} {'flush s':>8s} "
+          f"{'reqs':>6s} {'batch':>7s} {'B/span':>7s} {'p50 ms':>7s} {'p99 ms':>7s}")
+    print("-"*100)
+    for row in rows:
+        print(f"{row['flush_at']:8d} {row['flush_interval']:8.1f} {row['app_spans_per_s']:9.0f} "
+              f"{row['delivered_spans_per_s']:9.0f} {row['dropped']:8d} {row['flush_s']:8.2f} "
+              f"{row['requests']:6d} {row['mean_batch']:7.1f} {row['bytes_per_span']:7.0f} "
+              f"{row['latency_p50_ms']:7.1f} {row['latency_p99_ms']:7.1f}")
+    print("="*100)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
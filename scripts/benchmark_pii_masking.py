@@ -0,0 +1,194 @@
+"""
+Throughput benchmark for PII masking of span payloads
+
+Masks synthetic RAG-shaped payloads (chat messages plus retrieved documents
+with emails, phone numbers, SSNs and card numbers sprinkled in) and reports
+MB/s of string data scanned for:
+
+- per_field: one regex per configured field over every string, the
+  straightforward implementation
+- single_pass: examples/pii_masking.py, one combined scanner per string
+- batch: mask_batch() over the same data split into span-sized payloads, as
+  MaskingSpanExporter does for each batch of queued spans
+
+Usage:
+    python scripts/benchmark_pii_masking.py
+    python scripts/benchmark_pii_masking.py --payload-kb 10 100 1000 --pii-rate 0.05 --output bench_pii.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+from pii_masking import DETECTORS, REPLACEMENTS, PIIMasker, luhn_valid  # noqa: E402
+
+WORDS = (
+    "langfuse traces every retrieval step so the answer can be checked against "
+    "its context documents from 2024 release v3 with 42 spans per request and "
+    "latency under 250 ms for the p95 of production traffic"
+).split()
+
+PII_SAMPLES = (
+    "jane.doe@example.com",
+    "ops-team+alerts@corp.example.co.uk",
+    "555-123-4567",
+    "(555) 987-6543",
+    "+44 20 7946 0958",
+    "123-45-6789",
+    "4111 1111 1111 1111",
+    "5500-0000-0000-0004",
+)
+
+
+def make_text(rng: random.Random, words: int, pii_rate: float) -> str:
+    out = []
+    for _ in range(words):
+        out.append(rng.choice(PII_SAMPLES) if rng.random() < pii_rate else rng.choice(WORDS))
+    return " ".join(out)
+
+
+def make_payloads(total_bytes: int, span_bytes: int, pii_rate: float, seed: int) -> List[Dict[str, Any]]:
+    """Span payloads of about `span_bytes` each, `total_bytes` of strings overall."""
+    rng = random.Random(seed)
+    payloads = []
+    produced = 0
+    while produced < total_bytes:
+        payload = {
+            "messages": [
+                {"role": "system", "content": "Answer using only the provided context."},
+                {"role": "user", "content": make_text(rng, 30, pii_rate)},
+            ],
+            "documents": [
+                {"id": f"doc-{len(payloads):05d}-{i}", "content": make_text(rng, span_bytes // 40, pii_rate)}
+                for i in range(3)
+            ],
+            "num_results": 3,
+        }
+        payloads.append(payload)
+        produced += string_bytes(payload)
+    return payloads
+
+
+def string_bytes(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(string_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(string_bytes(v) for v in value)
+    return 0
+
+
+def per_field_masker(fields: List[str]) -> Callable[[Any], Any]:
+    """One compiled regex per field, each applied to every string."""
+    patterns = [(re.compile(DETECTORS[field]), field) for field in fields]
+
+    def replace(field):
+        if field == "credit_card":
+            return lambda m: REPLACEMENTS[field] if luhn_valid(m.group()) else m.group()
+        return REPLACEMENTS[field]
+
+    replacements = [(pattern, replace(field)) for pattern, field in patterns]
+
+    def mask(value):
+        if isinstance(value, str):
+            for pattern, replacement in replacements:
+                value = pattern.sub(replacement, value)
+            return value
+        if isinstance(value, dict):
+            return {k: mask(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [mask(v) for v in value]
+        return value
+
+    return mask
+
+
+def count_placeholders(payloads: List[Any]) -> int:
+    encoded = json.dumps(payloads)
+    return sum(encoded.count(token) for token in REPLACEMENTS.values())
+
+
+def measure(fn: Callable[[], Any], repeats: int) -> float:
+    """Median seconds over repeats."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure PII masking throughput')
+    parser.add_argument('--payload-kb', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Total string data per case, in KB')
+    parser.add_argument('--span-bytes', type=int, default=2000, help='Approximate bytes per span payload')
+    parser.add_argument('--pii-rate', type=float, default=0.02, help='Share of words that are PII')
+    parser.add_argument('--fields', nargs='+', default=list(DETECTORS), choices=list(DETECTORS),
+                        help='Detectors to enable')
+    parser.add_argument('--repeats', type=int, default=5, help='Repeats per case (median reported)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+
+    args = parser.parse_args()
+
+    masker = PIIMasker(args.fields)
+    per_field = per_field_masker(masker.fields)
+
+    print(f"Benchmarking PII masking ({', '.join(masker.fields)}), "
+          f"{args.pii_rate:.0%} PII words, {args.span_bytes} B spans")
+
+    rows = []
+    for kb in args.payload_kb:
+        payloads = make_payloads(kb * 1000, args.span_bytes, args.pii_rate, args.seed)
+        size = sum(string_bytes(p) for p in payloads)
+
+        variants = {
+            "per_field": lambda: [per_field(p) for p in payloads],
+            "single_pass": lambda: [masker.mask(p) for p in payloads],
+            "batch": lambda: masker.mask_batch(payloads),
+        }
+        for variant, fn in variants.items():
+            seconds = measure(fn, args.repeats)
+            rows.append({
+                "variant": variant,
+                "payload_bytes": size,
+                "spans": len(payloads),
+                "ms": seconds * 1000,
+                "mb_per_s": size / seconds / 1e6,
+                "replacements": count_placeholders(fn()),
+            })
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": rows,
+    }
+
+    print("\n" + "="*70)
+    print(f"{'variant':14s} {'bytes':>10s} {'spans':>6s} {'ms':>9s} {'MB/s':>8s} {'replaced':>9s}")
+    print("-"*70)
+    for row in rows:
+        print(f"{row['variant']:14s} {row['payload_bytes']:10d} {row['spans']:6d} {row['ms']:9.2f} "
+              f"{row['mb_per_s']:8.1f} {row['replacements']:9d}")
+    print("="*70)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Request-path prompt lookup latency with and without the prompt cache
+
+Starts the stand-in server (scripts/stub_server.py) in-process, creates a
+prompt on it and then has --threads workers look the prompt up for
+--duration seconds, as use_prompt_in_application() does per request:
+
+- direct: Langfuse.get_prompt() with the SDK cache disabled, one prompt API
+  round trip per lookup
+- cached: examples/prompt_cache.py with a short --ttl, so entries go stale
+  during the run and are refreshed in the background
+- registry: the same cache seeded at startup from a snapshot file
+  (examples/prompt_registry.py), so even the first lookup is local
+
+`first ms` is the slowest first lookup of any worker, i.e. how long a cold
+worker waits for its prompt before serving.
+
+During the middle --outage-share of each run prompt fetches fail, to show
+which lookups error out and which keep being served the last good copy.
+
+Usage:
+    python scripts/benchmark_prompt_cache.py
+    python scripts/benchmark_prompt_cache.py --threads 16 --duration 10 --ttl 0.5 --prompt-latency-ms 80 \\
+        --output bench_prompt_cache.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+from latency import percentile  # noqa: E402
+
+PROMPT_NAME = "customer-support-prompt"
+
+
+def start_stub_server(args: argparse.Namespace) -> str:
+    """Run the stand-in server on a background thread and point the SDK at it."""
+    import stub_server
+
+    stub_args = stub_server.build_parser().parse_args([
+        "--port", "0",
+        "--prompt-latency-ms", str(args.prompt_latency_ms),
+    ])
+    server = stub_server.serve(stub_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-stub",
+        "LANGFUSE_SECRET_KEY": "sk-lf-stub",
+    })
+    # configs/development.yaml turns SDK debug logging on
+    os.environ.setdefault("LANGFUSE_DEBUG", "false")
+    return base_url
+
+
+def prompt_requests(base_url: str) -> int:
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.loads(response.read()).get("langfuse.prompts.requests", 0)
+
+
+class Outage:
+    """Makes prompt fetches fail between two points of a run."""
+
+    def __init__(self):
+        self.active = False
+
+    def wrap(self, fetch: Callable[..., Any]) -> Callable[..., Any]:
+        def fetch_or_fail(*args, **kwargs):
+            if self.active:
+                raise ConnectionError("Simulated prompt API outage")
+            return fetch(*args, **kwargs)
+        return fetch_or_fail
+
+
+def run_variant(args: argparse.Namespace, base_url: str, lookup: Callable[[], Any],
+                outage: Outage) -> Dict[str, Any]:
+    latencies: List[float] = []
+    first: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    outage_start = args.duration * (0.5 - args.outage_share / 2)
+    outage_end = args.duration * (0.5 + args.outage_share / 2)
+
+    def worker():
+        nonlocal errors
+        first_lookup = True
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= args.duration:
+                return
+            outage.active = outage_start <= elapsed < outage_end
+            lookup_start = time.perf_counter()
+            try:
+                lookup()
+            except Exception:
+                with lock:
+                    errors += 1
+            with lock:
+                latencies.append((time.perf_counter() - lookup_start) * 1000)
+                if first_lookup:
+                    first.append(latencies[-1])
+            first_lookup = False
+            time.sleep(args.think_ms / 1000)
+
+    before = prompt_requests(base_url)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    outage.active = False
+
+    return {
+        "lookups": len(latencies),
+        "lookups_per_s": len(latencies) / args.duration,
+        "errors": errors,
+        "backend_requests": prompt_requests(base_url) - before,
+        "first_ms": max(first, default=0.0),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies, default=0.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure request-path prompt lookup latency')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent request workers')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per variant')
+    parser.add_argument('--think-ms', type=float, default=10, help='Pause between a worker\'s lookups')
+    parser.add_argument('--ttl', type=float, default=1.0, help='Prompt cache TTL in seconds')
+    parser.add_argument('--prompt-latency-ms', type=float, default=50, help='Median stub prompt API latency')
+    parser.add_argument('--outage-share', type=float, default=0.2,
+                        help='Share of each run (in the middle) during which prompt fetches fail')
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+
+    args = parser.parse_args()
+
+    from prompt_cache import PromptCache, _fetch_from_langfuse
+    from prompt_registry import PromptRegistry, export_snapshot
+    from tracing_utils import init_client
+
+    base_url = start_stub_server(args)
+    langfuse = init_client()
+    langfuse.create_prompt(name=PROMPT_NAME, prompt="Customer tier: {{tier}}\nQuestion: {{question}}",
+                           labels=["production"], config={"model": "gpt-4o-mini"})
+
+    print(f"Benchmarking prompt lookups against {base_url}: {args.threads} threads for "
+          f"{args.duration}s, {args.prompt_latency_ms} ms prompt API, ttl {args.ttl}s, "
+          f"{args.outage_share:.0%} outage")
+
+    outage = Outage()
+    direct_fetch = outage.wrap(_fetch_from_langfuse)
+    cache = PromptCache(ttl_seconds=args.ttl, retry_seconds=args.ttl, fetch=outage.wrap(_fetch_from_langfuse))
+
+    snapshot = os.path.join(tempfile.mkdtemp(), "snapshot.json")
+    export_snapshot(snapshot, names=[PROMPT_NAME])
+    registry = PromptRegistry()
+    registry.load_snapshot(snapshot)
+    seeded = PromptCache(ttl_seconds=args.ttl, retry_seconds=args.ttl, fetch=outage.wrap(_fetch_from_langfuse))
+    for name, label, version, prompt in registry.entries():
+        seeded.put(name, prompt, label=label, version=version)
+
+    variants = {
+        "direct": lambda: direct_fetch(PROMPT_NAME, label="production"),
+        "cached": lambda: cache.get(PROMPT_NAME, label="production"),
+        "registry": lambda: seeded.get(PROMPT_NAME, label="production"),
+    }
+
+    rows = []
+    for variant, lookup in variants.items():
+        row = {"variant": variant, **run_variant(args, base_url, lookup, outage)}
+        rows.append(row)
+        print(f"  {variant}: p99 {row['p99_ms']:.2f} ms, {row['backend_requests']} prompt API requests")
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": rows,
+        "cache_stats": cache.stats(),
+        "registry_cache_stats": seeded.stats(),
+    }
+
+    print("\n" + "="*88)
+    print(f"{'variant':10s} {'lookups':>8s} {'lookups/s':>10s} {'errors':>7s} {'backend':>8s} "
+          f"{'first ms':>9s} {'p50 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    print("-"*88)
+    for row in rows:
+        print(f"{row['variant']:10s} {row['lookups']:8d} {row['lookups_per_s']:10.0f} {row['errors']:7d} "
+              f"{row['backend_requests']:8d} {row['first_ms']:9.2f} {row['p50_ms']:9.3f} "
+              f"{row['p99_ms']:9.3f} {row['max_ms']:9.2f}")
+    print("="*88)
+    print(f"Cache: {result['cache_stats']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
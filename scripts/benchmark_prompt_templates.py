@@ -0,0 +1,132 @@
+"""
+Render throughput of prompt templates
+
+Renders every template in prompts/*.json (system + user message) with
+synthetic variables and reports renders/s for:
+
+- sdk_compile: the SDK's TemplateParser on every message, what
+  PromptClient.compile() does per call
+- precompiled: examples/prompt_templates.py, parsed once, render() per row
+- batch_rows: render_batch() over a list of variable dicts
+- batch_frame: render_batch() over a pandas DataFrame of the same rows
+
+Usage:
+    python scripts/benchmark_prompt_templates.py
+    python scripts/benchmark_prompt_templates.py --rows 100000 --value-chars 500 --output bench_templates.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+import pandas as pd  # noqa: E402
+from langfuse.model import TemplateParser  # noqa: E402
+
+from prompt_templates import load_prompt_templates  # noqa: E402
+
+
+def make_rows(variables: List[str], rows: int, value_chars: int, seed: int) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz     "
+    return [
+        {name: "".join(rng.choice(alphabet) for _ in range(rng.randint(1, value_chars))) for name in variables}
+        for _ in range(rows)
+    ]
+
+
+def measure(fn: Callable[[], Any], repeats: int) -> float:
+    """Median seconds over repeats."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure prompt template render throughput')
+    parser.add_argument('--rows', type=int, default=20000, help='Variable rows per template')
+    parser.add_argument('--value-chars', type=int, default=200, help='Maximum characters per variable value')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats per case (median reported)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+
+    args = parser.parse_args()
+
+    templates = {}
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "prompts", "*.json"))):
+        for name, entry in load_prompt_templates(path).items():
+            templates[f"{os.path.basename(path)[:-5]}/{name}"] = entry["template"]
+
+    print(f"Benchmarking {len(templates)} templates from prompts/*.json, {args.rows} rows each")
+
+    rows_out = []
+    for name, template in templates.items():
+        rows = make_rows(template.variables, args.rows, args.value_chars, args.seed)
+        frame = pd.DataFrame(rows, columns=template.variables)
+        messages = template.messages
+
+        variants = {
+            "sdk_compile": lambda: [
+                [{**m, "content": TemplateParser.compile_template(m["content"], row)} for m in messages]
+                for row in rows
+            ],
+            "precompiled": lambda: [template.render(row) for row in rows],
+            "batch_rows": lambda: template.render_batch(rows),
+            "batch_frame": lambda: template.render_batch(frame),
+        }
+        expected = variants["sdk_compile"]()
+        for variant, fn in variants.items():
+            if fn() != expected:
+                raise SystemExit(f"{variant} output differs from the SDK for {name}")
+            seconds = measure(fn, args.repeats)
+            rows_out.append({
+                "template": name,
+                "variant": variant,
+                "variables": len(template.variables),
+                "renders_per_s": args.rows / seconds,
+                "us_per_render": seconds / args.rows * 1e6,
+            })
+
+    summary = {}
+    for variant in ("sdk_compile", "precompiled", "batch_rows", "batch_frame"):
+        rates = [row["renders_per_s"] for row in rows_out if row["variant"] == variant]
+        summary[variant] = statistics.median(rates)
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": rows_out,
+        "median_renders_per_s": summary,
+    }
+
+    print("\n" + "="*78)
+    print(f"{'template':42s} {'variant':12s} {'vars':>4s} {'renders/s':>10s} {'us':>7s}")
+    print("-"*78)
+    for row in rows_out:
+        print(f"{row['template']:42s} {row['variant']:12s} {row['variables']:4d} "
+              f"{row['renders_per_s']:10.0f} {row['us_per_render']:7.2f}")
+    print("-"*78)
+    for variant, rate in summary.items():
+        print(f"{'median':42s} {variant:12s} {'':4s} {rate:10.0f} {'x%.1f' % (rate / summary['sdk_compile']):>7s}")
+    print("="*78)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+End-to-end load benchmark for ProductionRAGSystem.query()
+
+Drives the RAG pipeline at a fixed concurrency (closed loop) or a target
+QPS (open loop) and reports p50/p95/p99 latency per stage (retrieve, grade,
+generate, check, score) and end to end, plus throughput and peak RSS.
+The time the final flush takes (spans, then scores) is reported as well;
+--stub-ingestion-outage-seconds simulates the Langfuse host being down and
+--spool routes spans through the on-disk spool (examples/trace_spool.py).
+Results are written as JSON so runs can be compared; with --baseline the
+script exits non-zero when a latency percentile or throughput regresses by
+more than --max-regression.
+
+By default the local stand-in server (scripts/stub_server.py) is started
+in-process and both SDKs are pointed at it, so no network access is needed.
+
+Usage:
+    python scripts/benchmark_rag.py --queries 500 --concurrency 32 --output bench.json
+    python scripts/benchmark_rag.py --qps 50 --duration 30 --baseline bench.json --max-regression 0.1
+    python scripts/benchmark_rag.py --stub-ingestion-outage-seconds 60 --spool /tmp/langfuse_spool
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+from latency import percentile  # noqa: E402
+
+# Pipeline methods timed as benchmark stages
+STAGES = {
+    "retrieve": "retrieve_contexts",
+    "grade": "grade_contexts",
+    "generate": "generate_answer",
+    "check": "check_hallucination",
+    "score": "score_result",
+}
+
+QUERIES = [
+    "What tracing capabilities does Langfuse provide?",
+    "How does prompt management work?",
+    "How are evaluations and user feedback collected?",
+    "What is the capital of France?",
+]
+
+
+class StageTimer:
+    """Collects per-stage latencies from wrapped pipeline methods."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds * 1000)
+
+    def instrument(self, rag, stage: str, method_name: str):
+        original = getattr(rag, method_name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        # Instance attribute shadows the class method for self.<method>() calls
+        setattr(rag, method_name, timed)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def start_stub_server(args: argparse.Namespace) -> str:
+    """Run the stand-in server on a background thread and point the SDKs at it."""
+    import stub_server
+
+    stub_args = stub_server.build_parser().parse_args([
+        "--port", "0",
+        "--chat-latency-ms", str(args.stub_chat_latency_ms),
+        "--chat-latency-p99-ms", str(args.stub_chat_latency_p99_ms),
+        "--error-rate", str(args.stub_error_rate),
+        "--ingestion-outage-seconds", str(args.stub_ingestion_outage_seconds),
+    ])
+    server = stub_server.serve(stub_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "stub",
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-stub",
+        "LANGFUSE_SECRET_KEY": "sk-lf-stub",
+    })
+    # configs/development.yaml turns SDK debug logging on
+    os.environ.setdefault("LANGFUSE_DEBUG", "false")
+    return base_url
+
+
+def build_rag(args: argparse.Namespace):
+    import importlib
+    from eval_sampling import EvaluationSampler
+    from config import load_config
+    from head_sampling import install_head_sampler
+
+    if args.head_sample_rate is not None:
+        install_head_sampler({"enabled": True, "rate": args.head_sample_rate})
+    if args.tail_sampling:
+        import tail_sampling
+        tail_sampling.install_tail_sampler({
+            **((load_config().get("langfuse") or {}).get("tail_sampling") or {}),
+            "enabled": True
+        })
+    if args.spool:
+        from trace_spool import install_trace_spool
+        install_trace_spool({
+            **((load_config().get("langfuse") or {}).get("spool") or {}),
+            "enabled": True,
+            "directory": args.spool
+        })
+
+    rag_module = importlib.import_module("06_production_rag_system")
+    sampler = EvaluationSampler(rate=args.eval_rate) if args.eval_rate is not None else None
+    return rag_module.ProductionRAGSystem(
+        async_evaluation=args.async_evaluation,
+        coalesce=args.coalesce,
+        sampler=sampler
+    )
+
+
+def run_load(rag, args: argparse.Namespace) -> Dict[str, Any]:
+    """Execute the load pattern and return end-to-end latencies and error count."""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one_query(i: int, scheduled_at: float):
+        nonlocal errors
+        try:
+            rag.query(QUERIES[i % len(QUERIES)])
+            ok = True
+        except Exception:
+            ok = False
+        # Measured from the scheduled start so queueing delay is not hidden
+        elapsed = (time.perf_counter() - scheduled_at) * 1000
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    start = time.perf_counter()
+    if args.qps:
+        # Open loop: issue requests on a fixed schedule regardless of completions
+        total = int(args.qps * args.duration)
+        with ThreadPoolExecutor(max_workers=args.max_workers) as pool:
+            for i in range(total):
+                scheduled_at = start + i / args.qps
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(one_query, i, scheduled_at)
+    else:
+        # Closed loop: `concurrency` workers issue queries back to back
+        counter = iter(range(args.queries))
+        counter_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with counter_lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                one_query(i, time.perf_counter())
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(worker)
+
+    rag.shutdown()
+    wall_time = time.perf_counter() - start
+    return {"latencies": latencies, "errors": errors, "wall_time": wall_time}
+
+
+def check_regressions(result: Dict[str, Any], baseline: Dict[str, Any],
+                      max_regression: float, min_delta_ms: float) -> List[str]:
+    """
+    List latency percentiles or throughput that got worse than allowed.
+
+    Latency increases below `min_delta_ms` are ignored so sub-millisecond
+    stages do not fail the check on noise.
+    """
+    regressions = []
+    for stage, stats in result["latency_ms"].items():
+        base_stats = baseline.get("latency_ms", {}).get(stage)
+        if not base_stats:
+            continue
+        for key in ("p50", "p95", "p99"):
+            limit = max(base_stats[key] * (1 + max_regression), base_stats[key] + min_delta_ms)
+            if stats[key] > limit:
+                regressions.append(
+                    f"{stage} {key}: {stats[key]:.1f}ms vs baseline {base_stats[key]:.1f}ms"
+                )
+
+    base_qps = baseline.get("throughput_qps", 0)
+    if base_qps and result["throughput_qps"] < base_qps * (1 - max_regression):
+        regressions.append(
+            f"throughput: {result['throughput_qps']:.1f} qps vs baseline {base_qps:.1f} qps"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test ProductionRAGSystem.query()')
+    parser.add_argument('--queries', type=int, default=200, help='Total queries (closed loop)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent workers (closed loop)')
+    parser.add_argument('--qps', type=float, default=None, help='Target QPS (open loop)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run (open loop)')
+    parser.add_argument('--max-workers', type=int, default=256, help='Thread cap (open loop)')
+    parser.add_argument('--eval-rate', type=float, default=None, help='Override judge sampling rate')
+    parser.add_argument('--head-sample-rate', type=float, default=None, help='Head-sample traces at this rate')
+    parser.add_argument('--tail-sampling', action='store_true', help='Enable tail sampling (settings from the config)')
+    parser.add_argument('--async-evaluation', action='store_true', help='Queue grounding checks to the background worker')
+    parser.add_argument('--coalesce', action='store_true', help='Coalesce identical in-flight queries')
+    parser.add_argument('--no-stub', action='store_true', help='Use the endpoints from the environment instead of the stub')
+    parser.add_argument('--stub-chat-latency-ms', type=float, default=50, help='Stub median chat latency')
+    parser.add_argument('--stub-chat-latency-p99-ms', type=float, default=200, help='Stub p99 chat latency')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help='Stub error rate')
+    parser.add_argument('--stub-ingestion-outage-seconds', type=float, default=0,
+                        help='Stub answers Langfuse ingestion with 503 for this long')
+    parser.add_argument('--spool', type=str, default=None, help='Spool spans to this directory')
+    parser.add_argument('--output', type=str, default='bench_rag.json', help='Result JSON file')
+    parser.add_argument('--baseline', type=str, default=None, help='Baseline JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10, help='Allowed relative regression')
+    parser.add_argument('--min-regression-ms', type=float, default=5.0, help='Ignore latency increases below this')
+
+    args = parser.parse_args()
+
+    endpoint = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    if not args.no_stub:
+        endpoint = start_stub_server(args)
+
+    rag = build_rag(args)
+    timer = StageTimer()
+    for stage, method_name in STAGES.items():
+        timer.instrument(rag, stage, method_name)
+
+    mode = f"{args.qps} qps for {args.duration}s" if args.qps else f"{args.queries} queries @ concurrency {args.concurrency}"
+    print(f"Benchmarking ProductionRAGSystem.query(): {mode} against {endpoint}")
+
+    # The example prints progress for every query; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        load = run_load(rag, args)
+
+    from opentelemetry import trace as otel_trace
+    from tracing_utils import langfuse_client
+    flush_start = time.perf_counter()
+    otel_trace.get_tracer_provider().force_flush()
+    span_flush_s = time.perf_counter() - flush_start
+    langfuse_client().flush()
+    flush_s = time.perf_counter() - flush_start
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "throughput_qps": len(load["latencies"]) / load["wall_time"],
+        "wall_time_s": load["wall_time"],
+        "errors": load["errors"],
+        "peak_rss_mb": peak_rss_mb(),
+        "flush_s": flush_s,
+        "span_flush_s": span_flush_s,
+        "latency_ms": {
+            "end_to_end": summarize(load["latencies"]),
+            **{stage: summarize(timer.samples.get(stage, [])) for stage in STAGES},
+        },
+    }
+    if args.tail_sampling:
+        import tail_sampling
+        result["tail_sampling"] = tail_sampling.tail_sampler().stats()
+    if args.spool:
+        from trace_spool import trace_spool
+        result["spool"] = trace_spool().stats()
+
+    print("\n" + "="*70)
+    print(f"{'stage':12s} {'count':>7s} {'p50':>9s} {'p95':>9s} {'p99':>9s}  (ms)")
+    print("-"*70)
+    for stage, stats in result["latency_ms"].items():
+        print(f"{stage:12s} {stats['count']:7d} {stats['p50']:9.1f} {stats['p95']:9.1f} {stats['p99']:9.1f}")
+    print("-"*70)
+    print(f"Throughput: {result['throughput_qps']:.1f} queries/s   Errors: {result['errors']}   "
+          f"Peak RSS: {result['peak_rss_mb']:.1f} MB   Flush: {result['flush_s']:.2f} s "
+          f"(spans {result['span_flush_s']:.2f} s)")
+    if "tail_sampling" in result:
+        print(f"Tail sampling: {result['tail_sampling']}")
+    if "spool" in result:
+        print(f"Spool: {result['spool']}")
+    print("="*70)
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(result, baseline, args.max_regression, args.min_regression_ms)
+        if regressions:
+            print(f"\nRegressions beyond {args.max_regression:.0%}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.max_regression:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Micro-benchmark for tracing overhead on hot paths
+
+Measures the per-call cost that instrumentation adds, in microseconds:
+
+- decorator: @observe at several nesting depths, with and without
+  input/output capture, against the same undecorated call chain
+- span update: get_client().update_current_span(...) with payloads of
+  increasing size, against the deferred/lazy updates in
+  examples/tracing_utils.py without and with the configured capture limits
+  (examples/capture_policy.py)
+- serialization: JSON encoding of the same payloads on their own, SDK
+  encoder vs the stdlib encoder used by tracing_utils
+
+Afterwards it checks that tags set with update_trace() are added to the
+configured langfuse.default_tags instead of replacing them.
+
+Spans are exported to the local stand-in server (scripts/stub_server.py)
+started in-process; the exporter queue is flushed between timed batches so
+dropped spans do not make tracing look cheaper than it is.
+
+Usage:
+    python scripts/benchmark_tracing.py
+    python scripts/benchmark_tracing.py --depths 1 8 32 --payload-bytes 100 100000 --output bench_tracing.json
+    python scripts/benchmark_tracing.py --sample-rate 0   # cost when traces are sampled out
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+
+def start_stub_server() -> str:
+    """Run the stand-in server on a background thread and point the SDK at it."""
+    import stub_server
+
+    stub_args = stub_server.build_parser().parse_args(["--port", "0", "--ingestion-latency-ms", "0"])
+    server = stub_server.serve(stub_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-stub",
+        "LANGFUSE_SECRET_KEY": "sk-lf-stub",
+    })
+    # configs/development.yaml turns SDK debug logging on
+    os.environ.setdefault("LANGFUSE_DEBUG", "false")
+    return base_url
+
+
+def make_payload(size: int) -> Dict[str, Any]:
+    """A metadata-shaped payload of roughly `size` bytes of JSON."""
+    chunk = 100
+    return {
+        "retrieval_method": "vector_similarity",
+        "num_results": 3,
+        "documents": [
+            {"id": f"doc-{i:05d}", "content": "x" * (chunk - 30)}
+            for i in range(max(1, size // chunk))
+        ]
+    }
+
+
+def build_chain(depth: int, decorate: Callable[[Callable], Callable],
+                leaf: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """`depth` nested calls; the innermost one runs `leaf`."""
+    fn = decorate(leaf)
+    for _ in range(depth - 1):
+        fn = decorate(lambda payload, inner=fn: inner(payload))
+    return fn
+
+
+def time_per_call(fn: Callable[[], Any], calls: int, batch: int, flush: Callable[[], None],
+                  repeats: int) -> float:
+    """Median over repeats of the mean microseconds per call."""
+    results = []
+    for _ in range(repeats):
+        elapsed = 0.0
+        done = 0
+        while done < calls:
+            n = min(batch, calls - done)
+            start = time.perf_counter()
+            for _ in range(n):
+                fn()
+            elapsed += time.perf_counter() - start
+            done += n
+            flush()
+        results.append(elapsed / calls * 1e6)
+    return statistics.median(results)
+
+
+def bench_decorator(args, flush) -> List[Dict[str, Any]]:
+    from langfuse import observe
+    from tracing_utils import traced
+
+    variants = {
+        "undecorated": lambda fn: fn,
+        "observe": observe(),
+        "observe_no_capture": observe(capture_input=False, capture_output=False),
+        "traced_no_capture": traced(capture_input=False, capture_output=False),
+    }
+    rows = []
+    for depth in args.depths:
+        base = None
+        for variant, decorate in variants.items():
+            chain = build_chain(depth, decorate, lambda payload: payload)
+            us = time_per_call(lambda: chain("query"), args.calls, args.batch, flush, args.repeats)
+            if base is None:
+                base = us
+            rows.append({
+                "variant": variant,
+                "depth": depth,
+                "us_per_call": us,
+                "us_per_span": (us - base) / depth,
+            })
+    return rows
+
+
+def bench_span_update(args, flush) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, int]]]:
+    """Span update rows, and the capture policy counters of the deferred_capture_limits runs."""
+    from langfuse import get_client, observe
+    from capture_policy import CapturePolicy, FIELDS, get_capture_policy, set_capture_policy
+    from config import load_config
+    from tracing_utils import lazy, traced, update_span
+
+    configured = get_capture_policy()
+    # Without observability.capture_limits nothing is limited; measure the
+    # limits of configs/production.yaml then
+    limited = configured
+    if not (configured.string_bytes or configured.hash_over_bytes or any(configured.field_bytes.values())):
+        limits = (load_config("production").get("observability") or {}).get("capture_limits")
+        limited = CapturePolicy.from_config({"capture_limits": limits})
+    unlimited = CapturePolicy(field_bytes={field: None for field in FIELDS},
+                              string_bytes=None, hash_over_bytes=None)
+
+    no_capture = {"capture_input": False, "capture_output": False}
+
+    @observe(**no_capture)
+    def span_only(payload):
+        return None
+
+    @observe(**no_capture)
+    def get_client_per_update(payload):
+        # Three updates per call, as in the examples' hot paths
+        get_client().update_current_span(input="query")
+        get_client().update_current_span(output=payload)
+        get_client().update_current_span(metadata={"num_results": 3})
+
+    @traced(**no_capture)
+    def deferred(payload):
+        update_span(input="query")
+        update_span(output=lazy(lambda: payload))
+        update_span(metadata={"num_results": 3})
+
+    variants = (
+        ("get_client_per_update", get_client_per_update, unlimited),
+        ("deferred", deferred, unlimited),
+        ("deferred_capture_limits", deferred, limited),
+    )
+    rows = []
+    for size in args.payload_bytes:
+        payload = make_payload(size)
+        base = time_per_call(lambda: span_only(payload), args.calls, args.batch, flush, args.repeats)
+        for variant, fn, policy in variants:
+            set_capture_policy(policy)
+            us = time_per_call(lambda: fn(payload), args.calls, args.batch, flush, args.repeats)
+            rows.append({
+                "variant": variant,
+                "payload_bytes": size,
+                "us_per_call": us,
+                "us_over_span": us - base,
+            })
+    set_capture_policy(configured)
+    return rows, limited.stats()
+
+
+def bench_serialization(args) -> List[Dict[str, Any]]:
+    from langfuse._utils.serializer import EventSerializer
+    from capture_policy import encode_payload
+
+    encoders = {
+        "sdk_event_serializer": lambda payload: json.dumps(payload, cls=EventSerializer),
+        "stdlib_json": encode_payload,
+    }
+    rows = []
+    for size in args.payload_bytes:
+        payload = make_payload(size)
+        for variant, encode in encoders.items():
+            us = time_per_call(lambda: encode(payload), args.calls, args.calls, lambda: None, args.repeats)
+            rows.append({"variant": variant, "payload_bytes": len(encode(payload)), "us_per_call": us})
+    return rows
+
+
+def check_trace_tags() -> Dict[str, Any]:
+    """Tags set with update_trace() must not replace langfuse.default_tags on the root span."""
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    import tracing_utils
+    from config import default_trace_tags
+
+    exporter = InMemorySpanExporter()
+    otel_trace.get_tracer_provider().add_span_processor(SimpleSpanProcessor(exporter))
+
+    @tracing_utils.traced(name="tag-check")
+    def deferred():
+        tracing_utils.update_trace(tags=["benchmark"])
+
+    @tracing_utils.traced(name="tag-check")
+    def immediate():
+        # A nested plain call updates the trace immediately, not deferred
+        (lambda: tracing_utils.update_trace(tags=["benchmark"]))()
+
+    expected = set(default_trace_tags()) | {"benchmark"}
+    checks = {}
+    for fn in (deferred, immediate):
+        exporter.clear()
+        fn()
+        roots = [span for span in exporter.get_finished_spans() if span.parent is None]
+        if not roots:
+            checks[fn.__name__] = None   # sampled out
+            continue
+        tags = set(roots[-1].attributes.get("langfuse.trace.tags") or ())
+        checks[fn.__name__] = expected <= tags
+    return {"expected": sorted(expected), "kept": checks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-call tracing overhead')
+    parser.add_argument('--calls', type=int, default=2000, help='Timed calls per case')
+    parser.add_argument('--batch', type=int, default=200, help='Calls between exporter flushes')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats per case (median reported)')
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 4, 16], help='Nesting depths')
+    parser.add_argument('--payload-bytes', type=int, nargs='+', default=[100, 10_000, 100_000],
+                        help='Span payload sizes')
+    parser.add_argument('--sample-rate', type=float, default=None, help='LANGFUSE_SAMPLE_RATE for the run')
+    parser.add_argument('--skip-debug-formatting', action='store_true',
+                        help='Measure with tracing_utils.skip_debug_span_formatting() applied')
+    parser.add_argument('--no-stub', action='store_true', help='Export to LANGFUSE_HOST instead of the stub')
+    parser.add_argument('--output', type=str, default=None, help='Result JSON file')
+
+    args = parser.parse_args()
+
+    endpoint = os.getenv("LANGFUSE_HOST")
+    if not args.no_stub:
+        endpoint = start_stub_server()
+    if args.sample_rate is not None:
+        os.environ["LANGFUSE_SAMPLE_RATE"] = str(args.sample_rate)
+
+    import tracing_utils
+
+    if args.skip_debug_formatting:
+        tracing_utils.skip_debug_span_formatting()
+    langfuse = tracing_utils.langfuse_client()
+
+    print(f"Benchmarking tracing overhead against {endpoint} "
+          f"(sample rate {os.getenv('LANGFUSE_SAMPLE_RATE', '1.0')}, "
+          f"debug formatting {'skipped' if args.skip_debug_formatting else 'on'})")
+
+    decorator = bench_decorator(args, langfuse.flush)
+    span_update, capture_stats = bench_span_update(args, langfuse.flush)
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "decorator": decorator,
+        "span_update": span_update,
+        "serialization": bench_serialization(args),
+        "capture_policy": capture_stats,
+    }
+
+    print("\n" + "="*70)
+    print("Decorator overhead (us)")
+    print(f"{'variant':24s} {'depth':>6s} {'per call':>10s} {'per span':>10s}")
+    print("-"*70)
+    for row in result["decorator"]:
+        print(f"{row['variant']:24s} {row['depth']:6d} {row['us_per_call']:10.1f} {row['us_per_span']:10.1f}")
+
+    print("\nSpan update overhead (us, three updates per call)")
+    print(f"{'variant':24s} {'payload':>9s} {'per call':>10s} {'over span':>10s}")
+    print("-"*70)
+    for row in result["span_update"]:
+        print(f"{row['variant']:24s} {row['payload_bytes']:9d} {row['us_per_call']:10.1f} {row['us_over_span']:10.1f}")
+
+    print("\nSerialization alone (us)")
+    print(f"{'variant':24s} {'payload':>9s} {'per call':>10s}")
+    print("-"*70)
+    for row in result["serialization"]:
+        print(f"{row['variant']:24s} {row['payload_bytes']:9d} {row['us_per_call']:10.1f}")
+
+    print("\nCapture limits (deferred_capture_limits runs)")
+    print("-"*70)
+    for field, counters in result["capture_policy"].items():
+        print(f"{field:10s} in {counters.get('bytes_in', 0):>12,d} B  out {counters.get('bytes_out', 0):>12,d} B  "
+              f"saved {counters.get('bytes_saved', 0):>12,d} B  truncated {counters.get('truncated', 0)}  "
+              f"hashed {counters.get('hashed', 0)}")
+    print("="*70)
+
+    result["trace_tags"] = check_trace_tags()
+    print(f"Default and update_trace() tags kept on the root span ({', '.join(result['trace_tags']['expected'])}): "
+          f"{result['trace_tags']['kept']}")
+
+    langfuse.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Script to compare dataset experiment runs
+
+Reads the runs recorded in the experiment result store
+(examples/experiment_store.py, `evaluation.experiments.store` in
+configs/*.yaml) together with their scores, including those written by the
+batch evaluators (examples/batch_evaluators.py), and reports:
+
+- per run: items, reused items, errors and the mean of every score
+- per run against the first (baseline) run: the paired mean difference of
+  every score over the items both runs scored, its 95% bootstrap interval
+  and how many items got better, stayed the same or got worse
+
+Items are matched across runs by content (input and expected_output), so
+runs over re-created or re-imported datasets still line up.
+
+Usage:
+    python scripts/compare_experiments.py --list
+    python scripts/compare_experiments.py gpt-4o-mini-experiment-v1 gpt-4o-experiment-v1
+    python scripts/compare_experiments.py baseline candidate --metric token_f1 rouge_l --output comparison.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+from experiment_store import ExperimentStore, install_experiment_store  # noqa: E402
+
+
+def load_run(store: ExperimentStore, run_name: str) -> Dict[str, Dict[str, float]]:
+    """Numeric scores per item content hash (mean over duplicate items)."""
+    collected: Dict[str, Dict[str, List[float]]] = {}
+    for item in store.run_items(run_name):
+        if item["error"] is not None:
+            continue
+        scores = collected.setdefault(item["item_hash"], {})
+        for name, value in item["scores"].items():
+            if isinstance(value, (int, float)):
+                scores.setdefault(name, []).append(float(value))
+    return {item_hash: {name: sum(values) / len(values) for name, values in scores.items()}
+            for item_hash, scores in collected.items()}
+
+
+def paired(baseline: Dict[str, Dict[str, float]], candidate: Dict[str, Dict[str, float]], metric: str,
+           resamples: int, seed: int = 0) -> Dict[str, Any]:
+    """Paired difference candidate - baseline of one metric over the items both scored."""
+    common = [h for h in baseline if metric in baseline[h] and metric in candidate.get(h, {})]
+    if not common:
+        return {"items": 0, "delta": None, "ci_low": None, "ci_high": None, "better": 0, "same": 0, "worse": 0}
+    delta = np.array([candidate[h][metric] - baseline[h][metric] for h in common])
+    # All bootstrap resamples at once: one row of item indices per resample
+    rng = np.random.default_rng(seed)
+    means = delta[rng.integers(0, len(delta), size=(resamples, len(delta)))].mean(axis=1)
+    ci_low, ci_high = np.percentile(means, [2.5, 97.5])
+    return {
+        "items": len(common),
+        "delta": float(delta.mean()),
+        "ci_low": float(ci_low),
+        "ci_high": float(ci_high),
+        "better": int((delta > 1e-9).sum()),
+        "same": int((np.abs(delta) <= 1e-9).sum()),
+        "worse": int((delta < -1e-9).sum()),
+    }
+
+
+def print_runs(runs: List[Dict[str, Any]]):
+    print(f"\n{'run':40s} {'items':>6s} {'reused':>7s} {'errors':>7s}  {'started':19s}")
+    print("-"*84)
+    for run in runs:
+        started = datetime.fromtimestamp(run["started_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{run['run_name'][:40]:40s} {run['items']:6d} {run['reused']:7d} {run['errors']:7d}  {started}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dataset experiment runs from the result store')
+    parser.add_argument('runs', nargs='*', help='Run names; the first is the baseline')
+    parser.add_argument('--list', action='store_true', help='List the recorded runs')
+    parser.add_argument('--store', type=str, default=None, help='Result store file (default: from config)')
+    parser.add_argument('--metric', nargs='+', default=None, help='Scores to compare (default: all)')
+    parser.add_argument('--bootstrap', type=int, default=2000, help='Bootstrap resamples for the intervals')
+    parser.add_argument('--output', type=str, default=None, help='Report JSON file')
+
+    args = parser.parse_args()
+
+    store = ExperimentStore(args.store) if args.store else install_experiment_store()
+    if store is None:
+        print("The experiment result store is disabled (evaluation.experiments.store); pass --store")
+        sys.exit(1)
+
+    recorded = {run["run_name"]: run for run in store.runs()}
+    if args.list or not args.runs:
+        print_runs(list(recorded.values()))
+        return
+    missing = [run_name for run_name in args.runs if run_name not in recorded]
+    if missing:
+        print(f"Unknown runs: {', '.join(missing)} (see --list)")
+        sys.exit(1)
+
+    scores = {run_name: load_run(store, run_name) for run_name in args.runs}
+    metrics = args.metric or sorted({name for run in scores.values() for item in run.values() for name in item})
+
+    means = {}
+    for run_name, run in scores.items():
+        means[run_name] = {}
+        for metric in metrics:
+            values = [item[metric] for item in run.values() if metric in item]
+            means[run_name][metric] = sum(values) / len(values) if values else None
+
+    baseline = args.runs[0]
+    comparisons = {run_name: {metric: paired(scores[baseline], scores[run_name], metric, args.bootstrap)
+                              for metric in metrics}
+                   for run_name in args.runs[1:]}
+
+    print_runs([recorded[run_name] for run_name in args.runs])
+
+    width = 24 + 14 * len(args.runs)
+    print("\n" + "="*width)
+    print(f"{'metric':24s}" + "".join(f"{run_name[-13:]:>14s}" for run_name in args.runs))
+    print("-"*width)
+    for metric in metrics:
+        cells = "".join(f"{means[run_name][metric]:14.4f}" if means[run_name][metric] is not None else f"{'-':>14s}"
+                        for run_name in args.runs)
+        print(f"{metric[:24]:24s}{cells}")
+    print("="*width)
+
+    for run_name, by_metric in comparisons.items():
+        print(f"\n{run_name} vs {baseline} (paired over items scored in both)")
+        print(f"{'metric':24s} {'items':>6s} {'delta':>9s} {'95% CI':>21s} {'better':>7s} {'same':>6s} {'worse':>6s}")
+        print("-"*84)
+        for metric, result in by_metric.items():
+            if result["delta"] is None:
+                print(f"{metric[:24]:24s} {0:6d} {'-':>9s}")
+                continue
+            ci = f"[{result['ci_low']:+.4f}, {result['ci_high']:+.4f}]"
+            print(f"{metric[:24]:24s} {result['items']:6d} {result['delta']:+9.4f} {ci:>21s} "
+                  f"{result['better']:7d} {result['same']:6d} {result['worse']:6d}")
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "baseline": baseline,
+            "runs": [recorded[run_name] for run_name in args.runs],
+            "means": means,
+            "comparisons": comparisons,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Script to export Langfuse prompts to a snapshot file for the local prompt registry
+
+Workers load the snapshot at startup (examples/prompt_registry.py,
+`prompts.registry.paths` in configs/*.yaml) and serve prompts without
+waiting on the prompt API.
+
+Usage:
+    python scripts/export_prompts.py --output .langfuse_prompts/snapshot.json
+    python scripts/export_prompts.py --name customer-support-prompt --label production staging
+"""
+
+import argparse
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+from prompt_registry import export_snapshot  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export Langfuse prompts to a registry snapshot')
+    parser.add_argument('--output', type=str, default=os.path.join('.langfuse_prompts', 'snapshot.json'),
+                        help='Snapshot file')
+    parser.add_argument('--name', type=str, nargs='+', default=None, help='Prompt names (default: all)')
+    parser.add_argument('--label', type=str, nargs='+', default=['production'], help='Labels to export')
+
+    args = parser.parse_args()
+
+    print(f"Exporting prompts ({', '.join(args.label)}) to {args.output}...")
+    count = export_snapshot(args.output, names=args.name, labels=args.label)
+    print(f"Exported {count} prompt versions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,21 @@ Usage:
 """
 
 import argparse
+import os
+import sys
 from datetime import datetime, timedelta
-from langfuse import Langfuse
 import json
 
 
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+from tracing_utils import langfuse_client  # noqa: E402
+
+
 def export_traces(days: int = 7, output_file: str = "traces.json"):
     """Export traces from the last N days."""
-    langfuse = Langfuse()
+    langfuse = langfuse_client()
     
     print(f"Exporting traces from last {days} days...")
     
@@ -0,0 +1,407 @@
+"""
+Bulk import of dataset items from JSONL, CSV or Parquet files
+
+Streams rows from the file (nothing is loaded into memory as a whole), maps
+columns to input / expected_output / metadata and uploads the items with a
+pool of concurrent workers, one batch of rows at a time.
+
+Column mapping:
+- rows that already have `input` / `expected_output` / `metadata` fields
+  (JSONL written by export scripts) are used as they are
+- --input-columns, --expected-columns, --metadata-columns build each field
+  from the listed columns ({"question": ..., "context": ...}); a single
+  column named like the field is used directly
+- --id-column gives items a stable id; without it the id is derived from
+  the item's input, so a row whose expected output or metadata was edited
+  updates its item (a row with an edited input is a new item)
+
+Every uploaded item is recorded with its content hash (input, expected
+output and metadata) in a manifest next to the other import state
+(--state-dir). Re-running the import, e.g. after an interruption or with an
+updated file, skips items whose hash is unchanged and only uploads new or
+changed ones. Rows sharing an id (the same input without --id-column) are
+imported as the last of them. With --archive-missing, items of earlier
+imports whose id no longer appears in the file are archived once the whole
+file was read without invalid rows; use it when the file holds the whole
+dataset. --rebuild-manifest recomputes the manifest from the active items
+already in Langfuse.
+
+Usage:
+    python scripts/import_dataset.py regression.jsonl --dataset qa-regression
+    python scripts/import_dataset.py cases.csv --dataset qa-regression --input-columns question \\
+        --expected-columns answer --metadata-columns difficulty category --id-column case_id
+    python scripts/import_dataset.py cases.parquet --dataset qa-regression --concurrency 16 --batch-size 500
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+from langfuse.api import DatasetStatus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "examples"))
+
+from tracing_utils import langfuse_client  # noqa: E402
+
+FIELDS = ("input", "expected_output", "metadata")
+
+
+# -- reading ------------------------------------------------------------------
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from None
+
+
+def read_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            # Cells holding JSON objects/arrays (e.g. exported input dicts) are decoded
+            yield {key: _maybe_json(value) for key, value in row.items()}
+
+
+def read_parquet(path: str, batch_rows: int = 10000) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Reading Parquet needs pyarrow: pip install pyarrow") from None
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        yield from batch.to_pylist()
+
+
+READERS = {".jsonl": read_jsonl, ".ndjson": read_jsonl, ".csv": read_csv, ".parquet": read_parquet}
+
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise SystemExit(f"Unsupported file type '{extension}'; expected one of {sorted(READERS)}")
+    return READERS[extension](path)
+
+
+def _maybe_json(value: str) -> Any:
+    if value and value[0] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+# -- mapping ------------------------------------------------------------------
+
+def _field(row: Dict[str, Any], name: str, columns: Optional[Sequence[str]]) -> Any:
+    if not columns:
+        return row.get(name)
+    if len(columns) == 1 and columns[0] == name:
+        return row.get(name)
+    return {column: row.get(column) for column in columns}
+
+
+def _hash(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def content_hash(item: Dict[str, Any]) -> str:
+    """Hash of an item's input, expected output and metadata."""
+    return _hash([item.get(field) for field in FIELDS])
+
+
+def map_row(row: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    """Dataset item fields (plus its id and content hash) for one row."""
+    item = {
+        "input": _field(row, "input", args.input_columns),
+        "expected_output": _field(row, "expected_output", args.expected_columns),
+        "metadata": _field(row, "metadata", args.metadata_columns),
+    }
+    if item["input"] is None:
+        raise ValueError(f"Row has no input (columns: {sorted(row)})")
+    item["hash"] = content_hash(item)
+    if args.id_column:
+        item["id"] = str(row[args.id_column])
+    else:
+        # Same input -> same id, so a repeated row is one item and an edited
+        # expected output/metadata changes only the hash
+        item["id"] = str(uuid.UUID(hex=_hash(item["input"])[:32]))
+    return item
+
+
+# -- manifest -----------------------------------------------------------------
+
+class Manifest:
+    """Item id -> content hash of everything uploaded, as an append-only file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    item_id, _, item_hash = line.rstrip("\n").partition("\t")
+                    if item_hash:
+                        self.hashes[item_id] = item_hash
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def unchanged(self, item: Dict[str, Any]) -> bool:
+        return self.hashes.get(item["id"]) == item["hash"]
+
+    def record(self, items: List[Dict[str, Any]]):
+        with self._lock:
+            for item in items:
+                self.hashes[item["id"]] = item["hash"]
+                self._file.write(f"{item['id']}\t{item['hash']}\n")
+            self._file.flush()
+
+    def forget(self, item_ids: List[str]):
+        """Drop archived items, so they are uploaded (and reactivated) if they reappear."""
+        forgotten = set(item_ids)
+        self.rewrite({item_id: item_hash for item_id, item_hash in self.hashes.items()
+                      if item_id not in forgotten})
+
+    def rewrite(self, hashes: Dict[str, str]):
+        with self._lock:
+            self._file.close()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for item_id, item_hash in hashes.items():
+                    f.write(f"{item_id}\t{item_hash}\n")
+            os.replace(tmp_path, self.path)
+            self.hashes = dict(hashes)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+
+def rebuild_manifest(manifest: Manifest, dataset: str, page_size: int = 100):
+    """Recompute the manifest from the dataset items already in Langfuse."""
+    api = langfuse_client().api
+    hashes = {}
+    page = 1
+    while True:
+        response = api.dataset_items.list(dataset_name=dataset, page=page, limit=page_size)
+        for item in response.data:
+            if item.status == DatasetStatus.ARCHIVED:
+                continue
+            hashes[item.id] = content_hash({"input": item.input, "expected_output": item.expected_output,
+                                            "metadata": item.metadata})
+        if page >= response.meta.total_pages:
+            break
+        page += 1
+    manifest.rewrite(hashes)
+    print(f"Manifest rebuilt from {len(hashes)} existing items")
+
+
+# -- upload -------------------------------------------------------------------
+
+class Importer:
+    """Uploads batches of mapped items concurrently and tracks progress."""
+
+    def __init__(self, dataset: str, manifest: Manifest, concurrency: int, max_retries: int):
+        self.dataset = dataset
+        self.manifest = manifest
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.langfuse = langfuse_client()
+        self.stats = {"rows": 0, "uploaded": 0, "skipped": 0, "failed": 0, "invalid": 0, "archived": 0}
+        self.ids_in_file: Set[str] = set()
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def _upload_item(self, item: Dict[str, Any]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.langfuse.create_dataset_item(
+                    dataset_name=self.dataset,
+                    id=item["id"],
+                    input=item["input"],
+                    expected_output=item["expected_output"],
+                    metadata=item["metadata"],
+                    # Reactivates an item archived by an earlier import
+                    status=DatasetStatus.ACTIVE,
+                )
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"  Failed to upload item {item['id']}: {e}")
+                    return False
+                time.sleep(min(10.0, 0.5 * 2 ** attempt))
+        return False
+
+    def _archive_item(self, item_id: str) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                # Upserting by id replaces the item, so send its content along
+                item = self.langfuse.api.dataset_items.get(id=item_id)
+                if item.status != DatasetStatus.ARCHIVED:
+                    self.langfuse.create_dataset_item(
+                        dataset_name=self.dataset,
+                        id=item_id,
+                        input=item.input,
+                        expected_output=item.expected_output,
+                        metadata=item.metadata,
+                        source_trace_id=item.source_trace_id,
+                        source_observation_id=item.source_observation_id,
+                        status=DatasetStatus.ARCHIVED,
+                    )
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"  Failed to archive item {item_id}: {e}")
+                    return False
+                time.sleep(min(10.0, 0.5 * 2 ** attempt))
+        return False
+
+    def archive_missing(self, pool: ThreadPoolExecutor):
+        """Archive the manifest's items whose id no longer appears in the file."""
+        missing = [item_id for item_id in self.manifest.hashes if item_id not in self.ids_in_file]
+        archived = [item_id for item_id, ok in zip(missing, pool.map(self._archive_item, missing)) if ok]
+        self.manifest.forget(archived)
+        with self._lock:
+            self.stats["archived"] += len(archived)
+            self.stats["failed"] += len(missing) - len(archived)
+
+    def upload_batch(self, pool: ThreadPoolExecutor, batch: List[Dict[str, Any]]):
+        """Upload one batch on the pool's workers; checkpoints it in the manifest."""
+        uploaded = [item for item, ok in zip(batch, pool.map(self._upload_item, batch)) if ok]
+        self.manifest.record(uploaded)
+        with self._lock:
+            self.stats["uploaded"] += len(uploaded)
+            self.stats["failed"] += len(batch) - len(uploaded)
+
+    def count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def progress(self) -> str:
+        with self._lock:
+            stats = dict(self.stats)
+        elapsed = time.monotonic() - self.started
+        rate = stats["uploaded"] / elapsed if elapsed > 0 else 0.0
+        return (f"  {stats['rows']} rows read, {stats['uploaded']} uploaded, {stats['skipped']} unchanged, "
+                f"{stats['failed']} failed, {stats['invalid']} invalid, {stats['archived']} archived "
+                f"({rate:.0f} items/s)")
+
+
+def batches(rows: Iterator[Dict[str, Any]], importer: Importer, args: argparse.Namespace
+            ) -> Iterator[List[Dict[str, Any]]]:
+    """Batches of new or changed items; unchanged ones are counted and skipped."""
+    # By id: a batch is uploaded in parallel, so it holds one row per item
+    batch: Dict[str, Dict[str, Any]] = {}
+    seen_in_file: Dict[str, str] = {}
+    for row_number, row in enumerate(rows, 1):
+        importer.count("rows")
+        try:
+            item = map_row(row, args)
+        except (KeyError, ValueError) as e:
+            importer.count("invalid")
+            if importer.stats["invalid"] <= 10:
+                print(f"  Row {row_number}: {e}")
+            continue
+        importer.ids_in_file.add(item["id"])
+        # Rows sharing an id: the last one wins
+        if batch.pop(item["id"], None) is not None:
+            importer.count("skipped")
+        if importer.manifest.unchanged(item) or seen_in_file.get(item["id"]) == item["hash"]:
+            importer.count("skipped")
+            continue
+        batch[item["id"]] = item
+        if len(batch) >= args.batch_size:
+            seen_in_file.update((item_id, queued["hash"]) for item_id, queued in batch.items())
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def run_import(args: argparse.Namespace) -> Dict[str, int]:
+    if not os.path.exists(args.file):
+        raise SystemExit(f"File not found: {args.file}")
+    rows = read_rows(args.file)
+
+    langfuse = langfuse_client()
+    try:
+        langfuse.api.datasets.get(dataset_name=args.dataset)
+    except Exception:
+        langfuse.create_dataset(name=args.dataset, description=args.description)
+        print(f"Created dataset '{args.dataset}'")
+
+    manifest_path = os.path.join(args.state_dir, f"{args.dataset}.manifest")
+    manifest = Manifest(manifest_path)
+    if args.rebuild_manifest:
+        rebuild_manifest(manifest, args.dataset)
+    print(f"Importing {args.file} into '{args.dataset}' ({len(manifest.hashes)} items already uploaded, "
+          f"manifest {manifest_path})")
+
+    importer = Importer(args.dataset, manifest, args.concurrency, args.max_retries)
+    last_report = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="import") as pool:
+        # Batches are uploaded one after another, the items of a batch in
+        # parallel; reading never runs more than one batch ahead
+        for batch in batches(rows, importer, args):
+            importer.upload_batch(pool, batch)
+            if time.monotonic() - last_report >= args.progress_interval:
+                last_report = time.monotonic()
+                print(importer.progress())
+        if args.archive_missing:
+            if importer.stats["invalid"]:
+                # An invalid row may be an existing item; archive nothing
+                print("  Not archiving items missing from the file: some rows were invalid")
+            else:
+                importer.archive_missing(pool)
+    manifest.close()
+    print(importer.progress())
+    return importer.stats
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Bulk import dataset items from JSONL, CSV or Parquet')
+    parser.add_argument('file', type=str, help='JSONL, CSV or Parquet file')
+    parser.add_argument('--dataset', type=str, required=True, help='Dataset name (created if missing)')
+    parser.add_argument('--description', type=str, default=None, help='Description for a new dataset')
+    parser.add_argument('--input-columns', nargs='+', default=None, help='Columns forming the input')
+    parser.add_argument('--expected-columns', nargs='+', default=None, help='Columns forming the expected output')
+    parser.add_argument('--metadata-columns', nargs='+', default=None, help='Columns forming the metadata')
+    parser.add_argument('--id-column', type=str, default=None, help='Column with a stable item id')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent upload requests')
+    parser.add_argument('--batch-size', type=int, default=200, help='Items per checkpointed batch')
+    parser.add_argument('--max-retries', type=int, default=3, help='Retries per item')
+    parser.add_argument('--state-dir', type=str, default='.langfuse_imports', help='Directory for manifests')
+    parser.add_argument('--rebuild-manifest', action='store_true',
+                        help='Recompute the manifest from the items already in Langfuse first')
+    parser.add_argument('--archive-missing', action='store_true',
+                        help='Archive items of earlier imports that are no longer in the file')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='Seconds between progress lines')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    stats = run_import(args)
+    langfuse_client().flush()
+    if stats["failed"]:
+        print(f"{stats['failed']} items failed; re-run the same command to retry them")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Latency helpers shared by the stand-in servers and the benchmarks
+
+- lognormal_latency(): injected latency from a median and a p99, used by
+  scripts/stub_server.py and scripts/otlp_collector.py
+- percentile(): the nearest-rank percentile every report uses, so p50/p95/p99
+  from different scripts can be compared
+"""
+
+import math
+import random
+from typing import Sequence
+
+# Standard normal quantile of 0.99
+Z_99 = 2.326
+
+
+def lognormal_latency(rng: random.Random, median_ms: float, p99_ms: float) -> float:
+    """Sample a latency in seconds from a lognormal with the given median and p99 (0 without a median)."""
+    if median_ms <= 0:
+        return 0.0
+    sigma = math.log(max(p99_ms, median_ms) / median_ms) / Z_99
+    return rng.lognormvariate(math.log(median_ms), sigma) / 1000
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile: the smallest value with at least `pct`% of the values at or below it."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
@@ -0,0 +1,251 @@
+"""
+Local OTLP/HTTP collector for measuring span ingestion
+
+Accepts the protobuf span exports the Langfuse SDK sends (and plain OTLP
+exporters), decodes them and records per request:
+
+- spans and resource/scope groups in the batch
+- request bytes (compressed and decoded)
+- handling latency, including any injected delay
+- spans per trace name and per instrumentation scope
+
+Latency and errors can be injected to see how exporter settings behave
+against a slow or flaky backend. Langfuse batch ingestion (scores) is
+accepted and counted so the SDK runs without errors.
+
+Endpoints:
+- POST /api/public/otel/v1/traces, POST /v1/traces   (OTLP/HTTP protobuf)
+- POST /api/public/ingestion                         (counted, 207)
+- GET  /stats                                        (JSON report)
+- POST /reset                                        (clear counters)
+
+Point the SDK at it like the stub server:
+
+    LANGFUSE_HOST=http://localhost:4318 LANGFUSE_PUBLIC_KEY=pk-lf-local LANGFUSE_SECRET_KEY=sk-lf-local
+
+Usage:
+    python scripts/otlp_collector.py --port 4318
+    python scripts/otlp_collector.py --port 4318 --latency-ms 50 --latency-p99-ms 400 --error-rate 0.05
+"""
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+
+from latency import lognormal_latency, percentile
+
+
+class CollectorState:
+    """Counters and injected faults shared by all request handlers."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self._rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.first_export = None
+            self.last_export = None
+            self.requests = 0
+            self.rejected = 0
+            self.decode_errors = 0
+            self.spans = 0
+            self.bytes_wire = 0
+            self.bytes_decoded = 0
+            self.batch_sizes: List[int] = []
+            self.latencies_ms: List[float] = []
+            self.span_names: Counter = Counter()
+            self.scopes: Counter = Counter()
+            self.ingestion_events = 0
+
+    def delay(self) -> float:
+        """Injected handling delay in seconds (lognormal from median and p99)."""
+        with self._lock:
+            return lognormal_latency(self._rng, self.args.latency_ms, self.args.latency_p99_ms)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.args.error_rate
+
+    def record_export(self, request: ExportTraceServiceRequest, wire_bytes: int, decoded_bytes: int,
+                      latency_ms: float):
+        spans = 0
+        names: Counter = Counter()
+        scopes: Counter = Counter()
+        for resource_spans in request.resource_spans:
+            for scope_spans in resource_spans.scope_spans:
+                scopes[scope_spans.scope.name or "unknown"] += len(scope_spans.spans)
+                for span in scope_spans.spans:
+                    spans += 1
+                    if not span.parent_span_id:
+                        names[span.name] += 1
+
+        now = time.monotonic()
+        with self._lock:
+            self.first_export = self.first_export or now
+            self.last_export = now
+            self.requests += 1
+            self.spans += spans
+            self.bytes_wire += wire_bytes
+            self.bytes_decoded += decoded_bytes
+            self.batch_sizes.append(spans)
+            self.latencies_ms.append(latency_ms)
+            self.span_names.update(names)
+            self.scopes.update(scopes)
+
+    def count(self, field: str, value: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            window = (self.last_export - self.first_export) if self.requests > 1 else 0.0
+            return {
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "decode_errors": self.decode_errors,
+                "spans": self.spans,
+                "bytes_wire": self.bytes_wire,
+                "bytes_decoded": self.bytes_decoded,
+                "bytes_per_span": self.bytes_decoded / self.spans if self.spans else 0.0,
+                "batch_size": {
+                    "mean": self.spans / self.requests if self.requests else 0.0,
+                    "p50": percentile(self.batch_sizes, 50),
+                    "max": max(self.batch_sizes, default=0),
+                },
+                "latency_ms": {
+                    "p50": percentile(self.latencies_ms, 50),
+                    "p95": percentile(self.latencies_ms, 95),
+                    "p99": percentile(self.latencies_ms, 99),
+                },
+                "export_window_s": window,
+                "spans_per_s": self.spans / window if window > 0 else 0.0,
+                "root_span_names": dict(self.span_names.most_common(10)),
+                "scopes": dict(self.scopes),
+                "ingestion_events": self.ingestion_events,
+            }
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: CollectorState = None
+
+    def log_message(self, format, *args):
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def do_GET(self):
+        if self.path.startswith("/stats"):
+            self._send_json(200, self.state.report())
+        elif self.path.startswith("/api/public/projects"):
+            self._send_json(200, {"data": [{"id": "local-project", "name": "local"}]})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        body = self._read_body()
+        path = self.path.split("?")[0]
+
+        if path == "/reset":
+            self.state.reset()
+            self._send_json(200, {"status": "reset"})
+        elif path.endswith("/v1/traces"):
+            self._export_traces(body, start)
+        elif path.endswith("/api/public/ingestion"):
+            batch = json.loads(body or b"{}").get("batch", [])
+            self.state.count("ingestion_events", len(batch))
+            self._send_json(207, {
+                "successes": [{"id": event.get("id"), "status": 201} for event in batch],
+                "errors": []
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def _export_traces(self, body: bytes, start: float):
+        time.sleep(self.state.delay())
+        if self.state.should_fail():
+            self.state.count("rejected")
+            self._send_json(self.state.args.error_status, {"error": "Injected collector failure"})
+            return
+
+        encoding = (self.headers.get("Content-Encoding") or "").lower()
+        try:
+            data = gzip.decompress(body) if encoding == "gzip" else (
+                zlib.decompress(body) if encoding == "deflate" else body)
+            request = ExportTraceServiceRequest.FromString(data)
+        except Exception:
+            self.state.count("decode_errors")
+            self._send_json(400, {"error": "Could not decode ExportTraceServiceRequest"})
+            return
+
+        self.state.record_export(request, len(body), len(data), (time.perf_counter() - start) * 1000)
+        self._send(200, b"", "application/x-protobuf")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Local OTLP/HTTP span collector')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=4318, help='Port to listen on')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for latency/errors')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Median injected export latency')
+    parser.add_argument('--latency-p99-ms', type=float, default=0, help='p99 injected export latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of exports that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of injected failures')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    return parser
+
+
+def serve(args: argparse.Namespace) -> ThreadingHTTPServer:
+    """Create the collector; call serve_forever() on the result to run it."""
+    handler = type("ConfiguredCollectorHandler", (CollectorHandler,), {"state": CollectorState(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    args = build_parser().parse_args()
+    server = serve(args)
+
+    print(f"OTLP collector listening on http://{args.host}:{args.port}")
+    print(f"  LANGFUSE_HOST=http://{args.host}:{args.port}")
+    print(f"  Stats: curl http://{args.host}:{args.port}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.RequestHandlerClass.state.report(), indent=2))
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
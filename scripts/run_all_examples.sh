@@ -28,6 +28,7 @@ examples=(
     "04_dataset_evaluation.py"
     "05_langchain_integration.py"
     "06_production_rag_system.py"
+    "08_async_rag_system.py"
 )
 
 echo "Will run ${#examples[@]} examples"
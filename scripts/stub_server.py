@@ -0,0 +1,547 @@
+"""
+Local OpenAI-compatible and Langfuse-compatible stand-in server
+
+Serves the endpoints the examples use, with configurable latency, token
+counts and error rates, so pipelines can be load-tested deterministically
+without network access:
+
+- POST /v1/chat/completions        (JSON, SSE streaming, tool calls)
+- POST /v1/embeddings              (deterministic hashed bag-of-words vectors)
+- POST /api/public/otel/v1/traces  (Langfuse OTLP span export, counted)
+- POST /api/public/ingestion       (Langfuse batch ingestion, e.g. scores)
+- POST /api/public/v2/prompts      (Langfuse create_prompt, kept in memory)
+- GET  /api/public/v2/prompts      (Langfuse prompt list)
+- GET  /api/public/v2/prompts/NAME (Langfuse get_prompt by label or version)
+- POST /api/public/v2/datasets, GET /api/public/v2/datasets/NAME
+- POST /api/public/dataset-items, GET /api/public/dataset-items (paged, newest first)
+- POST /api/public/dataset-run-items (Langfuse item.run() linkage)
+- GET  /api/public/projects        (Langfuse auth_check)
+- GET  /stats                      (request counters as JSON)
+
+Point the examples at it through the standard SDK environment variables:
+
+    OPENAI_BASE_URL=http://localhost:8089/v1
+    OPENAI_API_KEY=stub
+    LANGFUSE_HOST=http://localhost:8089
+    LANGFUSE_PUBLIC_KEY=pk-lf-stub
+    LANGFUSE_SECRET_KEY=sk-lf-stub
+
+Usage:
+    python scripts/stub_server.py --port 8089 --chat-latency-ms 300 --chat-latency-p99-ms 1200 --error-rate 0.01
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from latency import lognormal_latency
+
+WORD = re.compile(r"\w+")
+
+FILLER = (
+    "Langfuse traces every step of the pipeline so latency token usage and "
+    "cost can be inspected per request and compared across releases"
+).split()
+
+
+class StubConfig:
+    """Latency, token and error settings shared by all request handlers."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self._rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self.stats = defaultdict(int)
+        self.started = time.monotonic()
+        self.prompts = defaultdict(list)
+        self.datasets = {}
+        self.dataset_items = {}
+        self.dataset_runs = defaultdict(list)
+
+    def count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def latency(self, median_ms: float, p99_ms: float) -> float:
+        """Sample a latency in seconds from a lognormal with the given median and p99."""
+        with self._lock:
+            return lognormal_latency(self._rng, median_ms, p99_ms)
+
+    def failure_status(self):
+        """HTTP status of an injected failure, or None to serve the request."""
+        with self._lock:
+            if self._rng.random() >= self.args.error_rate:
+                return None
+            return 429 if self._rng.random() < self.args.rate_limit_share else 500
+
+    def ingestion_down(self) -> bool:
+        """True during the simulated Langfuse outage at startup."""
+        return time.monotonic() - self.started < self.args.ingestion_outage_seconds
+
+    def completion_tokens(self, max_tokens: int) -> int:
+        with self._lock:
+            tokens = max(1, int(self._rng.gauss(self.args.completion_tokens, self.args.completion_tokens / 4)))
+        return min(tokens, max_tokens or tokens)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def embed(text: str, dimensions: int):
+    """Feature-hashed bag of words: texts that share words get similar vectors."""
+    vector = [0.0] * dimensions
+    for word in WORD.findall(text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def completion_text(messages, num_tokens: int) -> str:
+    """Judge-style verdicts for the RAG evaluators, filler text otherwise."""
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    words = [FILLER[i % len(FILLER)] for i in range(num_tokens)]
+    if "GROUNDED" in system:
+        words[0] = "GROUNDED"
+    elif "RELEVANT" in system:
+        words[0] = "RELEVANT"
+    return " ".join(words)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig = None
+
+    def log_message(self, format, *args):
+        if self.config.args.verbose:
+            super().log_message(format, *args)
+
+    # -- helpers -----------------------------------------------------------
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        self.config.count("bytes_received", len(body))
+        return body
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self, endpoint: str) -> bool:
+        status = self.config.failure_status()
+        if status is None:
+            return False
+        self.config.count(f"{endpoint}.errors")
+        self._send_json(status, {"error": {"message": "Injected stub failure", "type": "stub_error"}})
+        return True
+
+    # -- routing -----------------------------------------------------------
+
+    def do_GET(self):
+        if self.path.startswith("/api/public/projects"):
+            self._send_json(200, {"data": [{
+                "id": "stub-project",
+                "name": "stub",
+                "organization": {"id": "stub-org", "name": "stub"},
+                "metadata": {}
+            }]})
+        elif self.path.startswith("/stats"):
+            self._send_json(200, dict(self.config.stats))
+        elif self.path.startswith("/health"):
+            self._send_json(200, {"status": "OK"})
+        elif self.path.startswith("/api/public/v2/prompts/"):
+            self._get_prompt()
+        elif self.path.split("?")[0] == "/api/public/v2/prompts":
+            self._list_prompts()
+        elif self.path.startswith("/api/public/v2/datasets/"):
+            self._get_dataset()
+        elif self.path.startswith("/api/public/dataset-items"):
+            self._list_dataset_items()
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split("?")[0]
+
+        if path.endswith("/chat/completions"):
+            self._chat_completions(json.loads(body or b"{}"))
+        elif path.endswith("/embeddings"):
+            self._embeddings(json.loads(body or b"{}"))
+        elif path.endswith(("/otel/v1/traces", "/api/public/ingestion")) and self.config.ingestion_down():
+            self.config.count("langfuse.outage_rejections")
+            self._send_json(503, {"error": "Stub ingestion outage"})
+        elif path.endswith("/otel/v1/traces"):
+            self._ingest("otel", len(body))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/api/public/v2/prompts":
+            self._create_prompt(json.loads(body or b"{}"))
+        elif path == "/api/public/v2/datasets":
+            self._create_dataset(json.loads(body or b"{}"))
+        elif path == "/api/public/dataset-items":
+            self._create_dataset_item(json.loads(body or b"{}"))
+        elif path == "/api/public/dataset-run-items":
+            self._create_dataset_run_item(json.loads(body or b"{}"))
+        elif path.endswith("/api/public/ingestion"):
+            batch = json.loads(body or b"{}").get("batch", [])
+            self._ingest("ingestion", len(body), events=len(batch))
+            self._send_json(207, {
+                "successes": [{"id": event.get("id"), "status": 201} for event in batch],
+                "errors": []
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    # -- endpoints ---------------------------------------------------------
+
+    def _ingest(self, kind: str, num_bytes: int, events: int = 0):
+        args = self.config.args
+        time.sleep(self.config.latency(args.ingestion_latency_ms, args.ingestion_latency_ms * 2))
+        self.config.count(f"langfuse.{kind}.requests")
+        self.config.count(f"langfuse.{kind}.bytes", num_bytes)
+        if events:
+            self.config.count(f"langfuse.{kind}.events", events)
+
+    def _create_prompt(self, request):
+        self.config.count("langfuse.prompts.created")
+        with self.config._lock:
+            versions = self.config.prompts[request["name"]]
+            labels = list(request.get("labels") or []) + ["latest"]
+            # Labels move to the new version
+            for previous in versions:
+                previous["labels"] = [label for label in previous["labels"] if label not in labels]
+            prompt = {
+                "name": request["name"],
+                "version": len(versions) + 1,
+                "type": request.get("type", "text"),
+                "prompt": request["prompt"],
+                "config": request.get("config") or {},
+                "labels": labels,
+                "tags": request.get("tags") or [],
+            }
+            versions.append(prompt)
+        self._send_json(200, prompt)
+
+    def _list_prompts(self):
+        with self.config._lock:
+            prompts = [
+                {
+                    "name": name,
+                    "type": versions[-1]["type"],
+                    "versions": [p["version"] for p in versions],
+                    "labels": sorted({label for p in versions for label in p["labels"]}),
+                    "tags": versions[-1]["tags"],
+                    "lastUpdatedAt": "2024-01-01T00:00:00Z",
+                    "lastConfig": versions[-1]["config"],
+                }
+                for name, versions in self.config.prompts.items()
+            ]
+        self._send_json(200, {"data": prompts, "meta": {
+            "page": 1, "limit": len(prompts), "totalItems": len(prompts), "totalPages": 1}})
+
+    def _get_prompt(self):
+        args = self.config.args
+        time.sleep(self.config.latency(args.prompt_latency_ms, args.prompt_latency_ms * 4))
+        self.config.count("langfuse.prompts.requests")
+        url = urlparse(self.path)
+        name = unquote(url.path[len("/api/public/v2/prompts/"):])
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.config._lock:
+            versions = list(self.config.prompts.get(name, ()))
+        if "version" in query:
+            matches = [p for p in versions if p["version"] == int(query["version"])]
+        else:
+            label = query.get("label", "production")
+            matches = [p for p in versions if label in p["labels"]]
+        if not matches:
+            self._send_json(404, {"error": "LangfuseNotFoundError", "message": f"Prompt not found: {name}"})
+            return
+        self._send_json(200, matches[-1])
+
+    def _langfuse_latency(self):
+        args = self.config.args
+        time.sleep(self.config.latency(args.ingestion_latency_ms, args.ingestion_latency_ms * 2))
+
+    def _create_dataset(self, request):
+        self._langfuse_latency()
+        self.config.count("langfuse.datasets.created")
+        now = datetime.now(timezone.utc).isoformat()
+        with self.config._lock:
+            dataset = self.config.datasets.get(request["name"]) or {
+                "id": f"ds-{uuid.uuid4().hex[:12]}",
+                "name": request["name"],
+                "projectId": "stub-project",
+                "createdAt": now,
+            }
+            dataset.update({
+                "description": request.get("description"),
+                "metadata": request.get("metadata"),
+                "updatedAt": now,
+            })
+            self.config.datasets[request["name"]] = dataset
+        self._send_json(200, dataset)
+
+    def _get_dataset(self):
+        self._langfuse_latency()
+        name = unquote(urlparse(self.path).path[len("/api/public/v2/datasets/"):])
+        with self.config._lock:
+            dataset = self.config.datasets.get(name)
+        if dataset is None:
+            self._send_json(404, {"error": "LangfuseNotFoundError", "message": f"Dataset not found: {name}"})
+            return
+        self._send_json(200, dataset)
+
+    def _create_dataset_item(self, request):
+        self._langfuse_latency()
+        now = datetime.now(timezone.utc).isoformat()
+        with self.config._lock:
+            dataset = self.config.datasets.get(request["datasetName"])
+        if dataset is None:
+            self._send_json(404, {"error": "LangfuseNotFoundError",
+                                  "message": f"Dataset not found: {request['datasetName']}"})
+            return
+
+        self.config.count("langfuse.dataset_items.created")
+        item_id = request.get("id") or str(uuid.uuid4())
+        with self.config._lock:
+            # The same id upserts, like the API
+            item = self.config.dataset_items.get(item_id) or {"id": item_id, "createdAt": now}
+            item.update({
+                "status": request.get("status") or "ACTIVE",
+                "input": request.get("input"),
+                "expectedOutput": request.get("expectedOutput"),
+                "metadata": request.get("metadata"),
+                "sourceTraceId": request.get("sourceTraceId"),
+                "sourceObservationId": request.get("sourceObservationId"),
+                "datasetId": dataset["id"],
+                "datasetName": dataset["name"],
+                "updatedAt": now,
+            })
+            self.config.dataset_items[item_id] = item
+        self._send_json(200, item)
+
+    def _list_dataset_items(self):
+        self._langfuse_latency()
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path != "/api/public/dataset-items":
+            item_id = unquote(url.path[len("/api/public/dataset-items/"):])
+            with self.config._lock:
+                item = self.config.dataset_items.get(item_id)
+            if item is None:
+                self._send_json(404, {"error": "LangfuseNotFoundError", "message": f"Item not found: {item_id}"})
+            else:
+                self._send_json(200, item)
+            return
+
+        self.config.count("langfuse.dataset_items.list_requests")
+        page, limit = int(query.get("page", 1)), int(query.get("limit", 50))
+        with self.config._lock:
+            # Newest first, like the API; `version` hides items created after it
+            # (the stub keeps no history of edits)
+            items = [item for item in reversed(list(self.config.dataset_items.values()))
+                     if item["datasetName"] == query.get("datasetName", item["datasetName"])
+                     and ("version" not in query or _parse_time(item["createdAt"]) <= _parse_time(query["version"]))]
+        total_pages = max(1, math.ceil(len(items) / limit))
+        self._send_json(200, {
+            "data": items[(page - 1) * limit:page * limit],
+            "meta": {"page": page, "limit": limit, "totalItems": len(items), "totalPages": total_pages},
+        })
+
+    def _create_dataset_run_item(self, request):
+        self._langfuse_latency()
+        self.config.count("langfuse.dataset_run_items.created")
+        now = datetime.now(timezone.utc).isoformat()
+        run_item = {
+            "id": str(uuid.uuid4()),
+            "datasetRunId": f"run-{request['runName']}",
+            "datasetRunName": request["runName"],
+            "datasetItemId": request["datasetItemId"],
+            "traceId": request.get("traceId"),
+            "observationId": request.get("observationId"),
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        with self.config._lock:
+            self.config.dataset_runs[request["runName"]].append(run_item)
+        self._send_json(200, run_item)
+
+    def _chat_completions(self, request):
+        args = self.config.args
+        self.config.count("chat.requests")
+        if self._maybe_fail("chat"):
+            return
+
+        messages = request.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = self.config.completion_tokens(request.get("max_tokens"))
+        latency = self.config.latency(args.chat_latency_ms, args.chat_latency_p99_ms)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        response_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = request.get("model", "gpt-4o-mini")
+
+        if request.get("tools") and request.get("tool_choice", "auto") != "none":
+            tool = request["tools"][0]["function"]
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": tool["name"], "arguments": json.dumps({"location": "San Francisco, CA"})}
+                }]
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": completion_text(messages, completion_tokens)}
+            finish_reason = "stop"
+
+        if request.get("stream"):
+            self._stream_completion(request, response_id, created, model, message, usage, latency)
+            return
+
+        time.sleep(latency)
+        self.config.count("chat.completion_tokens", completion_tokens)
+        self._send_json(200, {
+            "id": response_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage
+        })
+
+    def _stream_completion(self, request, response_id, created, model, message, usage, latency):
+        words = (message.get("content") or "").split(" ")
+        delay = latency / max(len(words), 1)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_chunk(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        def chunk(delta, finish_reason=None, chunk_usage=None):
+            return json.dumps({
+                "id": response_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": chunk_usage
+            })
+
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            content = word if i == 0 else " " + word
+            send_chunk(chunk({"role": "assistant", "content": content} if i == 0 else {"content": content}))
+        send_chunk(chunk({}, finish_reason="stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_chunk(chunk({}, chunk_usage=usage))
+        send_chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.config.count("chat.completion_tokens", usage["completion_tokens"])
+
+    def _embeddings(self, request):
+        args = self.config.args
+        self.config.count("embeddings.requests")
+        if self._maybe_fail("embeddings"):
+            return
+
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = request.get("dimensions") or args.embedding_dimensions
+
+        time.sleep(self.config.latency(args.embedding_latency_ms, args.embedding_latency_p99_ms))
+        prompt_tokens = sum(estimate_tokens(text) for text in inputs)
+        self.config.count("embeddings.inputs", len(inputs))
+        self._send_json(200, {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embed(text, dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": request.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+        })
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Local OpenAI/Langfuse stand-in server')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8089, help='Port to listen on')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for latency/errors')
+    parser.add_argument('--chat-latency-ms', type=float, default=300, help='Median chat completion latency')
+    parser.add_argument('--chat-latency-p99-ms', type=float, default=1200, help='p99 chat completion latency')
+    parser.add_argument('--embedding-latency-ms', type=float, default=40, help='Median embedding latency')
+    parser.add_argument('--embedding-latency-p99-ms', type=float, default=150, help='p99 embedding latency')
+    parser.add_argument('--ingestion-latency-ms', type=float, default=5, help='Median Langfuse ingestion latency')
+    parser.add_argument('--ingestion-outage-seconds', type=float, default=0,
+                        help='Answer Langfuse ingestion with 503 for this long after startup')
+    parser.add_argument('--prompt-latency-ms', type=float, default=50, help='Median Langfuse prompt fetch latency')
+    parser.add_argument('--completion-tokens', type=int, default=60, help='Mean completion tokens')
+    parser.add_argument('--embedding-dimensions', type=int, default=1536, help='Embedding vector size')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of OpenAI requests that fail')
+    parser.add_argument('--rate-limit-share', type=float, default=0.5, help='Share of failures returned as 429')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    return parser
+
+
+def serve(args: argparse.Namespace) -> ThreadingHTTPServer:
+    """Create the server; call serve_forever() on the result to run it."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": StubConfig(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    args = build_parser().parse_args()
+    server = serve(args)
+
+    print(f"Stub server listening on http://{args.host}:{args.port}")
+    print(f"  OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    print(f"  LANGFUSE_HOST=http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStats: {json.dumps(dict(server.RequestHandlerClass.config.stats), indent=2)}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()